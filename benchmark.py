@@ -0,0 +1,382 @@
+try:
+    import argparse
+    import json
+    import logging
+    import os
+    import shutil
+    import sys
+    import tempfile
+    import time
+    import tracemalloc
+    import types
+    import random
+    import warnings
+    import pandas as pd
+    import main as checker
+    from utils.Common_Functions_64 import ExpandSeriesBatch, split_into_rows
+    from utils.program_parser import parse_programs
+    from utils.key_dictionary import KeyDictionary
+    from utils.designator_reconciler import DesignatorReconciler
+    from utils.placement_index import PlacementIndex
+    from utils.output_writer import write_output, output_formats
+    from utils.checker_job import load_job
+    from utils.run_metrics import RunMetrics
+    from utils.synthetic_data import SyntheticWorkspace
+    from utils.database import Database
+    from utils.name_matcher import NameMatcher
+    from utils.program_catalog import ProgramCatalog
+    from utils.program_parser import PP_NS, PP7_NS
+
+except ImportError as IE:
+    print(f"Import Error: {str(IE)}")
+    sys.exit(1)
+
+
+# Scale of the generated workspace per profile, small is about the size of the sample in this repo
+profiles = {
+    'small': {'boms': 2, 'components': 150, 'designators': 4, 'circuits': 4},
+    'medium': {'boms': 10, 'components': 300, 'designators': 4, 'circuits': 4},
+    'large': {'boms': 50, 'components': 400, 'designators': 5, 'circuits': 8},
+}
+
+path_baseline = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'benchmark_baseline.json')
+input_columns = ['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2']
+output_columns = input_columns + ['COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'CHEKCER']
+
+
+def get_args(argv=None):
+    '''Parse command line arguments, scale arguments override the profile'''
+    parser = argparse.ArgumentParser(description='Benchmark the PNP program checker on generated SAP reports and programs, offline')
+    parser.add_argument('--profile', choices=list(profiles), default='small', help='scale of the generated workspace (default small)')
+    parser.add_argument('--boms', type=int, default=None, help='number of BOMs, each with its MCTO and side 1/side 2 programs')
+    parser.add_argument('--components', type=int, default=None, help='components per BOM')
+    parser.add_argument('--designators', type=int, default=None, help='average designators per component')
+    parser.add_argument('--circuits', type=int, default=None, help='circuits per board, every designator is picked once per circuit')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the generated workspace')
+    parser.add_argument('--stages', choices=['all', 'pipeline', 'isolated', 'fetch', 'scan'], default='all', help='run the full main() pipeline, each major stage in isolation, the database fetch paths, or all of these; scan matches program file names in a large tree')
+    parser.add_argument('--db-latency', type=float, default=None, help='run the pipeline with SAP_SOURCE = db on a SQLite stand-in whose queries wait this many ms first, as a remote SAP database would')
+    parser.add_argument('--scan-files', type=int, default=50000, help='program files of the tree the scan stages match against (default 50000)')
+    parser.add_argument('--scan-selections', type=int, default=500, help='programs selected by the scan stages (default 500)')
+    parser.add_argument('--fetch-rows', type=int, default=200000, help='rows of the SQLite SAP_BOM_item table the fetch paths read (default 200000)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the fastest is reported (default 3)')
+    parser.add_argument('--workers', type=int, default=1, help='PARSE_WORKERS and REPORT_WORKERS of the pipeline and isolated parse/read (default 1)')
+    parser.add_argument('--output-format', choices=list(output_formats), default='excel', help='output format of the pipeline and isolated write (default excel)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the extra run with tracemalloc for peak memory')
+    parser.add_argument('--path', default=None, help='folder to generate the workspace in, kept afterwards (default a temporary folder)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline of this profile')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='flag stages slower or larger than baseline * tolerance (default 1.5)')
+    return parser.parse_args(argv)
+
+
+def run_pipeline(path, file_job, args, trace_memory):
+    '''Run main() on the generated workspace, return its RunMetrics stages'''
+    log = logging.getLogger('benchmark')
+    path_main = os.path.join(path, 'output')
+    os.makedirs(path_main, exist_ok=True)
+    metrics = RunMetrics(log, trace_memory=trace_memory)
+    checker_args = checker.get_args(['--no-cache', '--output-format', args.output_format])
+    metrics.start('Total')
+    checker.main(log, path_main, os.path.join(path, 'BOM_590'), os.path.join(path, 'MCTO'), os.path.join(path, 'PNP_PROGRAM'), file_job,
+                 input_columns, output_columns, args=checker_args, job=load_job(file_job), metrics=metrics)
+    metrics.stop('Total')
+    return metrics.stages
+
+
+class LatencyConnection:
+    '''sqlite3 connection whose cursors wait latency seconds before each query, as a round trip to a remote database would'''
+
+    def __init__(self, connection, latency: float):
+        self.connection = connection
+        self.latency = latency
+
+    def cursor(self):
+        cursor = self.connection.cursor()
+        latency = self.latency
+        class Cursor:
+            def __getattr__(self, name):
+                return getattr(cursor, name)
+            def execute(self, *args):
+                time.sleep(latency)
+                return cursor.execute(*args)
+        return Cursor()
+
+    def close(self):
+        self.connection.close()
+
+
+def use_sap_stand_in(path, workspace, latency_ms: float):
+    '''Point main()'s SAP database at a SQLite stand-in of the workspace, each query delayed by latency_ms'''
+    file = workspace.write_sap_db(os.path.join(path, 'sap.db'))
+    sys.modules['settings'] = types.SimpleNamespace(DB_TYPE='sqlite', DB_HOST='', DB_DATABASE=file, DB_USERNAME='', DB_PASSWORD='')
+    connect = Database.connect
+    def connect_with_latency(database):
+        connection, response = connect(database)
+        return (None if connection is None else LatencyConnection(connection, latency_ms / 1000)), response
+    Database.connect = connect_with_latency
+    return file
+
+
+def run_isolated(path, workspace, file_job, args, trace_memory):
+    '''Run each major stage on its own on inputs prepared from the workspace, return the RunMetrics stages'''
+    metrics = RunMetrics(logging.getLogger('benchmark'), trace_memory=trace_memory)
+
+    metrics.start('load_job')
+    job = load_job(file_job)
+    metrics.stop('load_job', rows_out=len(job.df_input))
+
+    files = sorted(os.path.join(folder, file) for folder, _, names in os.walk(os.path.join(path, 'PNP_PROGRAM')) for file in names)
+    metrics.start('parse_programs', rows_in=len(files))
+    picks = sum(len(action_items) for _, _, action_items in parse_programs(files, workers=args.workers))
+    metrics.stop('parse_programs', rows_out=picks)
+
+    files = sorted(os.path.join(path, 'BOM_590', file) for file in os.listdir(os.path.join(path, 'BOM_590')))
+    metrics.start('read_report_files', rows_in=len(files))
+    df_590 = checker.read_report_files(logging.getLogger('benchmark'), files, '590', ['BOM', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR'],
+                                       ('590', '550', '540', '542', '561', '562', 'ECN'), lambda *_: None, workers=args.workers)
+    metrics.stop('read_report_files', rows_out=len(df_590))
+
+    df_material = workspace.df_material.copy()
+    metrics.start('ExpandSeriesBatch', rows_in=len(df_material))
+    df_material['DESIGNATOR'] = ExpandSeriesBatch(df_material['DESIGNATOR'])
+    metrics.stop('ExpandSeriesBatch', rows_out=len(df_material))
+
+    metrics.start('split_into_rows', rows_in=len(df_material))
+    df_expanded = split_into_rows(df_material, column='DESIGNATOR')
+    metrics.stop('split_into_rows', rows_out=len(df_expanded))
+
+    # df_program as Algorithm 6 sees it: one row per program, component and designator with its boards and locations
+    df_program = workspace.df_placement.groupby(['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR'])['BOARD_NUMBER'].agg(','.join).reset_index()
+    df_program['LOCATION'] = 'Board: ' + df_program['BOARD_NUMBER'] + ', Machine: 1'
+    df_checker = df_material.assign(**{'REFDES_QTY': df_material['QUANTITY'], 'PROGRAM_QTY': df_material['QUANTITY'], 'SAP_QTY_TALLY?': 'Yes', 'PROGRAM_QTY_TALLY?': 'Yes'})
+    metrics.start('DesignatorReconciler', rows_in=len(df_checker))
+    df_checker = DesignatorReconciler(df_program).reconcile(df_checker, ['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?'])
+    metrics.stop('DesignatorReconciler', rows_out=len(df_checker))
+
+    # Program placements paired with the checker rows of their side, as Algorithm 7 probes them
+    df_context = pd.concat([job.df_input[input_columns].assign(PROGRAM_NAME=job.df_input[side]) for side in ('PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2')])
+    df_pairs = workspace.df_placement.drop_duplicates(['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR']).merge(df_context, on='PROGRAM_NAME')
+    keys = KeyDictionary()
+    keys.fit('PROGRAM', df_context['PROGRAM_NAME'])
+    keys.fit('COMPONENT', df_expanded['COMPONENT'], df_pairs['COMPONENT'])
+    keys.fit('DESIGNATOR', df_expanded['DESIGNATOR'], df_pairs['DESIGNATOR'])
+    for column in ('BOM', 'MCTO', 'PV'):
+        keys.fit(column, df_context[column])
+    key_columns = {'BOM': 'BOM', 'MCTO': 'MCTO', 'PV': 'PV', 'PNP_PROGRAM_SIDE1': 'PROGRAM', 'PNP_PROGRAM_SIDE2': 'PROGRAM', 'COMPONENT': 'COMPONENT', 'DESIGNATOR': 'DESIGNATOR'}
+    df_expanded = keys.encode(df_expanded, key_columns)
+    df_pairs = keys.encode(df_pairs, key_columns)
+    metrics.start('PlacementIndex', rows_in=len(df_expanded) + len(df_pairs))
+    found = PlacementIndex(df_expanded, list(key_columns)).contains(df_pairs)
+    metrics.stop('PlacementIndex', rows_out=int((~found).sum()))
+
+    metrics.start(f"write_output {args.output_format}", rows_in=len(workspace.df_placement))
+    write_output(os.path.join(path, 'ISOLATED_OUTPUT'), {'DETAIL': workspace.df_placement}, args.output_format)
+    metrics.stop(f"write_output {args.output_format}")
+
+    return metrics.stages
+
+
+def run_fetch(path, workspace, args, trace_memory):
+    '''Read a large SQLite SAP_BOM_item table through each Database fetch path, return the RunMetrics stages'''
+    metrics = RunMetrics(logging.getLogger('benchmark'), trace_memory=trace_memory)
+    file = os.path.join(path, 'sap_fetch.db')
+    if not os.path.exists(file):
+        # The workspace's item rows, doubled until there are fetch_rows of them
+        import sqlite3
+        workspace.write_sap_db(file)
+        connection = sqlite3.connect(file)
+        try:
+            while connection.execute('SELECT COUNT(*) FROM SAP_BOM_item').fetchone()[0] < args.fetch_rows:
+                connection.execute('INSERT INTO SAP_BOM_item SELECT * FROM SAP_BOM_item')
+            connection.commit()
+        finally:
+            connection.close()
+
+    database = Database(db_type='sqlite', db_host='', db_database=file, db_username='', db_password='')
+    connection, response = database.connect()
+    if connection is None:
+        raise ConnectionRefusedError(response)
+    query = 'SELECT * FROM SAP_BOM_item LIMIT ?'
+    data = (args.fetch_rows,)
+    try:
+        cursor = connection.cursor()
+        metrics.start('run_select_query dict rows')
+        rows = len(database.run_select_query(cursor, query, data))
+        metrics.stop('run_select_query dict rows', rows_out=rows)
+
+        metrics.start('run_select_query DataFrame')
+        rows = len(pd.DataFrame(database.run_select_query(cursor, query, data)))
+        metrics.stop('run_select_query DataFrame', rows_out=rows)
+
+        metrics.start('run_select_columns')
+        rows = len(next(iter(database.run_select_columns(cursor, query, data).values())))
+        metrics.stop('run_select_columns', rows_out=rows)
+
+        metrics.start('run_select_frame')
+        rows = len(database.run_select_frame(cursor, query, data))
+        metrics.stop('run_select_frame', rows_out=rows)
+
+        metrics.start('iter_select_query')
+        rows = sum(len(batch) for batch in database.iter_select_query(cursor, query, data))
+        metrics.stop('iter_select_query', rows_out=rows)
+        cursor.close()
+    finally:
+        connection.close()
+
+    return metrics.stages
+
+
+def run_scan(path, args, trace_memory):
+    '''
+    Match the selected programs against an archive of scan_files program files, by any() per name and by NameMatcher,
+    then resolve them by Board id from a program catalog built from scratch and from the catalog of the previous build
+    '''
+    metrics = RunMetrics(logging.getLogger('benchmark'), trace_memory=trace_memory)
+    rng = random.Random(args.seed)
+    names = sorted({f"{rng.randint(1000, 9999)}{rng.choice('ABCD')}{rng.choice('BC')}-{rng.choice(['PD0', 'SD0', 'PD1', 'SD1'])}-M{rng.randint(1, 9)}-{rng.choice(['IT', 'AX'])}"
+                    for _ in range(args.scan_files)})
+    path_scan = os.path.join(path, 'PNP_PROGRAM_ARCHIVE')
+    if not os.path.exists(path_scan):
+        # Archived revisions of each program spread over 100 folders
+        for i, name in enumerate(names):
+            folder = os.path.join(path_scan, f"{i % 100:03d}")
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f"{name}_REV{i % 3}.pp{'7' if i % 2 else ''}"), 'w') as f:
+                f.write(f'<Program xmlns="{PP7_NS if i % 2 else PP_NS}"><General positionInLine="1" cycleTime="{rng.randint(1000, 60000)}"/><Board id="{name}"/></Program>')
+    selected = set(rng.sample(names, min(args.scan_selections // 2, len(names))))
+    while len(selected) < args.scan_selections:
+        selected.add(f"{rng.randint(1000, 9999)}X-PD0-M1-IT")
+
+    def scan_any(folder):
+        for f in os.scandir(folder):
+            if f.is_file() and (f.name[-3:].lower() == '.pp' or f.name[-4:].lower() == '.pp7') and any(matcher in f.name for matcher in selected):
+                yield f.path
+            elif f.is_dir():
+                yield from scan_any(f.path)
+
+    metrics.start('scan any()', rows_in=len(names))
+    found_any = set(scan_any(path_scan))
+    metrics.stop('scan any()', rows_out=len(found_any))
+
+    metrics.start('scan NameMatcher', rows_in=len(names))
+    found = set(checker.scan_program_files(path_scan, NameMatcher(selected)))
+    metrics.stop('scan NameMatcher', rows_out=len(found))
+    if found != found_any:
+        raise AssertionError('NameMatcher matched other files than any()')
+
+    path_catalog = os.path.join(path, 'Cache_catalog')
+    shutil.rmtree(path_catalog, ignore_errors=True)
+    for stage in ('catalog cold', 'catalog warm'):
+        metrics.start(stage, rows_in=len(names))
+        catalog = ProgramCatalog(path_catalog, logging.getLogger('benchmark'))
+        catalog.refresh(path_scan)
+        resolved = set().union(*catalog.resolve(selected).values())
+        catalog.save()
+        metrics.stop(stage, rows_out=len(resolved))
+        if resolved != found:
+            raise AssertionError('Program catalog resolved other files than NameMatcher')
+    return metrics.stages
+
+
+def measure(run, args):
+    '''Fastest of args.repeat runs for the timings, plus one traced run for the peak memory, return {stage: result}'''
+    results = {}
+    for _ in range(max(args.repeat, 1)):
+        for name, stage in run(trace_memory=False).items():
+            if name not in results or stage['wall_s'] < results[name]['wall_s']:
+                results[name] = dict(stage)
+
+    if not args.no_memory:
+        for name, stage in run(trace_memory=True).items():
+            results[name]['peak_traced_mb'] = stage['peak_traced_mb']
+        tracemalloc.stop()
+
+    return {name: {key: value for key, value in stage.items() if key != 'stage'} for name, stage in results.items()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    '''Print results against baseline, return the list of regressed (group, stage, metric)'''
+    regressions = []
+    print(f"{'stage':<34}{'wall_s':>10}{'baseline':>10}{'ratio':>8}{'peak_mb':>10}{'baseline':>10}{'ratio':>8}")
+    for group, stages in results.items():
+        print(f"[{group}]")
+        for name, stage in stages.items():
+            base = baseline.get(group, {}).get(name, {})
+            cells = []
+            for metric, floor in (('wall_s', 0.05), ('peak_traced_mb', 1.0)):
+                value, base_value = stage.get(metric), base.get(metric)
+                ratio = value / base_value if value is not None and base_value else None
+                # Ignore tiny absolute differences, they are timer/allocator noise
+                if ratio is not None and ratio > tolerance and value - base_value > floor:
+                    regressions.append((group, name, metric))
+                cells.append(f"{'' if value is None else value:>10}{'' if base_value is None else base_value:>10}{'' if ratio is None else f'{ratio:.2f}':>8}")
+            flag = ' <-- regressed' if any(r[:2] == (group, name) for r in regressions) else ''
+            print(f"  {name:<32}{''.join(cells)}{flag}")
+    return regressions
+
+
+def main(args):
+    '''main'''
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+    scale = dict(profiles[args.profile])
+    for name in scale:
+        if getattr(args, name) is not None:
+            scale[name] = getattr(args, name)
+
+    path = args.path or tempfile.mkdtemp(prefix='pnp_benchmark_')
+    try:
+        start = time.perf_counter()
+        workspace = SyntheticWorkspace(seed=args.seed, **scale)
+        settings = {'PARSE_WORKERS': args.workers, 'REPORT_WORKERS': args.workers, 'OUTPUT_FORMAT': args.output_format}
+        if args.db_latency is not None:
+            use_sap_stand_in(path, workspace, args.db_latency)
+            settings.update({'SAP_SOURCE': 'db', 'DB_BATCH_SIZE': 1000})
+        file_job = workspace.write(path, settings=settings)
+        print(f"Generated {args.profile} workspace {scale} in {path} in {time.perf_counter() - start:.1f}s: "
+              f"{len(workspace.df_material)} BOM/MCTO rows, {len(workspace.df_placement)} placements")
+
+        results = {}
+        if args.stages in ('all', 'pipeline'):
+            results['pipeline'] = measure(lambda trace_memory: run_pipeline(path, file_job, args, trace_memory), args)
+            if args.db_latency is not None:
+                stages = results['pipeline']
+                print(f"SAP load {stages['SAP load']['wall_s']}s with {args.db_latency:g}ms query latency, Program parse {stages['Program parse']['wall_s']}s, "
+                      f"Total {stages['Total']['wall_s']}s")
+        if args.stages in ('all', 'isolated'):
+            results['isolated'] = measure(lambda trace_memory: run_isolated(path, workspace, file_job, args, trace_memory), args)
+        if args.stages == 'scan':
+            results['scan'] = measure(lambda trace_memory: run_scan(path, args, trace_memory), args)
+        if args.stages in ('all', 'fetch'):
+            results['fetch'] = measure(lambda trace_memory: run_fetch(path, workspace, args, trace_memory), args)
+    finally:
+        if args.path is None:
+            shutil.rmtree(path, ignore_errors=True)
+
+    baselines = {}
+    if os.path.exists(path_baseline):
+        with open(path_baseline, 'r', encoding='utf-8') as f:
+            baselines = json.load(f)
+
+    key = f"{args.profile}-{args.output_format}" + ('' if args.db_latency is None else f"-db{args.db_latency:g}ms")
+    baseline = baselines.get(key, {})
+    if baseline and baseline.get('scale') != scale:
+        print(f"Baseline {key} was recorded at scale {baseline.get('scale')}, not comparing")
+        baseline = {}
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        # Groups not run this time are kept from the stored baseline
+        baselines[key] = {**baseline, 'scale': scale, 'seed': args.seed, 'recorded': time.strftime('%Y-%m-%d'), 'python': sys.version.split()[0],
+                          **{group: {name: {metric: stage[metric] for metric in ('wall_s', 'peak_traced_mb')} for name, stage in stages.items()} for group, stages in results.items()}}
+        with open(path_baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved baseline {key} into {path_baseline}")
+    elif regressions:
+        print(f"{len(regressions)} stage metrics regressed more than {args.tolerance}x against baseline {key}")
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(get_args()))
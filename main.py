@@ -3,19 +3,35 @@ try:
     import os
     import sys
     import pandas as pd
-    import xml.etree.ElementTree as ETree
     import numpy as np
     import getpass
+    import argparse
+    import logging
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
     # import xlwings as xw
-    from utils.logger import logger_init
-    from utils.Common_Functions_64 import removeExtraDelimiter, ExpandSeries, digit_to_nondigit, split_into_rows, extract_num_from_end, string_remove_duplicate, flatten
+    from utils.logger import logger_init, Snapshot
+    from utils.Common_Functions_64 import removeExtraDelimiter, ExpandSeriesBatch, digit_to_nondigit, split_into_rows, extract_num_from_end, string_remove_duplicate
+    from utils.program_parser import parse_programs, RecordBuffer, feeder_columns, action_columns
+    from utils.program_cache import ProgramCache
+    from utils.key_dictionary import KeyDictionary
+    from utils.designator_reconciler import DesignatorReconciler
+    from utils.placement_index import PlacementIndex
+    from utils.output_writer import write_output, output_formats
+    from utils.checker_job import CheckerJob, load_job
+    from utils.run_metrics import RunMetrics
+    from utils.checker_shards import shard_rows
+    from utils.check_manifest import CheckManifest
+    from utils.warm_cache import WarmCache
+    from utils.folder_watcher import FolderWatcher
+    from utils.name_matcher import NameMatcher
+    from utils.program_catalog import ProgramCatalog
 
 except ImportError as IE:
     print(f"Import Error: {str(IE)}")
     time.sleep(5)
 
 
-def init():
+def init(args=None):
     '''init'''
 
     # Get path_main and transform into absolute path (so it works for onedrive path too)
@@ -31,641 +47,447 @@ def init():
     path_program = f"{path_main}\\PNP_PROGRAM"
     filename_checker = "CHECKER.xlsx"
     path_checker = f"{path_main}\\{filename_checker}"
+    if args is not None and args.job is not None:
+        path_checker = args.job
 
-    # Init logger
+    # Load checker job once, LOG_LEVEL is needed before the logger
+    # A job that fails to load is logged once the logger is up, init then returns job = None
+    job_start = time.perf_counter()
     try:
-        df_settings = pd.read_excel(path_checker, sheet_name='settings')
-        loglevel = list(df_settings['LOG_LEVEL'])[0]
-        loglevel_error = False 
-    except (ValueError, KeyError):
-        loglevel_error = True
-        loglevel = 'INFO'
+        job = load_job(path_checker)
+        job_error = None
+    except Exception as e:
+        job = None
+        job_error = e
+    job_seconds = time.perf_counter() - job_start
 
-    if loglevel_error:
-        log.warning('LOG_LEVEL is not defined in settings, setting to INFO...')
+    # Init logger
+    loglevel = 'INFO'
+    loglevel_error = False
+    if job is not None:
+        try:
+            loglevel = job.setting('LOG_LEVEL')
+        except (ValueError, KeyError):
+            loglevel_error = True
 
     log = logger_init('PNP_PROGRAM_CHECKER.log', f"{path_main}\\Log", 'w', loglevel)
     log.info(f"Running main.py in {path_main} with loglevel = {loglevel}")
+    if job_error is not None:
+        log.error(f"Failed to load checker job {path_checker}, {str(job_error)}", exc_info=job_error)
+    else:
+        log.info(f"Loaded checker job {path_checker} in {job_seconds:.3f}s")
+
+    if loglevel_error:
+        log.warning('LOG_LEVEL is not defined in settings, setting to INFO...')
 
     input_columns = ['BOM', 'MCTO', 'PV','PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2']
     output_columns = input_columns + ['COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'CHEKCER']
     log.info(f"input_columns = {input_columns}")
     log.info(f"output_columns = {output_columns}")
 
-    return log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns
-
-
-def main(log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns):
-    '''main'''
-
-    log.info(f"BOM_590 folder = {path_590}")
-    log.info(f"MCTO folder = {path_MCTO}")
-    log.info(f"program folder = {path_program}")
-    log.info(f"Checker file = {path_checker}")
-
+    return log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns, job
+
+
+def get_args(argv=None):
+    '''Parse command line arguments, anything not given falls back to the settings sheet'''
+    parser = argparse.ArgumentParser(description='Validate PNP programs against SAP BOM')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes to parse program files with, 0 = all cores (overrides PARSE_WORKERS in settings)')
+    parser.add_argument('--no-cache', action='store_true', help='parse every program file without using the program cache')
+    parser.add_argument('--clear-cache', action='store_true', help='invalidate the whole program cache, program catalog, check manifest and SAP snapshot before running')
+    parser.add_argument('--verify-cache', action='store_true', help='drop program cache entries that are unreadable or no longer match their file, check every program catalog entry')
+    parser.add_argument('--job', default=None, help='CHECKER.xlsx, or a .csv/.json job file with the CHECKER rows for headless runs (default CHECKER.xlsx next to main.py)')
+    parser.add_argument('--report-workers', type=int, default=None, help='number of processes to read BOM_590 and MCTO report files with, 0 = all cores (overrides REPORT_WORKERS in settings)')
+    parser.add_argument('--check-workers', type=int, default=None, help='number of processes to run the checking algorithms with, sharding the job by BOM and program, 0 = all cores (overrides CHECK_WORKERS in settings)')
+    parser.add_argument('--incremental', action='store_true', help='recheck only the CHECKER rows whose input files or SAP data changed since the last incremental run (overrides INCREMENTAL in settings)')
+    parser.add_argument('--watch', action='store_true', help='keep running, recheck the affected CHECKER rows whenever files land in BOM_590, MCTO, PNP_PROGRAM or the checker job changes')
+    parser.add_argument('--output-format', choices=list(output_formats), default=None, help='format of SCRIPT_OUTPUT and SCRIPT_OUTPUT_PROGRAM (overrides OUTPUT_FORMAT in settings, default excel)')
+    parser.add_argument('--refresh-sap', action='store_true', help='query every selected BOM/MCTO from the SAP database, ignoring SAP_SNAPSHOT_TTL')
+    parser.add_argument('--offline', action='store_true', help='serve the SAP data from the local SAP snapshot without connecting to the database (overrides SAP_OFFLINE in settings)')
+    return parser.parse_args(argv)
+
+
+def metrics_trace_memory(job, log):
+    '''METRICS_TRACE_MEMORY from settings, peak memory of each stage is traced only if it is Y as tracing slows the run down'''
     try:
-        df_settings = pd.read_excel(path_checker, sheet_name='settings')
-        SAP_SOURCE = list(df_settings['SAP_SOURCE'])[0]
+        trace_memory = job.setting('METRICS_TRACE_MEMORY').strip().upper() in ('Y', 'YES', 'TRUE', '1')
     except (ValueError, KeyError):
-        log.warning('SAP_SOURCE is not defined in settings, setting to manual...')
-        SAP_SOURCE = 'manual'
+        log.debug('METRICS_TRACE_MEMORY is not defined in settings, setting to N...')
+        trace_memory = False
+    log.info(f"METRICS_TRACE_MEMORY = {'Y' if trace_memory else 'N'}")
+    return trace_memory
 
-    log.info(f"SAP_SOURCE = {SAP_SOURCE}")
 
-    exclude_comp_prefix = ('590', '550', '540', '542', '561', '562', 'ECN')
+def get_output_format(log, job, args):
+    '''Format of SCRIPT_OUTPUT and SCRIPT_OUTPUT_PROGRAM: --output-format, else OUTPUT_FORMAT from settings, excel if pyarrow is missing for parquet/feather'''
+    output_format = args.output_format
+    if output_format is None:
+        try:
+            output_format = job.setting('OUTPUT_FORMAT').strip().lower()
+        except KeyError:
+            log.debug('OUTPUT_FORMAT is not defined in settings, setting to excel...')
+            output_format = 'excel'
+        if output_format not in output_formats:
+            log.warning(f"OUTPUT_FORMAT {output_format} is not one of {', '.join(output_formats)}, setting to excel...")
+            output_format = 'excel'
+
+    if output_format in ('parquet', 'feather'):
+        try:
+            import pyarrow
+        except ImportError as IE:
+            log.warning(f"OUTPUT_FORMAT {output_format} needs pyarrow, setting to excel, {str(IE)}")
+            output_format = 'excel'
+
+    log.info(f"OUTPUT_FORMAT = {output_format}")
+    return output_format
+
+
+def read_590_file(log, file, bom_columns, exclude_comp_prefix, snapshot):
+    '''Read a BOM_590 report into rows of bom_columns with expanded designators, None if its designators cannot be expanded'''
+    log.info(f"Reading: {file}...")
+    df = pd.read_csv(file, sep='\t', skiprows=9, usecols=[1,3,5,10], skip_blank_lines=True, skipinitialspace=True, on_bad_lines='warn')
+    df.columns = df.columns.str.strip()
+    snapshot(df, 'df')
+
+    log.debug('Renaming columns...')
+    df = df.rename(columns={'Object no.':'COMPONENT', 'Quantity':'QUANTITY', 'Material Description':'COMPDESC', 'Reference Designator':'DESIGNATOR'})
+    snapshot(df, 'df')
+
+    log.debug('Create BOM column with component starting with 590...')
+    df['BOM'] = np.where(df['COMPONENT'].str.startswith('590'), df['COMPONENT'], np.NaN)
+    snapshot(df, 'df')
+
+    log.debug('Trimming all bom columns...')
+    df = df[bom_columns]
+    for input_column in bom_columns:
+        df[input_column] = df[input_column].astype(str)
+        df[input_column] = df[input_column].str.strip().str.upper().str.lstrip('0')
+    df = df.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
+    snapshot(df, 'df')
+
+    log.debug('Front-filling BOM...')
+    df['BOM'].ffill(inplace=True)
+    snapshot(df, 'df')
+
+    log.debug('Removing rows with null designator...')
+    df = df[~df.DESIGNATOR.isnull()]
+    snapshot(df, 'df')
+
+    log.debug('Front-filling...')
+    df.ffill(inplace=True)
+    snapshot(df, 'df')
+
+    log.debug(f"Removing rows with comp_prefix = {exclude_comp_prefix}...")
+    df = df[~df.COMPONENT.str.startswith(exclude_comp_prefix)]
+    snapshot(df, 'df')
+
+    log.debug('Removing rows with comp_prefox = 511 and compdesc contains TH AE or THAE...')
+    df = df[~(df.COMPONENT.str.startswith('511') & (df.COMPDESC.str.contains('TH AE') | df.COMPDESC.str.contains('THAE')))]
+    snapshot(df, 'df')
+
+    log.debug('Converting quantity string into int...')
+    df['QUANTITY'] = df['QUANTITY'].replace([','], ['.'], regex=True)
+    df['QUANTITY'] = df['QUANTITY'].str.split('.').str[0].str.strip()
+    df['QUANTITY'] = df['QUANTITY'].fillna('0').astype(int)
+    snapshot(df, 'df')
+
+    log.debug('Grouping designator...')
+    df = df.groupby(['BOM', 'COMPONENT', 'COMPDESC', 'QUANTITY'])['DESIGNATOR'].apply(','.join).reset_index()
+    snapshot(df, 'df')
+
+    log.debug('Removing extra delimiter from designator...')
+    df['DESIGNATOR'] = df['DESIGNATOR'].apply(removeExtraDelimiter)
+    snapshot(df, 'df')
+
+    log.debug('Expanding designator series...')
+    df['DESIGNATOR'] = ExpandSeriesBatch(df['DESIGNATOR']).str.replace(' ', '')
+    snapshot(df, 'df')
+
+    if df['DESIGNATOR'].str.contains('-').any():
+        log.warning(f"Designators are not expanded, skipping {file}...")
+        return None
 
-    # Read main excel workbook
-    log.info('Reading checker file...')
-    # try:
-    #     # the excel file is not opened
-    #     workbook = xw.Book(path_checker)
-    # except:
-    #     # the excel file is opened
-    #     workbook = xw.Book(filename_checker)
-    # inputSheet = workbook.sheets['PNP_PROGRAM_CHECKER_INPUT'].used_range.value
+    log.debug('Dropping duplicates...')
+    df.drop_duplicates(subset=['BOM', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR'], keep='last', inplace=True)
+    snapshot(df, 'df')
+    return df
 
-    # Create df_input for input sheet
-    log.info('Creating dataframe for input sheet...')
-    # df_input = pd.DataFrame(inputSheet)
-    df_input = pd.read_excel(path_checker, sheet_name='CHECKER')
 
-    # log.debug('Transposing df_input, keep 1st 4 rows and retransposing...')
-    # df_input = df_input.T.head(4).T
+def read_MCTO_file(log, file, mcto_columns, exclude_comp_prefix, snapshot):
+    '''Read an MCTO report into rows of mcto_columns with expanded designators, PV from the _<PV> filename suffix, None if its designators cannot be expanded'''
+    filename = file.rsplit('\\', 1)[-1]
+    filename_without_ext = filename.rsplit('.', 1)[0]
+    try:
+        PV = filename_without_ext.rsplit('_', 1)[1]
+    except IndexError:
+        PV = '1'
+
+    log.info(f"Reading: {file}...")
+    df = pd.read_csv(file, sep='\t', skiprows=9, usecols=[1,4,6,11], skip_blank_lines=True, skipinitialspace=True, on_bad_lines='warn')
+    df.columns = df.columns.str.strip()
+    snapshot(df, 'df')
+
+    log.debug('Renaming columns...')
+    df = df.rename(columns={'Object no.':'COMPONENT', 'Quantity':'QUANTITY', 'Material Description':'COMPDESC', 'Reference Designator':'DESIGNATOR'})
+    snapshot(df, 'df')
+
+    log.debug('Create MCTO column with component not null and compdesc, quantity, designator are null...')
+    df['MCTO'] = np.where(~(df['COMPONENT'].isna()) & (df['COMPDESC'].isnull()) & (df['QUANTITY'].isnull()) & (df['DESIGNATOR'].isnull()), df['COMPONENT'], np.NaN)
+    snapshot(df, 'df')
+
+    log.debug('Adding PV columns...')
+    df['PV'] = PV
+    snapshot(df, 'df')
+
+    log.debug('Trimming all mcto columns...')
+    df = df[mcto_columns]
+    for input_column in mcto_columns:
+        df[input_column] = df[input_column].astype(str)
+        df[input_column] = df[input_column].str.strip().str.upper().str.lstrip('0')
+    df = df.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
+    snapshot(df, 'df')
+
+    log.debug('Front-filling MCTO...')
+    df['MCTO'].ffill(inplace=True)
+    snapshot(df, 'df')
+
+    log.debug('Removing rows with null designator...')
+    df = df[~df.DESIGNATOR.isnull()]
+    snapshot(df, 'df')
+
+    log.debug('Front-filling...')
+    df.ffill(inplace=True)
+    snapshot(df, 'df')
+
+    log.debug(f"Removing rows with comp_prefix = {exclude_comp_prefix}...")
+    df = df[~df.COMPONENT.str.startswith(exclude_comp_prefix)]
+    snapshot(df, 'df')
+
+    log.debug('Converting quantity string into int...')
+    df['QUANTITY'] = df['QUANTITY'].replace([','], ['.'], regex=True)
+    df['QUANTITY'] = df['QUANTITY'].str.split('.').str[0].str.strip()
+    df['QUANTITY'] = df['QUANTITY'].fillna('0').astype(int)
+    snapshot(df, 'df')
+
+    log.debug('Grouping designator...')
+    df = df.groupby(['MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY'])['DESIGNATOR'].apply(','.join).reset_index()
+    snapshot(df, 'df')
+
+    log.debug('Removing extra delimiter from designator...')
+    df['DESIGNATOR'] = df['DESIGNATOR'].apply(removeExtraDelimiter)
+    snapshot(df, 'df')
+
+    log.debug('Expanding designator series...')
+    df['DESIGNATOR'] = ExpandSeriesBatch(df['DESIGNATOR']).str.replace(' ', '')
+    snapshot(df, 'df')
+
+    if df['DESIGNATOR'].str.contains('-').any():
+        log.warning(f"Designators are not expanded, skipping {file}...")
+        return None
 
-    # df_input.columns = df_input.iloc[0]
-    # log.debug('Stripping off 1st header row...')
-    # df_input = df_input[1:]
+    log.debug('Dropping duplicates...')
+    df.drop_duplicates(subset=['MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR'], keep='last', inplace=True)
+    snapshot(df, 'df')
+    return df
+
+
+def scan_program_files(path, matcher):
+    '''Yield the .pp/.pp7 files under path, subfolders included, whose name matches matcher (NameMatcher)'''
+    for f in os.scandir(path):
+        if f.is_file() and (f.name[-3:].lower() == '.pp' or f.name[-4:].lower() == '.pp7') and matcher.search(f.name):
+            yield f.path
+        elif f.is_dir():
+            yield from scan_program_files(f.path, matcher)
+
+
+def read_report_file(kind, file, columns, exclude_comp_prefix):
+    '''Process pool worker of read_report_files, reads one report without snapshots, logging warnings only'''
+    log = logging.getLogger('logger.report')
+    log.setLevel(logging.WARNING)
+    read = read_590_file if kind == '590' else read_MCTO_file
+    return read(log, file, columns, exclude_comp_prefix, Snapshot(log, names=set()))
+
+
+def read_report_files(log, files, kind, columns, exclude_comp_prefix, snapshot, workers=1, warm=None):
+    '''
+    Read the BOM_590 (kind 590) or MCTO report files into one DataFrame of columns, concatenated once in the order of the sorted files
+    Files are read in a process pool when workers > 1, workers = 0 uses all cores. Files unchanged since the last run of watch
+    mode are taken from warm. Returns an empty DataFrame without columns if no file could be read
+    '''
+    files = sorted(files)
+    frames = {}
+    if warm is not None:
+        for file in files:
+            found, df = warm.cached_frame(file)
+            if found:
+                frames[file] = df
+    to_read = [file for file in files if file not in frames]
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(to_read) <= 1:
+        read = read_590_file if kind == '590' else read_MCTO_file
+        results = ((file, read(log, file, columns, exclude_comp_prefix, snapshot)) for file in to_read)
+        for file, df in results:
+            frames[file] = df if warm is None else warm.store_frame(file, df)
+    else:
+        log.info(f"Reading {str(len(to_read))} {kind} files in {str(min(workers, len(to_read)))} processes...")
+        with ProcessPoolExecutor(max_workers=min(workers, len(to_read))) as executor:
+            results = zip(to_read, executor.map(read_report_file, [kind] * len(to_read), to_read, [columns] * len(to_read), [exclude_comp_prefix] * len(to_read)))
+            for file, df in results:
+                frames[file] = df if warm is None else warm.store_frame(file, df)
 
-    log.debug('Trimming all input columns...')
-    for input_column in input_columns:
-        df_input[input_column] = df_input[input_column].astype(str)
-        df_input[input_column] = df_input[input_column].str.strip().str.upper().str.lstrip('0')
-    df_input = df_input.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
-    log.debug(f"\n{df_input.head(5).to_string(index=False)}")
+    frames = [frames[file] for file in files if frames[file] is not None]
+    if len(frames) < 1:
+        return pd.DataFrame()
+    log.debug(f"Concating {str(len(frames))} {kind} files...")
+    return pd.concat(frames, ignore_index=True)
 
-    log.debug('Dropping null rows...')
-    df_input.dropna(how='any', subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1'], inplace=True)
-    log.debug(f"\n{df_input.head(5).to_string(index=False)}")
 
-    if len(df_input) < 1:
-        raise ConnectionAbortedError ('There is no input to be processed, force exiting application...')
+def read_sap_query(log, database, name, query, values, key, loader_options, **names):
+    '''Return the rows of a SAP query as read by a SapLoader with its own connection, closed once done'''
+    from utils.sap_loader import SapLoader
 
-    log.debug('Dropping duplicates...')    
-    df_input.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2'], keep='first', inplace=True)
-    log.debug(f"\n{df_input.head(5).to_string(index=False)}")
-
-    log.debug('Removing duplicates of selected 590, MCTO, program...')
-    selected_590 = set(df_input['BOM'])
-    selected_MCTO = set(df_input['MCTO'])
+    loader = SapLoader(database, log, **loader_options)
     try:
-        selected_program = (set(df_input['PNP_PROGRAM_SIDE1']).union(set(df_input['PNP_PROGRAM_SIDE2']))).remove('')
-    except KeyError:
-        selected_program = (set(df_input['PNP_PROGRAM_SIDE1']).union(set(df_input['PNP_PROGRAM_SIDE2'])))
+        return loader.read(name, query, values, key=key, **names)
+    finally:
+        loader.close()
 
-    # log.debug('Hardcoding selected files...')
-    # selected_590 = {'590-624664'}
-    # selected_MCTO = {'705043'}
-    # selected_program = {'3440CB-PD0-M5-IT', '3440CB-SD0-M5-IT'}
 
-    log.info(f"Selected_590 = {selected_590}")
-    log.info(f"Selected_MCTO = {selected_MCTO}")
-    log.info(f"Selected_program = {selected_program}")
+def normalize_sap_rows(log, df, columns, exclude_comp_prefix, snapshot, name):
+    '''Trim, filter and expand the designators of the rows of a SAP query into rows of columns, as the BOM_590/MCTO reports are read'''
+    log.debug(f"Trimming all {name} columns...")
+    df = df[columns]
+    for input_column in columns:
+        df[input_column] = df[input_column].astype(str)
+        df[input_column] = df[input_column].str.strip().str.upper().str.lstrip('0')
+    df = df.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
+    snapshot(df, name)
 
-    bom_columns = ['BOM', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR']
-    mcto_columns = ['MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR']
+    log.debug('Dropping null rows...')
+    df.dropna(how='any', subset=columns, inplace=True)
+    snapshot(df, name)
 
-    if SAP_SOURCE == 'manual':
+    log.debug(f"Removing rows with comp_prefix = {exclude_comp_prefix}...")
+    df = df[~df.COMPONENT.str.startswith(exclude_comp_prefix)]
+    snapshot(df, name)
 
-        # Scan for the selected files only to save resources
-        log.info('Scanning files_590 and files_MCTO...')
-        scan_files_590 = os.scandir(path_590)
-        scan_files_MCTO = os.scandir(path_MCTO)
+    if 'BOM' in columns:
+        log.debug('Removing rows with comp_prefix = 511 and compdesc contains TH AE or THAE...')
+        df = df[~(df.COMPONENT.str.startswith('511') & (df.COMPDESC.str.contains('TH AE') | df.COMPDESC.str.contains('THAE')))]
+        snapshot(df, name)
 
-        file_590 = {f.path for f in scan_files_590 if f.name[-4:].lower() == '.csv' and any (matcher in f.name for matcher in selected_590)}
-        file_MCTO = {f.path for f in scan_files_MCTO if f.name[-4:].lower() == '.csv' and any (matcher in f.name for matcher in selected_MCTO)}
+    log.debug('Expanding designator series...')
+    df['DESIGNATOR'] = ExpandSeriesBatch(df['DESIGNATOR']).str.replace(' ', '')
 
-        log.info(f"Matched file_590 = {file_590}")
-        log.info(f"Matched file_MCTO = {file_MCTO}")
+    if df['DESIGNATOR'].str.contains('-').any():
+        raise ConnectionAbortedError ('Designators are not expanded, force exiting application...')
 
-        # Continue only if at least one 590,MCTO file is found
-        if len(file_590) < 1 and len(file_590) < 1:
-            df_checker_all = pd.DataFrame(columns=output_columns)
-            df_checker_all.to_excel(f"{path_main}\\SCRIPT_OUTPUT.xksx", sheet_name='OUTPUT', index=False)
-            raise ConnectionAbortedError ('There is no selected 590 or MCTO file found, force exiting application...')
+    snapshot(df, name)
+    log.info(f"Total of {str(len(df))} rows detected in {name}.")
+    return df
 
-        # Combine all files_590
-        log.info(f"Starting to read {str(len(file_590))} BOM_590 files...")
-        df_590 = pd.DataFrame()
-        for file in file_590:
-            log.info(f"Reading: {file}...")
-            df = pd.read_csv(file, sep='\t', skiprows=9, usecols=[1,3,5,10], skip_blank_lines=True, skipinitialspace=True, on_bad_lines='warn')
-            df.columns = df.columns.str.strip()
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Renaming columns...')
-            df = df.rename(columns={'Object no.':'COMPONENT', 'Quantity':'QUANTITY', 'Material Description':'COMPDESC', 'Reference Designator':'DESIGNATOR'})
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Create BOM column with component starting with 590...')
-            df['BOM'] = np.where(df['COMPONENT'].str.startswith('590'), df['COMPONENT'], np.NaN)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Trimming all bom columns...')
-            df = df[bom_columns]
-            for input_column in bom_columns:
-                df[input_column] = df[input_column].astype(str)
-                df[input_column] = df[input_column].str.strip().str.upper().str.lstrip('0')
-            df = df.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Front-filling BOM...')
-            df['BOM'].ffill(inplace=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Removing rows with null designator...')
-            df = df[~df.DESIGNATOR.isnull()]
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Front-filling...')
-            df.ffill(inplace=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug(f"Removing rows with comp_prefix = {exclude_comp_prefix}...")
-            df = df[~df.COMPONENT.str.startswith(exclude_comp_prefix)]
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Removing rows with comp_prefox = 511 and compdesc contains TH AE or THAE...')
-            df = df[~(df.COMPONENT.str.startswith('511') & (df.COMPDESC.str.contains('TH AE') | df.COMPDESC.str.contains('THAE')))]
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Converting quantity string into int...')
-            df['QUANTITY'] = df['QUANTITY'].replace([','], ['.'], regex=True)
-            df['QUANTITY'] = df['QUANTITY'].str.split('.').str[0].str.strip()
-            df['QUANTITY'] = df['QUANTITY'].fillna('0').astype(int)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Grouping designator...')
-            df = df.groupby(['BOM', 'COMPONENT', 'COMPDESC', 'QUANTITY'])['DESIGNATOR'].apply(','.join).reset_index()
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Removing extra delimiter from designator...')
-            df['DESIGNATOR'] = df['DESIGNATOR'].apply(removeExtraDelimiter)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Expanding designator series...')
-            df['DESIGNATOR'] = df['DESIGNATOR'].apply(ExpandSeries).str.replace(' ', '')
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            if df['DESIGNATOR'].str.contains('-').any():
-                log.warning(f"Designators are not expanded, skipping {file}...")
-                continue
-
-            log.debug('Dropping duplicates...')
-            df.drop_duplicates(subset=['BOM', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR'], keep='last', inplace=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug(f"Concating {str(len(df))} rows into df_590...")
-            df_590 = pd.concat([df_590, df], ignore_index=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-        log.info(f"Total of {str(len(df_590))} rows detected in BOM_590 files.")
 
-        # Combine all MCTO files
-        log.info(f"Starting to read {str(len(file_MCTO))} MCTO files...")
-        df_MCTO = pd.DataFrame()
-        for file in file_MCTO:
-            filename = file.rsplit('\\', 1)[-1]
-            filename_without_ext = filename.rsplit('.', 1)[0]
+def wait_sap_queries(log, sap_queries, bom_columns, mcto_columns, exclude_comp_prefix, snapshot):
+    '''Wait for the query_BOM_590 and query_MCTO futures, return their normalized (df_590, df_MCTO)'''
+    frames = []
+    try:
+        for name, columns, frame_name in (('query_BOM_590', bom_columns, 'df_590'), ('query_MCTO', mcto_columns, 'df_MCTO')):
             try:
-                PV = filename_without_ext.rsplit('_', 1)[1]
-            except IndexError:
-                PV = '1'
-
-            log.info(f"Reading: {file}...")
-            df = pd.read_csv(file, sep='\t', skiprows=9, usecols=[1,4,6,11], skip_blank_lines=True, skipinitialspace=True, on_bad_lines='warn')
-            df.columns = df.columns.str.strip()
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Renaming columns...')
-            df = df.rename(columns={'Object no.':'COMPONENT', 'Quantity':'QUANTITY', 'Material Description':'COMPDESC', 'Reference Designator':'DESIGNATOR'})
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Create MCTO column with component not null and compdesc, quantity, designator are null...')
-            df['MCTO'] = np.where(~(df['COMPONENT'].isna()) & (df['COMPDESC'].isnull()) & (df['QUANTITY'].isnull()) & (df['DESIGNATOR'].isnull()), df['COMPONENT'], np.NaN)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Adding PV columns...')
-            df['PV'] = PV
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Trimming all mcto columns...')
-            df = df[mcto_columns]
-            for input_column in mcto_columns:
-                df[input_column] = df[input_column].astype(str)
-                df[input_column] = df[input_column].str.strip().str.upper().str.lstrip('0')
-            df = df.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Front-filling MCTO...')
-            df['MCTO'].ffill(inplace=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Removing rows with null designator...')
-            df = df[~df.DESIGNATOR.isnull()]
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Front-filling...')
-            df.ffill(inplace=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug(f"Removing rows with comp_prefix = {exclude_comp_prefix}...")
-            df = df[~df.COMPONENT.str.startswith(exclude_comp_prefix)]
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Converting quantity string into int...')
-            df['QUANTITY'] = df['QUANTITY'].replace([','], ['.'], regex=True)
-            df['QUANTITY'] = df['QUANTITY'].str.split('.').str[0].str.strip()
-            df['QUANTITY'] = df['QUANTITY'].fillna('0').astype(int)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Grouping designator...')
-            df = df.groupby(['MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY'])['DESIGNATOR'].apply(','.join).reset_index()
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Removing extra delimiter from designator...')
-            df['DESIGNATOR'] = df['DESIGNATOR'].apply(removeExtraDelimiter)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug('Expanding designator series...')
-            df['DESIGNATOR'] = df['DESIGNATOR'].apply(ExpandSeries).str.replace(' ', '')
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            if df['DESIGNATOR'].str.contains('-').any():
-                log.warning(f"Designators are not expanded, skipping {file}...")
-                continue
-
-            log.debug('Dropping duplicates...')
-            df.drop_duplicates(subset=['MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR'], keep='last', inplace=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-
-            log.debug(f"Concating {str(len(df))} rows into df_MCTO...")
-            df_MCTO = pd.concat([df_MCTO, df], ignore_index=True)
-            log.debug(f"\n{df.head(5).to_string(index=False)}")
-        log.info(f"Total of {str(len(df_MCTO))} rows detected in MCTO files.")
-
-    else:
-        log.info('Loading SAP database...')
-        from settings import DB_TYPE, DB_HOST, DB_DATABASE, DB_USERNAME, DB_PASSWORD
-        from utils.database import Database
-
-        # Init database
-        database = Database(
-            db_type = DB_TYPE,
-            db_host = DB_HOST,
-            db_database = DB_DATABASE,
-            db_username = DB_USERNAME,
-            db_password = DB_PASSWORD
-        )
-        connection, conn_response = database.connect()
-
-        if connection is None:
-            raise ConnectionRefusedError(conn_response)
-        
-        log.info(conn_response)
-        
-        log.info('Running query_BOM_590...')
-        query_BOM_590 = '''
-                    SELECT bh.SAP_mat_no as BOM, 
-                        bi.compnt_no as COMPONENT, bi.compnt_desc as COMPDESC, 
-                        CASE
-                            WHEN CAST(bi.compnt_qty as INT) >= 1000 THEN CAST(CAST(bi.compnt_qty as INT)/1000 as INT)
-                            ELSE CAST(bi.compnt_qty as INT)
-                        END as QUANTITY, 
-                        bi.item_text as DESIGNATOR
-                    FROM [SAP_PP].[dbo].[SAP_BOM_item] bi
-                    inner join [SAP_PP].[dbo].[SAP_BOM_header] bh on bi.BOM_no = bh.BOM_no
-                    where bh.SAP_mat_no in ({0});
-                '''
-        query_BOM_590 = query_BOM_590.format(','.join('?' * len(selected_590)))
-        params_BOM_590 = tuple(flatten(selected_590))
+                df = sap_queries.pop(name).result()
+            except ConnectionRefusedError:
+                raise
+            except Exception:
+                log.exception(f"{name} failed")
+                raise ConnectionAbortedError (f"Failed to run {name}, force exiting application...")
+            log.info(f"Total of {str(len(df))} rows detected in {name}.")
+            frames.append(normalize_sap_rows(log, df, columns, exclude_comp_prefix, snapshot, frame_name))
+    finally:
+        # The query not waited for yet is not left running when one fails
+        drain_sap_queries(log, sap_queries)
+    return frames
+
+
+def drain_sap_queries(log, sap_queries):
+    '''Cancel the SAP query futures not started yet and wait for the running ones, so their connections are closed, logging their errors'''
+    for future in sap_queries.values():
+        future.cancel()
+    for name, future in sap_queries.items():
+        if future.cancelled():
+            continue
         try:
-            df_590 = pd.read_sql(sql=query_BOM_590, con=connection, params=params_BOM_590)
-        except Exception:
-            raise ConnectionAbortedError ('Failed to run query_BOM_590, force exiting application...')
-        log.info(f"Total of {str(len(df_590))} rows detected in query_BOM_590.")
-
-        log.debug('Trimming all bom columns...')
-        df_590 = df_590[bom_columns]
-        for input_column in bom_columns:
-            df_590[input_column] = df_590[input_column].astype(str)
-            df_590[input_column] = df_590[input_column].str.strip().str.upper().str.lstrip('0')
-        df_590 = df_590.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
-        log.debug(f"\n{df_590.head(5).to_string(index=False)}")
-
-        log.debug('Dropping null rows...')
-        df_590.dropna(how='any', subset=bom_columns, inplace=True)
-        log.debug(f"\n{df_590.head(5).to_string(index=False)}")
-
-        log.debug(f"Removing rows with comp_prefix = {exclude_comp_prefix}...")
-        df_590 = df_590[~df_590.COMPONENT.str.startswith(exclude_comp_prefix)]
-        log.debug(f"\n{df_590.head(5).to_string(index=False)}")
-
-        log.debug('Removing rows with comp_prefix = 511 and compdesc contains TH AE or THAE...')
-        df_590 = df_590[~(df_590.COMPONENT.str.startswith('511') & (df_590.COMPDESC.str.contains('TH AE') | df_590.COMPDESC.str.contains('THAE')))]
-        log.debug(f"\n{df_590.head(5).to_string(index=False)}")
-
-        log.debug('Expanding designator series...')
-        df_590['DESIGNATOR'] = df_590['DESIGNATOR'].apply(ExpandSeries).str.replace(' ', '')
+            future.result()
+        except Exception as e:
+            log.warning(f"{name} failed after the run stopped waiting for it, {str(e)}")
+    sap_queries.clear()
 
-        if df_590['DESIGNATOR'].str.contains('-').any():
-            raise ConnectionAbortedError ('Designators are not expanded, force exiting application...')
 
-        log.debug(f"\n{df_590.head(5).to_string(index=False)}")
-        log.info(f"Total of {str(len(df_590))} rows detected in df_590.")
-
-        log.info('Running query_MCTO...')
-        query_MCTO = '''
-                    SELECT REPLACE(bh.SAP_mat_no, '000000000000', '') as MCTO, bi.alt_BOM_type as PV,
-                        bi.compnt_no as COMPONENT, bi.compnt_desc as COMPDESC, 
-                        CASE
-                            WHEN CAST(bi.compnt_qty as INT) >= 1000 THEN CAST(CAST(bi.compnt_qty as INT)/1000 as INT)
-                            ELSE CAST(bi.compnt_qty as INT)
-                        END as QUANTITY, 
-                        bi.item_text as DESIGNATOR
-                    FROM [SAP_PP].[dbo].[SAP_BOM_item] bi
-                    inner join [SAP_PP].[dbo].[SAP_BOM_header] bh on bi.BOM_no = bh.BOM_no and bi.alt_BOM_type = bh.alt_BOM_type
-                    where REPLACE(bh.SAP_mat_no, '000000000000', '') in ({0});
-                '''
-        query_MCTO = query_MCTO.format(','.join('?' * len(selected_MCTO)))
-        params_MCTO = tuple(flatten(selected_MCTO))
-        try:
-            df_MCTO = pd.read_sql(sql=query_MCTO, con=connection, params=params_MCTO)
-        except Exception:
-            raise ConnectionAbortedError ('Failed to run query_MCTO, force exiting application...')
-        log.info(f"Total of {str(len(df_MCTO))} rows detected in query_MCTO.")
-
-        log.debug('Trimming all mcto columns...')
-        df_MCTO = df_MCTO[mcto_columns]
-        for input_column in mcto_columns:
-            df_MCTO[input_column] = df_MCTO[input_column].astype(str)
-            df_MCTO[input_column] = df_MCTO[input_column].str.strip().str.upper().str.lstrip('0')
-        df_MCTO = df_MCTO.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
-        log.debug(f"\n{df_MCTO.head(5).to_string(index=False)}")
-
-        log.debug('Dropping null rows...')
-        df_MCTO.dropna(how='any', subset=mcto_columns, inplace=True)
-        log.debug(f"\n{df_MCTO.head(5).to_string(index=False)}")
-
-        log.debug(f"Removing rows with comp_prefix = {exclude_comp_prefix}...")
-        df_MCTO = df_MCTO[~df_MCTO.COMPONENT.str.startswith(exclude_comp_prefix)]
-        log.debug(f"\n{df_MCTO.head(5).to_string(index=False)}")
-
-        log.debug('Expanding designator series...')
-        df_MCTO['DESIGNATOR'] = df_MCTO['DESIGNATOR'].apply(ExpandSeries).str.replace(' ', '')
-
-        if df_MCTO['DESIGNATOR'].str.contains('-').any():
-            raise ConnectionAbortedError ('Designators are not expanded, force exiting application...')
-        
-        log.debug(f"\n{df_MCTO.head(5).to_string(index=False)}")
-        log.info(f"Total of {str(len(df_MCTO))} rows detected in query_MCTO.")
-
-        if connection is not None:
-            connection.close()
-
-    # Recursively call scandir inclusive of subfolders for filename matching
-    def scan_dir_file(path):
-        for f in os.scandir(path):
-            if f.is_file() and (f.name[-3:].lower() == '.pp' or f.name[-4:].lower() == '.pp7') and any (matcher in f.name for matcher in selected_program):
-                yield f.path
-            elif f.is_dir():
-                yield from scan_dir_file(f.path)
-    file_program = {f for f in scan_dir_file(path_program)}
-
-
-    log.info(f"Matched file_program = {file_program}")
-
-    # Continue only if at least one program file is found
-    if len(file_program) < 1:
-        df_checker_all = pd.DataFrame(columns=output_columns)
-        df_checker_all.to_excel(f"{path_main}\\SCRIPT_OUTPUT.xksx", sheet_name='OUTPUT', index=False)
-        raise ConnectionAbortedError ('There is no selected program file found, force exiting application...')
-
-    # Combining all program files
-    log.info(f"Starting to read {str(len(file_program))} program files...")
-    all_items = []
-    all_feeder_items = []
-    all_action_items = []
-    for file in file_program:
-        log.info(f"Reading: {file}...")
-
-        filename = file.rsplit('\\', 1)[-1]
-        log.debug(f"filename = {filename}")
-
-        filename_without_ext = filename.rsplit('.', 1)[0]
-        log.debug(f"filename_without_ext = {filename_without_ext}")
-
-        file_ext = filename.rsplit('.', 1)[-1]
-        log.debug(f"file_ext = {file_ext}")
-
-        xmldata = file
-
-        store_items = []
-        store_feeder_items = []
-        store_action_items = []
-
-        if file_ext.lower() == 'pp7':
-            ETree.register_namespace('', 'http://api.assembleon.com/pp7/v1')
-            prstree = ETree.parse(xmldata)
-            root = prstree.getroot()
-            pp_url = '{http://api.assembleon.com/pp7/v1}'
-            log.debug(f"Setting pp_url to {pp_url}...")
-            for GeneralInfo in root.iter(f"{pp_url}General"):
-                sMachine = '3'
-                sCycleTime_Raw = GeneralInfo.attrib.get('cycleTime')
-                sCycleTime = sCycleTime_Raw[:-3] + '.' + sCycleTime_Raw[-3:]
-
-            for BoardInfo in root.iter(f"{pp_url}Board"):
-                sProgramName = BoardInfo.attrib.get('id')
-                for ComponentInfo in BoardInfo.iter(f"{pp_url}Component"):
-                    sPartNumber = ComponentInfo.attrib.get('partNumber')
-                    sREFDES = ComponentInfo.attrib.get('refDes')
-                    sBoardNumber = ComponentInfo.attrib.get('circuitNumber')
-
-                    store_items = [sProgramName, sMachine, sPartNumber, sREFDES, sBoardNumber, sCycleTime]
-                    all_items.append(store_items)
-
-            for FeedSectionInfo in root.iter(f"{pp_url}FeedSection"):
-                sSectionNumber = FeedSectionInfo.attrib.get('number')
-                sTrolleyType = FeedSectionInfo.attrib.get('type')
-                for FeederInfo in FeedSectionInfo.iter(f"{pp_url}Feeder"):
-                    sFeederNumber = FeederInfo.attrib.get('slotNumber')
-                    sFeederType = FeederInfo.attrib.get('type')
-                    for LaneInfo in FeederInfo.iter(f"{pp_url}FeederLane"):
-                        sLaneNumber = LaneInfo.attrib.get('number')
-                        sPartNumber = LaneInfo.attrib.get('partNumber')
-                        sShape = LaneInfo.attrib.get('shapeId')
-                        store_feeder_items = [sProgramName, sMachine, sSectionNumber, sTrolleyType, sFeederNumber, sFeederType, sLaneNumber, sPartNumber, sShape]
-                        all_feeder_items.append(store_feeder_items)
-
-            # One feeder has 1 robot with 2 heads
-            for PickInfo in root.iter(f"{pp_url}Pick"):
-                sSectionNumber = PickInfo.attrib.get('feedSectionNumber')
-                sRobotNumber = PickInfo.attrib.get('robotNumber')
-                sHeadNumber = PickInfo.attrib.get('headNumber')
-                sREFDES = PickInfo.attrib.get('refDes')
-                sCircuitNumber = PickInfo.attrib.get('circuitNumber')
-                sFeederNumber = PickInfo.attrib.get('feederSlotNumber')
-                sLaneNumber = PickInfo.attrib.get('feederLaneNumber')
-                store_action_items = [sProgramName, sMachine, sSectionNumber, sRobotNumber, sHeadNumber, sREFDES, sCircuitNumber, sFeederNumber, sLaneNumber]
-                all_action_items.append(store_action_items)
-
-        else:
-            ETree.register_namespace('', 'http://api.assembleon.com/pp/v2')
-            prstree = ETree.parse(xmldata)
-            root = prstree.getroot()
-            pp_url = '{http://api.assembleon.com/pp/v2}'
-            log.debug(f"Setting pp_url to {pp_url}...")
-            for GeneralInfo in root.iter(f"{pp_url}General"):
-                sMachine = GeneralInfo.attrib.get('positionInLine')
-                sCycleTime_Raw = GeneralInfo.attrib.get('cycleTime')
-                sCycleTime = sCycleTime_Raw[:-3] + '.' + sCycleTime_Raw[-3:]
-
-            for BoardInfo in root.iter(f"{pp_url}Board"):
-                sProgramName = BoardInfo.attrib.get('id')
-                # for ComponentInfo in BoardInfo.iter(f"{pp_url}Component"):
-                #     sPartNumber = ComponentInfo.attrib.get('partNumber')
-                #     sREFDES = ComponentInfo.attrib.get('refDes')
-                #     sBoardNumber = ComponentInfo.attrib.get('circuitNumber')
-
-                #     store_items = [sProgramName, sMachine, sPartNumber, sREFDES, sBoardNumber, sCycleTime]
-                #     all_items.append(store_items)
-
-            for SectionInfo in root.iter(f"{pp_url}Section"):
-                sSectionNumber = SectionInfo.attrib.get('number')
-                for TrolleyInfo in SectionInfo.iter(f"{pp_url}Trolley"):
-                    sTrolleyType = TrolleyInfo.attrib.get('type')
-                    for FeederInfo in TrolleyInfo.iter(f"{pp_url}Feeder"):
-                        sFeederNumber = FeederInfo.attrib.get('number')
-                        sFeederType = FeederInfo.attrib.get('type')
-                        for LaneInfo in FeederInfo.iter(f"{pp_url}Lane"):
-                            sLaneNumber = LaneInfo.attrib.get('number')
-                            sPartNumber = LaneInfo.attrib.get('partNumber')
-                            sShape = LaneInfo.attrib.get('shapeId')
-                            store_feeder_items = [sProgramName, sMachine, sSectionNumber, sTrolleyType, sFeederNumber, sFeederType, sLaneNumber, sPartNumber, sShape]
-                            all_feeder_items.append(store_feeder_items)
-
-            # Each section has 4 robots, total 5 sections with 20 robots, each with 1 head
-            sHeadNumber = '1'
-            robots_per_section = 4
-            section_number = 1
-            log.debug(f"Assuming each section has {str(int(robots_per_section))} robots, each with {sHeadNumber} head...")
-            for a, ActionInfo in enumerate(root.iter(f"{pp_url}Actions")):
-                sSectionNumber = str(int(section_number))
-                if (a+1) % robots_per_section == 0:
-                    section_number += 1
-                sRobotNumber = ActionInfo.attrib.get('robotNumber')
-                for IndexInfo in ActionInfo.iter(f"{pp_url}Index"):
-                    for PickInfo in IndexInfo.iter(f"{pp_url}Pick"):
-                        sREFDES = PickInfo.attrib.get('refDes')
-                        sCircuitNumber = PickInfo.attrib.get('circuitNumber')
-                        sFeederNumber = PickInfo.attrib.get('feederNumber')
-                        sLaneNumber = PickInfo.attrib.get('laneNumber')
-                        store_action_items = [sProgramName, sMachine, sSectionNumber, sRobotNumber, sHeadNumber, sREFDES, sCircuitNumber, sFeederNumber, sLaneNumber]
-                        all_action_items.append(store_action_items)
-
-    log.debug('Concating all_feeder_items into df_feeder...')
-    df_feeder = pd.DataFrame(all_feeder_items, columns=['PROGRAM_NAME', 'MACHINE', 'SECTION_NUMBER', 'TROLLEY_TYPE', 'FEEDER_NUMBER', 'FEEDER_TYPE', 'LANE_NUMBER', 'COMPONENT', 'SHAPE'])
-    log.debug(f"\n{df_feeder.head(5).to_string(index=False)}")
-
-    log.debug('Concating all_action_items into df_action...')
-    df_action = pd.DataFrame(all_action_items, columns=['PROGRAM_NAME', 'MACHINE', 'SECTION_NUMBER', 'ROBOT_NUMBER', 'HEAD_NUMBER', 'DESIGNATOR', 'BOARD_NUMBER', 'FEEDER_NUMBER', 'LANE_NUMBER'])
-    log.debug(f"\n{df_action.head(5).to_string(index=False)}")
-
-    log.debug('Inner joining df_feeder into df_action...')
-    df_feeder_action = df_action.merge(df_feeder, how='inner', left_on=['PROGRAM_NAME', 'MACHINE', 'SECTION_NUMBER', 'FEEDER_NUMBER', 'LANE_NUMBER'], right_on=['PROGRAM_NAME', 'MACHINE', 'SECTION_NUMBER', 'FEEDER_NUMBER', 'LANE_NUMBER'])
-    df_feeder_action = df_feeder_action[['PROGRAM_NAME', 'MACHINE', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER', 'SHAPE', 'SECTION_NUMBER', 'FEEDER_NUMBER', 'LANE_NUMBER', 'ROBOT_NUMBER', 'HEAD_NUMBER', 'FEEDER_TYPE', 'TROLLEY_TYPE']]
-    log.debug(f"\n{df_feeder_action.head(5).to_string(index=False)}")
-
-    log.debug('Dropping duplicates...')
-    df_program = df_feeder_action.drop_duplicates(subset=['PROGRAM_NAME', 'MACHINE', 'COMPONENT', 'DESIGNATOR','BOARD_NUMBER'], keep='last')
-    log.debug(f"\n{df_program.head(5).to_string(index=False)}")
-
-    log.debug('Sorting df_program...')
-    df_program = df_program.sort_values(by=['PROGRAM_NAME', 'MACHINE', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER'])
-    log.debug(f"\n{df_program.head(5).to_string(index=False)}")
-
-    log.info('Writing df_program detail into SCRIPT_OUTPUT_PROGRAM.xlsx ...')
-    df_program.to_excel(f"{path_main}\\SCRIPT_OUTPUT_PROGRAM.xlsx", sheet_name="DETAIL", index=False) 
-    
-    log.debug('Adding LOCATION column...')
-    df_program['LOCATION'] = 'Board: ' + df_program['BOARD_NUMBER']  + ', Machine: ' + df_program['MACHINE'] + ', Section: ' + df_program['SECTION_NUMBER'] + ', Feeder: ' + df_program['FEEDER_NUMBER'] + ', Lane: ' + df_program['LANE_NUMBER'] + ', Robot: ' + df_program['ROBOT_NUMBER'] + ', Head: ' + df_program['HEAD_NUMBER'] + ' (' + df_program['FEEDER_TYPE'] + ', ' + df_program['TROLLEY_TYPE'] + ')'
-    df_program = df_program[['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'SHAPE', 'BOARD_NUMBER', 'LOCATION']]
-    log.debug(f"\n{df_program.head(5).to_string(index=False)}")
-
-    log.debug('Grouping location...')
-    df_program = df_program.groupby(['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'SHAPE']).aggregate({'BOARD_NUMBER': lambda x: ','.join(sorted(x)) , 'LOCATION': lambda x: '\n'.join(sorted(x))}).reset_index()
-    log.debug(f"\n{df_program.head(5).to_string(index=False)}")
-
-    log.info('Writing df_program summary into SCRIPT_OUTPUT_PROGRAM.xlsx ...')
-    with pd.ExcelWriter(f"{path_main}\\SCRIPT_OUTPUT_PROGRAM.xlsx", mode='a', if_sheet_exists='replace') as f:
-        df_program.to_excel(f, sheet_name="SUMMARY", index=False) 
-
-    log.info(f"Total of {str(len(df_program))} rows detected in program files.")
-    log.info('All selected input files are successfully loaded, proceeding with the checking algorithm...')
+def check(log, df_input, df_590, df_MCTO, df_program, snapshot, metrics, check_empty=True):
+    '''
+    Run checking algorithms 1 to 7 on the CHECKER rows of df_input against df_590, df_MCTO and the df_program summary
+    Return (df_checker, df_checker_extra) with decoded keys, df_checker_extra is None if no extra part is programmed
+    check_empty=False skips the check that 590 and MCTO have data, for shards of a job that was checked as a whole
+    '''
 
     log.info('Algorithm 1: Starting to calculate count of part number in PNP_PROGRAM...')
+    metrics.start('Algorithm 1', rows_in=len(df_program))
 
     log.debug('Dropping duplicates from df_program...')
     df_program_qty = df_program.drop_duplicates(subset=['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR'], keep='last')
-    log.debug(f"\n{df_program_qty.head(5).to_string(index=False)}")
+    snapshot(df_program_qty, 'df_program_qty')
 
     log.debug('Grouping by designator...')
     df_program_qty = df_program_qty.groupby(['PROGRAM_NAME', 'COMPONENT'])['DESIGNATOR'].count().reset_index()
-    log.debug(f"\n{df_program_qty.head(5).to_string(index=False)}")
+    snapshot(df_program_qty, 'df_program_qty')
 
     log.debug('Renaming designator count to program qty and convert into int...')
     df_program_qty = df_program_qty.rename(columns={'DESIGNATOR':'PROGRAM_QTY'})
     df_program_qty['PROGRAM_QTY'] = df_program_qty['PROGRAM_QTY'].astype(int)
-    log.debug(f"\n{df_program_qty.head(5).to_string(index=False)}")
+    snapshot(df_program_qty, 'df_program_qty')
 
+    metrics.stop('Algorithm 1', rows_out=len(df_program_qty))
     log.info('Algorithm 1 completed: Count of part number is calculated in PNP_PROGRAM.')
 
     log.info('Algorihm 2: Starting to merge 590 and MCTO into master source table...')
+    metrics.start('Algorithm 2', rows_in=len(df_590) + len(df_MCTO))
 
     log.debug('Keeping only BOM and MCTO from df_590_MCTO and drop duplicates...')
     df_590_MCTO_PV = df_input[['BOM', 'MCTO', 'PV']]
     df_590_MCTO_PV.drop_duplicates(subset=['BOM', 'MCTO', 'PV'], keep='last', inplace=True)
-    log.debug(f"\n{df_590_MCTO_PV.head(5).to_string(index=False)}")
+    snapshot(df_590_MCTO_PV, 'df_590_MCTO_PV')
 
     log.debug('Keeping only BOM, MCTO, PNP_PROGRAM_SIDE1 and PNP_PROGRAM_SIDE2 from df_input and drop duplicates...')    
     df_590_MCTO_PV_program = df_input[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2']]
     df_590_MCTO_PV_program.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2'], keep='last', inplace=True)
-    log.debug(f"\n{df_590_MCTO_PV_program.head(5).to_string(index=False)}")
+    snapshot(df_590_MCTO_PV_program, 'df_590_MCTO_PV_program')
 
     log.debug('Inner joining df_590_MCTO on BOM and drop duplicates...')
     df_590_all = df_590.merge(df_590_MCTO_PV, how='inner', left_on='BOM', right_on='BOM')
     df_590_all['GROUP'] = 'BOM_590' 
     df_590_all = df_590_all[['BOM', 'MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'GROUP']]
     df_590_all.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'GROUP'], keep='last', inplace=True)
-    log.debug(f"\n{df_590_all.head(5).to_string(index=False)}")
+    snapshot(df_590_all, 'df_590_all')
 
     log.debug('Inner joining df_590_MCTO on MCTO and drop duplicates...')
     df_MCTO_all = df_MCTO.merge(df_590_MCTO_PV, how='inner', left_on=['MCTO', 'PV'], right_on=['MCTO', 'PV'])
     df_MCTO_all['GROUP'] = 'MCTO'
     df_MCTO_all = df_MCTO_all[['BOM', 'MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'GROUP']]
     df_MCTO_all.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'GROUP'], keep='last', inplace=True)
-    log.debug(f"\n{df_MCTO_all.head(5).to_string(index=False)}")
+    snapshot(df_MCTO_all, 'df_MCTO_all')
 
     # Check if 590/MCTO is having any data
-    if len(df_590_all) < 1 or len(df_MCTO_all) < 1:
+    if check_empty and (len(df_590_all) < 1 or len(df_MCTO_all) < 1):
         raise ConnectionAbortedError (f"df_590_all or df_MCTO_all is empty, force exiting application...")
 
     log.debug('Concating df_590_all into df_MCTO_all...')
     df_590_MCTO_all = pd.concat([df_590_all, df_MCTO_all], ignore_index=True)
-    log.debug(f"\n{df_590_MCTO_all.head(5).to_string(index=False)}")
+    snapshot(df_590_MCTO_all, 'df_590_MCTO_all')
 
+    metrics.stop('Algorithm 2', rows_out=len(df_590_MCTO_all))
     log.info('Algorithm 2 completed: Merged 590 and MCTO into master source table.')
 
     log.info('Algorithm 3: Starting to convert Memory Parts into 520-XXX...')
+    metrics.start('Algorithm 3', rows_in=len(df_590_MCTO_all))
 
     log.debug('Running logic to generate component with 520-XXX memory...')
     df_Material = df_590_MCTO_all
@@ -677,7 +499,7 @@ def main(log, path_main, path_590, path_MCTO, path_program, path_checker, input_
     df_Material['MemoryDesc_:'] = df_Material['MemoryDesc'].str.split(':').str[-2]
     df_Material['COMPONENT2'] = np.where(df_Material['COMPONENT'].str.contains('-'), df_Material['COMPONENT'], np.where(df_Material['COMPDESC'].str.startswith('MTC'), df_Material['MemoryDesc_:'], np.where(df_Material['Last2'] != '', '520-' + df_Material['Last2'], np.where(df_Material['COMPDESC'].str.startswith('MT2'), '520-' + df_Material['Last1'].str[-2:], '520-' + df_Material['Last1']))))
     df_Material = df_Material.rename(columns={'COMPONENT':'COMPONENT3', 'COMPONENT2':'COMPONENT'})
-    log.debug(f"\n{df_Material.head(5).to_string(index=False)}")
+    snapshot(df_Material, 'df_Material')
 
     log.debug('Dropping duplicates and inner join df_590_MCTO_program...')
     df_Material = df_Material[['BOM', 'MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR']]
@@ -686,217 +508,212 @@ def main(log, path_main, path_590, path_MCTO, path_program, path_checker, input_
     df_Material = df_Material[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR']]
     df_Material.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR'], keep='last', inplace=True)
     df_Material = df_Material.sort_values(by=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT'])
-    log.debug(f"\n{df_Material.head(5).to_string(index=False)}")
+    snapshot(df_Material, 'df_Material')
 
+    metrics.stop('Algorithm 3', rows_out=len(df_Material))
     log.info('Algorithm 3 completed: Memory parts are converted into 520-XXX')
 
     log.info('Algorithm 4: Starting to split designator into rows...')
+    metrics.start('Algorithm 4', rows_in=len(df_Material))
     df_Material_expanded = split_into_rows(df_Material, column="DESIGNATOR")
-    log.debug(f"\n{df_Material_expanded.head(5).to_string(index=False)}")
+    metrics.stop('Algorithm 4', rows_out=len(df_Material_expanded))
+    snapshot(df_Material_expanded, 'df_Material_expanded')
     log.info('Algoritm 4 completed: Designators are splited into rows.')
 
+    log.info('Encoding join keys into integer codes...')
+    metrics.start('Key encoding', rows_in=len(df_program) + len(df_Material_expanded))
+    keys = KeyDictionary()
+    keys.fit('PROGRAM', df_program['PROGRAM_NAME'], df_590_MCTO_PV_program['PNP_PROGRAM_SIDE1'], df_590_MCTO_PV_program['PNP_PROGRAM_SIDE2'])
+    keys.fit('COMPONENT', df_program['COMPONENT'], df_Material['COMPONENT'])
+    keys.fit('DESIGNATOR', df_program['DESIGNATOR'], df_Material_expanded['DESIGNATOR'])
+    keys.fit('BOM', df_590_MCTO_PV_program['BOM'])
+    keys.fit('MCTO', df_590_MCTO_PV_program['MCTO'])
+    keys.fit('PV', df_590_MCTO_PV_program['PV'])
+    program_keys = {'PROGRAM_NAME': 'PROGRAM', 'COMPONENT': 'COMPONENT'}
+    checker_keys = {'BOM': 'BOM', 'MCTO': 'MCTO', 'PV': 'PV', 'PNP_PROGRAM_SIDE1': 'PROGRAM', 'PNP_PROGRAM_SIDE2': 'PROGRAM'}
+    material_keys = {**checker_keys, 'COMPONENT': 'COMPONENT'}
+    df_program = keys.encode(df_program, {**program_keys, 'DESIGNATOR': 'DESIGNATOR'})
+    df_program_qty = keys.encode(df_program_qty, program_keys)
+    df_590_MCTO_PV_program = keys.encode(df_590_MCTO_PV_program, checker_keys)
+    df_Material = keys.encode(df_Material, material_keys)
+    df_Material_expanded = keys.encode(df_Material_expanded, {**material_keys, 'DESIGNATOR': 'DESIGNATOR'})
+    snapshot(df_Material, 'df_Material')
+    metrics.stop('Key encoding', rows_out=len(df_program) + len(df_Material_expanded))
+
     log.info('Algorithm 5: Starting to check quantity...')
+    metrics.start('Algorithm 5', rows_in=len(df_Material))
     df_checker = df_Material
 
     log.debug('Converting quantity to int...')
     df_checker['QUANTITY'] = df_checker['QUANTITY'].astype(int)
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    snapshot(df_checker, 'df_checker')
 
     log.debug('Counting comma in designator + 1 as REFDES_QTY...')
     df_checker['REFDES_QTY'] = df_checker['DESIGNATOR'].str.count(',').astype(int) + 1
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    snapshot(df_checker, 'df_checker')
 
     log.debug('Left joining df_program for side 1...')
     df_checker = df_checker.merge(df_program_qty, how='left', left_on=['PNP_PROGRAM_SIDE1', 'COMPONENT'], right_on=['PROGRAM_NAME', 'COMPONENT']).drop('PROGRAM_NAME', axis=1)
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    snapshot(df_checker, 'df_checker')
 
     log.debug('Converting PROGRAM_QTY into int with null as zero, rename to PQ1...')
     df_checker['PROGRAM_QTY'] = df_checker['PROGRAM_QTY'].fillna(0).astype(int)
     df_checker = df_checker.rename(columns={'PROGRAM_QTY':'PQ1'})
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    snapshot(df_checker, 'df_checker')
 
     log.debug('Left joining df_program_qty for side 2')
     df_checker = df_checker.merge(df_program_qty, how='left', left_on=['PNP_PROGRAM_SIDE2', 'COMPONENT'], right_on=['PROGRAM_NAME', 'COMPONENT']).drop('PROGRAM_NAME', axis=1)
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    snapshot(df_checker, 'df_checker')
     
     log.debug('Converting PROGRAM_QTY into int with null as zero, rename to PQ2...')
     df_checker['PROGRAM_QTY'] = df_checker['PROGRAM_QTY'].fillna(0).astype(int)
     df_checker = df_checker.rename(columns={'PROGRAM_QTY':'PQ2'})
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    snapshot(df_checker, 'df_checker')
 
     log.debug('Summing PQ1 and PQ2 into PROGRAM_QTY as int...')
     df_checker['PROGRAM_QTY'] = (df_checker['PQ1'] + df_checker['PQ2']).astype(int)
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    snapshot(df_checker, 'df_checker')
 
     log.debug('Generating SAP_QTY_TALLY and PROGRAM_QTY_TALLY...')
     df_checker['SAP_QTY_TALLY?'] = np.where((df_checker['QUANTITY'] == df_checker['REFDES_QTY']), 'Yes', 'No')
     df_checker['PROGRAM_QTY_TALLY?'] = np.where((df_checker['QUANTITY'] == df_checker['PROGRAM_QTY']), 'Yes', 'No')
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    snapshot(df_checker, 'df_checker')
 
+    metrics.stop('Algorithm 5', rows_out=len(df_checker))
     log.info('Algorithm 5 completed: Quantity checked.')
 
     log.info('Algorithm 6: Starting to check part number and designator...')
+    metrics.start('Algorithm 6', rows_in=len(df_checker))
 
-    log.debug('Splitting designator into rows...')
-    df_checker = split_into_rows(df_checker, column='DESIGNATOR')
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
-
-    log.debug('Left joining df_program with LOCATION_SIDE1...')
-    df_checker = df_checker.merge(df_program[['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER', 'LOCATION']], how='left', left_on=['PNP_PROGRAM_SIDE1', 'COMPONENT', 'DESIGNATOR'], right_on=['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR']).drop(['PROGRAM_NAME'], axis=1)
-    df_checker = df_checker.rename(columns={'BOARD_NUMBER':'BOARD_SIDE1', 'LOCATION':'LOCATION_SIDE1'})
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    log.debug('Indexing designators mounted by each program and component...')
+    reconciler = DesignatorReconciler(keys.decode(df_program, {'DESIGNATOR': 'DESIGNATOR'}))
 
-    log.debug('Left joining df_program with LOCATION_SIDE2...')
-    df_checker = df_checker.merge(df_program[['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER', 'LOCATION']], how='left', left_on=['PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR'], right_on=['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR']).drop(['PROGRAM_NAME'], axis=1)
-    df_checker = df_checker.rename(columns={'BOARD_NUMBER':'BOARD_SIDE2', 'LOCATION':'LOCATION_SIDE2'})
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    log.debug('Reconciling BOM designators against side 1 and side 2 programs...')
+    df_checker = reconciler.reconcile(df_checker, ['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?'])
+    snapshot(df_checker, 'df_checker')
 
-    log.debug('Dropping duplicates...')
-    df_checker.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'BOARD_SIDE1', 'BOARD_SIDE2', 'LOCATION_SIDE1', 'LOCATION_SIDE2'], keep='last', inplace=True)
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
-
-    log.debug('Generating Checker Result...')
-    df_checker['CHECKER'] = np.where((~df_checker['BOARD_SIDE1'].isnull()) & (~df_checker['BOARD_SIDE2'].isnull()), 'Something wrong, both side mounting the same designator', np.where((~df_checker['BOARD_SIDE1'].isnull()), ('Mount at Side 1 on Board ' + df_checker['BOARD_SIDE1']), np.where((~df_checker['BOARD_SIDE2'].isnull()), ('Mount at Side 2 on Board ' + df_checker['BOARD_SIDE2']), 'Not found'))) 
-    df_checker['LOCATION'] = np.where((~df_checker['LOCATION_SIDE1'].isnull()) & (~df_checker['LOCATION_SIDE2'].isnull()), 'Something wrong, both side mounting the same designator', np.where((~df_checker['LOCATION_SIDE1'].isnull()), ('Mount at Side 1 on ' + df_checker['LOCATION_SIDE1'].str.replace('\n', '\nMount at Side 1 on ')), np.where((~df_checker['LOCATION_SIDE2'].isnull()), ('Mount at Side 2 on ' + df_checker['LOCATION_SIDE2'].str.replace('\n', '\nMount at Side 2 on ')), 'Not found'))) 
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
-    
-    log.debug('Extrating designator num from end and split into letter/number...')
-    df_checker['DESIGNATOR_letter'] = df_checker['DESIGNATOR'].apply(extract_num_from_end, keep='letter').replace('', np.NaN, regex=True).astype(str)
-    df_checker['DESIGNATOR_number'] = df_checker['DESIGNATOR'].apply(extract_num_from_end, keep='number').replace('', 0, regex=True).astype(int)
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
-    
-    log.debug('Sorting designator...')
-    df_checker = df_checker.sort_values(by=['BOM', 'MCTO', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR_letter', 'DESIGNATOR_number'])
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
-    
-    log.debug('Grouping by designator and checker...')
-    df_checker = df_checker.groupby(['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?']).aggregate({'DESIGNATOR': lambda x: ','.join(x), 'CHECKER': lambda x: '\n'.join(sorted(x)), 'LOCATION': lambda x: '\n'.join(sorted(x))}).reset_index()
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
-    
-    log.debug('Removing string duplicates on designator and checker...')
+    log.debug('Sorting checker result...')
     df_checker = df_checker[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'CHECKER', 'LOCATION']]
-    df_checker['DESIGNATOR'] = df_checker['DESIGNATOR'].apply(string_remove_duplicate, delimiter=',')
-    df_checker['CHECKER'] = df_checker['CHECKER'].apply(string_remove_duplicate, delimiter='\n')
-    df_checker['LOCATION'] = df_checker['LOCATION'].apply(string_remove_duplicate, delimiter='\n')
-    df_checker = split_into_rows(df_checker, column='LOCATION', sep='\n')
-    df_checker = df_checker.groupby(['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'CHECKER']).aggregate({'LOCATION': lambda x: '\n'.join(sorted(x))}).reset_index()
-    log.debug(f"\n{df_checker.head(5).to_string(index=False)}")
+    df_checker = df_checker.sort_values(by=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'CHECKER'], ignore_index=True)
+    snapshot(df_checker, 'df_checker')
 
+    metrics.stop('Algorithm 6', rows_out=len(df_checker))
     log.info('Algorithm 6 completed: Part number and designator checked.')
 
     log.info('Algorithm 7: Starting to check extra programmed parts...')
-    df_checker_extra = df_program[['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER', 'LOCATION']]
+    metrics.start('Algorithm 7', rows_in=len(df_program))
+    df_program_context = df_program[['PROGRAM_NAME']].drop_duplicates()
 
     log.debug('Left joining df_590_MCTO_program for side 1...')
-    df_checker_extra = df_checker_extra.merge(df_590_MCTO_PV_program, how='left', left_on=['PROGRAM_NAME'], right_on=['PNP_PROGRAM_SIDE1']).drop(['PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2'], axis=1)
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+    df_program_context = df_program_context.merge(df_590_MCTO_PV_program, how='left', left_on=['PROGRAM_NAME'], right_on=['PNP_PROGRAM_SIDE1']).drop(['PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2'], axis=1)
+    snapshot(df_program_context, 'df_program_context')
 
     log.debug('Left joining df_590_MCTO_program for side 2...')
-    df_checker_extra = df_checker_extra.merge(df_590_MCTO_PV_program, how='left', left_on=['PROGRAM_NAME'], right_on=['PNP_PROGRAM_SIDE2']).drop(['PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2'], axis=1)
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
-
-    log.debug('Combining BOM_x and BOM_y ...')
-    df_checker_extra['BOM'] = df_checker_extra['BOM_x'].fillna(df_checker_extra['BOM_y'])
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+    df_program_context = df_program_context.merge(df_590_MCTO_PV_program, how='left', left_on=['PROGRAM_NAME'], right_on=['PNP_PROGRAM_SIDE2']).drop(['PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2'], axis=1)
+    snapshot(df_program_context, 'df_program_context')
 
-    log.debug('Combining MCTO_x and MCTO_y ...')
-    df_checker_extra['MCTO'] = df_checker_extra['MCTO_x'].fillna(df_checker_extra['MCTO_y'])
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
-
-    log.debug('Combining PV_x and PV_y ...')
-    df_checker_extra['PV'] = df_checker_extra['PV_x'].fillna(df_checker_extra['PV_y'])
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+    log.debug('Combining BOM_x/y, MCTO_x/y and PV_x/y ...')
+    df_program_context['BOM'] = df_program_context['BOM_x'].fillna(df_program_context['BOM_y'])
+    df_program_context['MCTO'] = df_program_context['MCTO_x'].fillna(df_program_context['MCTO_y'])
+    df_program_context['PV'] = df_program_context['PV_x'].fillna(df_program_context['PV_y'])
+    snapshot(df_program_context, 'df_program_context')
 
     log.debug('Left joining df_590_MCTO_program on BOM, MCTO and PV...')
-    df_checker_extra = df_checker_extra.merge(df_590_MCTO_PV_program, how='left', left_on=['BOM', 'MCTO', 'PV'], right_on=['BOM', 'MCTO', 'PV'])
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
-
-    log.debug('Creating NOARD_SIDE1 and LOCATION_SIDE1...')
-    df_checker_extra['BOARD_SIDE1'] = np.where((df_checker_extra['PROGRAM_NAME'] == df_checker_extra['PNP_PROGRAM_SIDE1']), df_checker_extra['BOARD_NUMBER'], np.NaN)
-    df_checker_extra['LOCATION_SIDE1'] = np.where((df_checker_extra['PROGRAM_NAME'] == df_checker_extra['PNP_PROGRAM_SIDE1']), df_checker_extra['LOCATION'], np.NaN)
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
-
-    log.debug('Creating BOARD_SIDE1 and LOCATION_SIDE2...')
-    df_checker_extra['BOARD_SIDE2'] = np.where((df_checker_extra['PROGRAM_NAME'] == df_checker_extra['PNP_PROGRAM_SIDE1']), df_checker_extra['BOARD_NUMBER'], np.NaN)
-    df_checker_extra['LOCATION_SIDE2'] = np.where((df_checker_extra['PROGRAM_NAME'] == df_checker_extra['PNP_PROGRAM_SIDE2']), df_checker_extra['LOCATION'], np.NaN)
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+    df_program_context = df_program_context[['PROGRAM_NAME', 'BOM', 'MCTO', 'PV']].merge(df_590_MCTO_PV_program, how='left', left_on=['BOM', 'MCTO', 'PV'], right_on=['BOM', 'MCTO', 'PV'])
+    snapshot(df_program_context, 'df_program_context')
 
     log.debug('Removing rows with null BOM...')
-    df_checker_extra = df_checker_extra[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR', 'BOARD_SIDE1', 'BOARD_SIDE2', 'LOCATION_SIDE1', 'LOCATION_SIDE2']]
+    df_program_context = df_program_context[(df_program_context['BOM'].notnull())]
+    snapshot(df_program_context, 'df_program_context')
+
+    log.debug('Pairing each programmed part with the BOM, MCTO and PV of its program...')
+    df_checker_extra = df_program[['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR']].assign(PROGRAM_ROW=np.arange(len(df_program)))
+    df_checker_extra = df_checker_extra.merge(df_program_context, how='left', left_on=['PROGRAM_NAME'], right_on=['PROGRAM_NAME'])
     df_checker_extra = df_checker_extra[(df_checker_extra['BOM'].notnull())]
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
-    
-    log.debug('Left joining df_Material_expanded with indicator...')
-    df_checker_extra = df_checker_extra.merge(df_Material_expanded[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR']], how='left', left_on=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR'], right_on=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR'], indicator=True)
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
-    
-    log.debug('Keeping left_only merge...')
-    df_checker_extra = df_checker_extra[(df_checker_extra._merge=='left_only')].drop('_merge', axis=1)
-    log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+    snapshot(df_checker_extra, 'df_checker_extra')
+
+    log.debug('Probing programmed parts against the index of expected BOM designators...')
+    placement_index = PlacementIndex(df_Material_expanded, ['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR'])
+    df_checker_extra = df_checker_extra[~placement_index.contains(df_checker_extra)]
+    snapshot(df_checker_extra, 'df_checker_extra')
+
+    log.debug('Creating BOARD_SIDE1/2 and LOCATION_SIDE1/2...')
+    board_number = df_program['BOARD_NUMBER'].to_numpy()[df_checker_extra['PROGRAM_ROW'].to_numpy()]
+    location = df_program['LOCATION'].to_numpy()[df_checker_extra['PROGRAM_ROW'].to_numpy()]
+    df_checker_extra['BOARD_SIDE1'] = np.where((df_checker_extra['PROGRAM_NAME'] == df_checker_extra['PNP_PROGRAM_SIDE1']).fillna(False), board_number, np.NaN)
+    df_checker_extra['LOCATION_SIDE1'] = np.where((df_checker_extra['PROGRAM_NAME'] == df_checker_extra['PNP_PROGRAM_SIDE1']).fillna(False), location, np.NaN)
+    df_checker_extra['BOARD_SIDE2'] = np.where((df_checker_extra['PROGRAM_NAME'] == df_checker_extra['PNP_PROGRAM_SIDE1']).fillna(False), board_number, np.NaN)
+    df_checker_extra['LOCATION_SIDE2'] = np.where((df_checker_extra['PROGRAM_NAME'] == df_checker_extra['PNP_PROGRAM_SIDE2']).fillna(False), location, np.NaN)
+    df_checker_extra = df_checker_extra[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR', 'BOARD_SIDE1', 'BOARD_SIDE2', 'LOCATION_SIDE1', 'LOCATION_SIDE2']]
+    snapshot(df_checker_extra, 'df_checker_extra')
 
     if df_checker_extra.empty:
-        log.debug('df_checker_extra is empty, assigning df_checker to df_checker_all...')
-        df_checker_all = df_checker
+        log.debug('df_checker_extra is empty, only df_checker goes to the output...')
+        df_checker_extra = None
         log.info('No extra parts programmed.')
     else:
         log.debug('There is extra parts programmed.')
 
         log.debug('Dropping duplicates...')
         df_checker_extra.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR', 'BOARD_SIDE1', 'BOARD_SIDE2', 'LOCATION_SIDE1', 'LOCATION_SIDE2'], keep='last', inplace=True)
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
         
         log.debug('Setting QUANTITY and REFDES_QTY as 0...')
         df_checker_extra['QUANTITY'] = 0
         df_checker_extra['REFDES_QTY'] = 0
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
 
         log.debug('Left joining df_program_qty for side 1 as PQ1...')
         df_checker_extra = df_checker_extra.merge(df_program_qty, how='left', left_on=['PNP_PROGRAM_SIDE1', 'COMPONENT'], right_on=['PROGRAM_NAME', 'COMPONENT']).drop('PROGRAM_NAME', axis=1)
         df_checker_extra['PROGRAM_QTY'] = df_checker_extra['PROGRAM_QTY'].fillna(0).astype(int)
         df_checker_extra = df_checker_extra.rename(columns={'PROGRAM_QTY':'PQ1'})
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
 
         log.debug('Left joining df_program_qty for side 2 as PQ2...')
         df_checker_extra = df_checker_extra.merge(df_program_qty, how='left', left_on=['PNP_PROGRAM_SIDE2', 'COMPONENT'], right_on=['PROGRAM_NAME', 'COMPONENT']).drop('PROGRAM_NAME', axis=1)
         df_checker_extra['PROGRAM_QTY'] = df_checker_extra['PROGRAM_QTY'].fillna(0).astype(int)
         df_checker_extra = df_checker_extra.rename(columns={'PROGRAM_QTY':'PQ2'})
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
 
         log.debug('Summing PQ1 and PQ2 as PROGRAM_QTY...')
         df_checker_extra['PROGRAM_QTY'] = (df_checker_extra['PQ1'] + df_checker_extra['PQ2']).astype(int)
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
 
         log.debug('Generating SAP_QTY_TALLY and PROGRAM_QTY_TALLY...')
         df_checker_extra['SAP_QTY_TALLY?'] = np.where((df_checker_extra['QUANTITY'] == df_checker_extra['REFDES_QTY']), 'Yes', 'No')
         df_checker_extra['PROGRAM_QTY_TALLY?'] = np.where((df_checker_extra['QUANTITY'] == df_checker_extra['PROGRAM_QTY']), 'Yes', 'No')
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
 
         log.debug('Dropping duplicates...')
         df_checker_extra.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'BOARD_SIDE1', 'BOARD_SIDE2', 'LOCATION_SIDE1', 'LOCATION_SIDE2'], keep='last', inplace=True)
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
         
         log.debug('Generating Checker Result...')
         df_checker_extra['CHECKER'] = np.where((~df_checker_extra['BOARD_SIDE1'].isnull()) & (~df_checker_extra['BOARD_SIDE2'].isnull()), 'Something wrong, both side extra mounting the same designator', np.where((~df_checker_extra['BOARD_SIDE1'].isnull()), ('Extra Mount at Side 1 on Board ' + df_checker_extra['BOARD_SIDE1']), np.where((~df_checker_extra['BOARD_SIDE2'].isnull()), ('Extra Mount at Side 2 on Board ' + df_checker_extra['BOARD_SIDE2']), 'Not found'))) 
         df_checker_extra['LOCATION'] = np.where((~df_checker_extra['LOCATION_SIDE1'].isnull()) & (~df_checker_extra['LOCATION_SIDE2'].isnull()), 'Something wrong, both side mounting the same designator', np.where((~df_checker_extra['LOCATION_SIDE1'].isnull()), ('Extra Mount at Side 1 on ' + df_checker_extra['LOCATION_SIDE1'].str.replace('\n', '\nExtra Mount at Side 1 on ')), np.where((~df_checker_extra['LOCATION_SIDE2'].isnull()), ('Extra Mount at Side 2 on ' + df_checker_extra['LOCATION_SIDE2'].str.replace('\n', '\nExtra Mount at Side 2 on ')), 'Not found'))) 
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
         
+        log.debug('Decoding designator...')
+        df_checker_extra = keys.decode(df_checker_extra, {'DESIGNATOR': 'DESIGNATOR'})
+        snapshot(df_checker_extra, 'df_checker_extra')
+
         log.debug('Extrating designator num from end and split into letter/number...')
         df_checker_extra['DESIGNATOR_letter'] = df_checker_extra['DESIGNATOR'].apply(extract_num_from_end, keep='letter').replace('', np.NaN, regex=True).astype(str)
         df_checker_extra['DESIGNATOR_number'] = df_checker_extra['DESIGNATOR'].apply(extract_num_from_end, keep='number').replace('', 0, regex=True).astype(int)
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
         
         log.debug('Sorting designator...')
         df_checker_extra = df_checker_extra.sort_values(by=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR_letter', 'DESIGNATOR_number'])
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
         
         log.debug('Grouping by designator and checker...')
         df_checker_extra = df_checker_extra.groupby(['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'QUANTITY', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?']).aggregate({'DESIGNATOR': lambda x: ','.join(x), 'CHECKER': lambda x: '\n'.join(sorted(x)), 'LOCATION': lambda x: '\n'.join(sorted(x))}).reset_index()
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
         
         log.debug('Adding COMPDESC as null...')
         df_checker_extra['COMPDESC'] = np.NaN
         df_checker_extra = df_checker_extra[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'CHECKER', 'LOCATION']]
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
 
         log.debug('Removing string duplicates on designator and checker...')
         df_checker_extra['DESIGNATOR'] = df_checker_extra['DESIGNATOR'].apply(string_remove_duplicate, delimiter=',')
@@ -904,40 +721,751 @@ def main(log, path_main, path_590, path_MCTO, path_program, path_checker, input_
         df_checker_extra['LOCATION'] = df_checker_extra['LOCATION'].apply(string_remove_duplicate, delimiter='\n')
         df_checker_extra = split_into_rows(df_checker_extra, column='LOCATION', sep='\n')
         df_checker_extra = df_checker_extra.groupby(['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'CHECKER']).aggregate({'LOCATION': lambda x: '\n'.join(sorted(x))}).reset_index()
-        log.debug(f"\n{df_checker_extra.head(5).to_string(index=False)}")
+        snapshot(df_checker_extra, 'df_checker_extra')
 
         log.info('Algorithm 7 completed: Extra programmed part checked.')
 
+    metrics.stop('Algorithm 7', rows_out=0 if df_checker_extra is None else len(df_checker_extra))
+    log.info('All checking algorithm has been completed.')
+
+    log.debug('Decoding join keys...')
+    df_checker = keys.decode(df_checker, material_keys)
+    if df_checker_extra is not None:
+        df_checker_extra = keys.decode(df_checker_extra, material_keys)
+
+    return df_checker, df_checker_extra
+
+
+def check_shard(df_input, df_590, df_MCTO, df_program):
+    '''Process pool worker of run_checker, checks one shard without snapshots or stage metrics, logging warnings only'''
+    log = logging.getLogger('logger.shard')
+    log.setLevel(logging.WARNING)
+    return check(log, df_input, df_590, df_MCTO, df_program, Snapshot(log, names=set()), RunMetrics(), check_empty=False)
+
+
+def run_checker(log, df_input, df_590, df_MCTO, df_program, snapshot, metrics, workers=1, check_empty=True):
+    '''
+    Run check() on the whole job, or on shards of the CHECKER rows (utils.checker_shards.shard_rows) in a process pool
+    when workers > 1, workers = 0 uses all cores. Return the list of (df_checker, df_checker_extra) to merge_results()
+    '''
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    shards = shard_rows(df_input, workers * 4) if workers > 1 else []
+    if len(shards) <= 1:
+        return [check(log, df_input, df_590, df_MCTO, df_program, snapshot, metrics, check_empty=check_empty)]
+
+    # Check that 590/MCTO is having any data for the whole job, a shard may have none
+    df_590_MCTO_PV = df_input[['BOM', 'MCTO', 'PV']].drop_duplicates()
+    if check_empty and (len(df_590.merge(df_590_MCTO_PV, how='inner', on='BOM')) < 1 or len(df_MCTO.merge(df_590_MCTO_PV, how='inner', on=['MCTO', 'PV'])) < 1):
+        raise ConnectionAbortedError (f"df_590_all or df_MCTO_all is empty, force exiting application...")
+
+    log.info(f"Algorithm 1-7: Checking {str(len(df_input))} rows in {str(len(shards))} shards with {str(workers)} workers...")
+    metrics.start('Algorithm 1-7 sharded', rows_in=len(df_input))
+    shard_inputs = []
+    for rows in shards:
+        df_shard = df_input.iloc[rows]
+        programs = set(df_shard['PNP_PROGRAM_SIDE1']).union(df_shard['PNP_PROGRAM_SIDE2'].dropna())
+        mcto_pv = pd.MultiIndex.from_frame(df_shard[['MCTO', 'PV']])
+        shard_inputs.append((df_shard,
+                             df_590[df_590['BOM'].isin(df_shard['BOM'])],
+                             df_MCTO[pd.MultiIndex.from_frame(df_MCTO[['MCTO', 'PV']]).isin(mcto_pv)],
+                             df_program[df_program['PROGRAM_NAME'].isin(programs)]))
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+        results = list(executor.map(check_shard, *zip(*shard_inputs)))
+    metrics.stop('Algorithm 1-7 sharded', rows_out=sum(len(df_checker) for df_checker, _ in results))
+    return results
+
+
+def merge_results(results):
+    '''
+    Merge the (df_checker, df_checker_extra) of disjoint BOM/program groups of rows into one (df_checker, df_checker_extra),
+    sorting on the output keys restores the order of a single check, df_checker_extra is None if there is no extra part
+    '''
+    output_keys = ['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR', 'REFDES_QTY', 'PROGRAM_QTY', 'SAP_QTY_TALLY?', 'PROGRAM_QTY_TALLY?', 'CHECKER']
+    merged = []
+    for frames in zip(*results):
+        frames = [df for df in frames if df is not None]
+        if len(frames) > 1:
+            # Empty frames would change the dtypes of the concat
+            frames = [df for df in frames if len(df) > 0] or frames[:1]
+        if len(frames) > 1:
+            merged.append(pd.concat(frames, ignore_index=True).sort_values(by=output_keys, ignore_index=True))
+        else:
+            merged.append(frames[0] if len(frames) > 0 else None)
+    return tuple(merged)
+
+
+def manifest_dependencies(manifest, df_input, file_program, program_ids=None, file_590=None, file_MCTO=None, df_590=None, df_MCTO=None):
+    '''
+    Return the input hashes of each row of df_input for CheckManifest.plan(): the program files matching its side 1/side 2
+    programs by name, or by Board id with program_ids {file: Board id} of the program catalog, and the BOM_590/MCTO files
+    matching its BOM/MCTO by name (manual) or its rows of df_590/df_MCTO (SAP database)
+    '''
+    # Files matched by each BOM, MCTO and program, each file name is matched once
+    matcher = NameMatcher(pd.concat([df_input[column] for column in ('BOM', 'MCTO', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2')]))
+    matched_files = {}
+    for files, domain in ((file_program, 'PROGRAM'), (file_590 or [], 'BOM'), (file_MCTO or [], 'MCTO')):
+        for file in files:
+            if domain == 'PROGRAM' and program_ids is not None:
+                patterns = [program_ids[file]]
+            else:
+                patterns = matcher.find(os.path.basename(file))
+            for pattern in patterns:
+                matched_files.setdefault((domain, pattern), set()).add(file)
+    def matched(domain, patterns):
+        files = set().union(*(matched_files.get((domain, str(pattern)), ()) for pattern in patterns if not pd.isna(pattern)))
+        return [manifest.file_digest(file) for file in files]
+
+    if df_590 is not None:
+        digests_590 = manifest.data_digests(df_590, 'BOM')
+        digests_MCTO = manifest.data_digests(df_MCTO, ['MCTO', 'PV'])
+
+    dependencies = []
+    for BOM, MCTO, PV, side1, side2 in df_input[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2']].itertuples(index=False):
+        row = matched('PROGRAM', [side1, side2])
+        if df_590 is None:
+            row += matched('BOM', [BOM]) + matched('MCTO', [MCTO])
+        else:
+            row += [f"SAP_590:{digests_590.get(BOM, '')}", f"SAP_MCTO:{digests_MCTO.get((MCTO, PV), '')}"]
+        dependencies.append(row)
+    return dependencies
+
+
+def main(log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns, args=None, job=None, metrics=None, warm=None, output_format=None):
+    '''main, warm is the WarmCache kept across the runs of watch mode, output_format is resolved from args and job when not given'''
+
+    if args is None:
+        args = get_args([])
+
+    if job is None:
+        job_start = time.perf_counter()
+        job = load_job(path_checker)
+        log.info(f"Loaded checker job {path_checker} in {time.perf_counter() - job_start:.3f}s")
+
+    log.info(f"BOM_590 folder = {path_590}")
+    log.info(f"MCTO folder = {path_MCTO}")
+    log.info(f"program folder = {path_program}")
+    log.info(f"Checker file = {path_checker}")
+
+    try:
+        SAP_SOURCE = job.setting('SAP_SOURCE')
+    except (ValueError, KeyError):
+        log.warning('SAP_SOURCE is not defined in settings, setting to manual...')
+        SAP_SOURCE = 'manual'
+
+    log.info(f"SAP_SOURCE = {SAP_SOURCE}")
+
+    parse_workers = args.workers
+    if parse_workers is None:
+        try:
+            parse_workers = job.setting('PARSE_WORKERS', int)
+        except (ValueError, KeyError):
+            log.debug('PARSE_WORKERS is not defined in settings, setting to 1...')
+            parse_workers = 1
+
+    log.info(f"PARSE_WORKERS = {parse_workers}")
+
+    try:
+        program_cache_mb = job.setting('PROGRAM_CACHE_MB', float)
+    except (ValueError, KeyError):
+        log.debug('PROGRAM_CACHE_MB is not defined in settings, setting to 512...')
+        program_cache_mb = 512
+
+    if args.no_cache:
+        program_cache_mb = 0
+
+    log.info(f"PROGRAM_CACHE_MB = {program_cache_mb}")
+
+    if output_format is None:
+        output_format = get_output_format(log, job, args)
+
+    check_workers = args.check_workers
+    if check_workers is None:
+        try:
+            check_workers = job.setting('CHECK_WORKERS', int)
+        except (ValueError, KeyError):
+            log.debug('CHECK_WORKERS is not defined in settings, setting to 1...')
+            check_workers = 1
+
+    log.info(f"CHECK_WORKERS = {check_workers}")
+
+    report_workers = args.report_workers
+    if report_workers is None:
+        try:
+            report_workers = job.setting('REPORT_WORKERS', int)
+        except (ValueError, KeyError):
+            log.debug('REPORT_WORKERS is not defined in settings, setting to 1...')
+            report_workers = 1
+
+    log.info(f"REPORT_WORKERS = {report_workers}")
+
+    incremental = args.incremental or warm is not None
+    if not incremental:
+        try:
+            incremental = job.setting('INCREMENTAL').strip().upper() in ('Y', 'YES', 'TRUE', '1')
+        except (ValueError, KeyError):
+            log.debug('INCREMENTAL is not defined in settings, setting to N...')
+
+    log.info(f"INCREMENTAL = {'Y' if incremental else 'N'}")
+
+    program_catalog = False
+    try:
+        program_catalog = job.setting('PROGRAM_CATALOG').strip().upper() in ('Y', 'YES', 'TRUE', '1')
+    except (ValueError, KeyError):
+        log.debug('PROGRAM_CATALOG is not defined in settings, setting to N...')
+
+    log.info(f"PROGRAM_CATALOG = {'Y' if program_catalog else 'N'}")
+
+    try:
+        snapshot_every = job.setting('SNAPSHOT_EVERY', int)
+    except (ValueError, KeyError):
+        log.debug('SNAPSHOT_EVERY is not defined in settings, setting to 1...')
+        snapshot_every = 1
+
+    try:
+        snapshot_names = {name.strip() for name in job.setting('SNAPSHOT_NAMES').split(',') if name.strip() != ''}
+    except (ValueError, KeyError):
+        log.debug('SNAPSHOT_NAMES is not defined in settings, snapshotting all dataframes...')
+        snapshot_names = None
+
+    try:
+        snapshot_path = f"{path_main}\\Log\\{job.setting('SNAPSHOT_FILE').strip()}"
+    except (ValueError, KeyError):
+        log.debug('SNAPSHOT_FILE is not defined in settings, writing snapshots into the main log...')
+        snapshot_path = None
+
+    snapshot = Snapshot(log, every=snapshot_every, names=snapshot_names, path=snapshot_path)
+    log.debug(f"Debug snapshots: every = {snapshot_every}, names = {snapshot_names}, file = {snapshot_path}")
+
+    # Run metrics are written by the caller when it passes its own, so failed runs are reported too
+    write_metrics = metrics is None
+    if metrics is None:
+        metrics = RunMetrics(log, trace_memory=metrics_trace_memory(job, log))
+
+    exclude_comp_prefix = ('590', '550', '540', '542', '561', '562', 'ECN')
+
+    # Read main excel workbook
+    log.info('Reading checker file...')
+    metrics.start('Checker input', rows_in=len(job.df_input))
+    # try:
+    #     # the excel file is not opened
+    #     workbook = xw.Book(path_checker)
+    # except:
+    #     # the excel file is opened
+    #     workbook = xw.Book(filename_checker)
+    # inputSheet = workbook.sheets['PNP_PROGRAM_CHECKER_INPUT'].used_range.value
+
+    # Create df_input for input sheet
+    log.info('Creating dataframe for input sheet...')
+    # df_input = pd.DataFrame(inputSheet)
+    df_input = job.df_input.copy()
+
+    # log.debug('Transposing df_input, keep 1st 4 rows and retransposing...')
+    # df_input = df_input.T.head(4).T
+
+    # df_input.columns = df_input.iloc[0]
+    # log.debug('Stripping off 1st header row...')
+    # df_input = df_input[1:]
+
+    log.debug('Trimming all input columns...')
+    for input_column in input_columns:
+        df_input[input_column] = df_input[input_column].astype(str)
+        df_input[input_column] = df_input[input_column].str.strip().str.upper().str.lstrip('0')
+    df_input = df_input.replace([' '], ['']).replace(['NAN'], ['']).replace([''], [np.NaN], regex=True)
+    snapshot(df_input, 'df_input')
+
+    log.debug('Dropping null rows...')
+    df_input.dropna(how='any', subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1'], inplace=True)
+    snapshot(df_input, 'df_input')
+
+    if len(df_input) < 1:
+        raise ConnectionAbortedError ('There is no input to be processed, force exiting application...')
+
+    log.debug('Dropping duplicates...')    
+    df_input.drop_duplicates(subset=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2'], keep='first', inplace=True)
+    snapshot(df_input, 'df_input')
+
+    log.debug('Removing duplicates of selected 590, MCTO, program...')
+    selected_590 = set(df_input['BOM'])
+    selected_MCTO = set(df_input['MCTO'])
+    try:
+        selected_program = (set(df_input['PNP_PROGRAM_SIDE1']).union(set(df_input['PNP_PROGRAM_SIDE2']))).remove('')
+    except KeyError:
+        selected_program = (set(df_input['PNP_PROGRAM_SIDE1']).union(set(df_input['PNP_PROGRAM_SIDE2'])))
+
+    # log.debug('Hardcoding selected files...')
+    # selected_590 = {'590-624664'}
+    # selected_MCTO = {'705043'}
+    # selected_program = {'3440CB-PD0-M5-IT', '3440CB-SD0-M5-IT'}
+
+    log.info(f"Selected_590 = {selected_590}")
+    log.info(f"Selected_MCTO = {selected_MCTO}")
+    log.info(f"Selected_program = {selected_program}")
+    metrics.stop('Checker input', rows_out=len(df_input))
+
+    metrics.start('Program scan')
+    catalog = None
+    if program_catalog:
+        # Program files resolved by their Board id from the catalog, only changed folders are listed again
+        catalog = None if warm is None else warm.catalog
+        if catalog is None:
+            catalog = ProgramCatalog(f"{path_main}\\Cache\\catalog", log)
+        if warm is not None:
+            warm.catalog = catalog
+        if args.clear_cache:
+            catalog.clear()
+        catalog.refresh(path_program, full=args.verify_cache)
+        resolved = catalog.resolve(selected_program)
+        catalog.save()
+        unresolved = sorted(program for program in selected_program if isinstance(program, str) and program not in resolved)
+        if unresolved:
+            log.warning(f"No program file has Board id {unresolved}")
+        file_program = set().union(*resolved.values())
+    else:
+        # Recursively call scandir inclusive of subfolders for filename matching
+        file_program = set(scan_program_files(path_program, NameMatcher(selected_program)))
+    metrics.stop('Program scan', rows_out=len(file_program))
+    program_ids = None if catalog is None else {file: catalog.board_id(file) for file in file_program}
+
+    # Rows whose input files or SAP data are unchanged since the last incremental run are carried forward
+    manifest = None
+    dirty = None
+    if incremental:
+        manifest = None if warm is None else warm.manifest
+        if manifest is None:
+            manifest = CheckManifest(f"{path_main}\\Cache\\manifest", log)
+        if warm is not None:
+            warm.manifest = manifest
+        if args.clear_cache:
+            manifest.clear()
+
+    bom_columns = ['BOM', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR']
+    mcto_columns = ['MCTO', 'PV', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR']
+
+    metrics.start('SAP load', rows_in=len(selected_590) + len(selected_MCTO))
+    df_590, df_MCTO = None, None
+    sap_queries = {}
+    if SAP_SOURCE == 'manual':
+
+        # Scan for the selected files only to save resources
+        log.info('Scanning files_590 and files_MCTO...')
+        scan_files_590 = os.scandir(path_590)
+        scan_files_MCTO = os.scandir(path_MCTO)
+
+        matcher_590 = NameMatcher(selected_590)
+        matcher_MCTO = NameMatcher(selected_MCTO)
+        file_590 = {f.path for f in scan_files_590 if f.name[-4:].lower() == '.csv' and matcher_590.search(f.name)}
+        file_MCTO = {f.path for f in scan_files_MCTO if f.name[-4:].lower() == '.csv' and matcher_MCTO.search(f.name)}
+
+        log.info(f"Matched file_590 = {file_590}")
+        log.info(f"Matched file_MCTO = {file_MCTO}")
+
+        # Continue only if at least one 590,MCTO file is found
+        if len(file_590) < 1 and len(file_590) < 1:
+            df_checker_all = pd.DataFrame(columns=output_columns)
+            df_checker_all.to_excel(f"{path_main}\\SCRIPT_OUTPUT.xksx", sheet_name='OUTPUT', index=False)
+            raise ConnectionAbortedError ('There is no selected 590 or MCTO file found, force exiting application...')
+
+        if manifest is not None:
+            metrics.start('Check manifest', rows_in=len(df_input))
+            dirty = manifest.plan(df_input, manifest_dependencies(manifest, df_input, file_program, program_ids=program_ids, file_590=file_590, file_MCTO=file_MCTO))
+            metrics.stop('Check manifest', rows_out=int(dirty.sum()))
+
+            log.debug('Reading only the 590, MCTO files of the rows to check...')
+            matcher_590 = NameMatcher(df_input['BOM'][dirty])
+            matcher_MCTO = NameMatcher(df_input['MCTO'][dirty])
+            file_590 = {f for f in file_590 if matcher_590.search(os.path.basename(f))}
+            file_MCTO = {f for f in file_MCTO if matcher_MCTO.search(os.path.basename(f))}
+
+        # Combine all files_590
+        log.info(f"Starting to read {str(len(file_590))} BOM_590 files...")
+        df_590 = read_report_files(log, file_590, '590', bom_columns, exclude_comp_prefix, snapshot, report_workers, warm)
+        snapshot(df_590, 'df_590')
+        log.info(f"Total of {str(len(df_590))} rows detected in BOM_590 files.")
+
+        # Combine all MCTO files
+        log.info(f"Starting to read {str(len(file_MCTO))} MCTO files...")
+        df_MCTO = read_report_files(log, file_MCTO, 'MCTO', mcto_columns, exclude_comp_prefix, snapshot, report_workers, warm)
+        snapshot(df_MCTO, 'df_MCTO')
+        log.info(f"Total of {str(len(df_MCTO))} rows detected in MCTO files.")
+
+        if manifest is not None:
+            # Only the files of the rows to check are read, these may have none
+            if len(df_590.columns) == 0:
+                df_590 = pd.DataFrame(columns=bom_columns)
+            if len(df_MCTO.columns) == 0:
+                df_MCTO = pd.DataFrame(columns=mcto_columns)
+
+    else:
+        log.info('Loading SAP database...')
+        from settings import DB_TYPE, DB_HOST, DB_DATABASE, DB_USERNAME, DB_PASSWORD
+        from utils.database import Database
+        from utils.sap_snapshot import SapSnapshot
+
+        try:
+            db_batch_size = job.setting('DB_BATCH_SIZE', int)
+        except (ValueError, KeyError):
+            log.debug('DB_BATCH_SIZE is not defined in settings, setting to 1000...')
+            db_batch_size = 1000
+
+        try:
+            db_fetch_size = job.setting('DB_FETCH_SIZE', int)
+        except (ValueError, KeyError):
+            log.debug('DB_FETCH_SIZE is not defined in settings, setting to 50000...')
+            db_fetch_size = 50000
+
+        try:
+            sap_snapshot_ttl = job.setting('SAP_SNAPSHOT_TTL', float)
+        except (ValueError, KeyError):
+            log.debug('SAP_SNAPSHOT_TTL is not defined in settings, setting to 0...')
+            sap_snapshot_ttl = 0
+
+        if args.refresh_sap:
+            sap_snapshot_ttl = 0
+
+        sap_offline = 'Y' if args.offline else None
+        if sap_offline is None:
+            try:
+                sap_offline = job.setting('SAP_OFFLINE').strip().upper()
+            except (ValueError, KeyError):
+                log.debug('SAP_OFFLINE is not defined in settings, setting to N...')
+                sap_offline = 'N'
+
+        if sap_offline not in ('Y', 'N', 'AUTO'):
+            log.warning(f"SAP_OFFLINE = {sap_offline} is not Y, N or AUTO, setting to N...")
+            sap_offline = 'N'
+
+        log.info(f"DB_BATCH_SIZE = {db_batch_size}")
+        log.info(f"DB_FETCH_SIZE = {db_fetch_size}")
+        log.info(f"SAP_SNAPSHOT_TTL = {sap_snapshot_ttl}")
+        log.info(f"SAP_OFFLINE = {sap_offline}")
+
+        # Init database
+        database = Database(
+            db_type = DB_TYPE,
+            db_host = DB_HOST,
+            db_database = DB_DATABASE,
+            db_username = DB_USERNAME,
+            db_password = DB_PASSWORD
+        )
+
+        # Every run snapshots the queried rows per BOM/MCTO, rows younger than SAP_SNAPSHOT_TTL hours are served from it
+        sap_store = SapSnapshot(f"{path_main}\\Cache\\sap", log, ttl_hours=sap_snapshot_ttl)
+        if args.clear_cache:
+            sap_store.clear()
+
+        table_item = database.table_name('SAP_PP', 'dbo', 'SAP_BOM_item')
+        table_header = database.table_name('SAP_PP', 'dbo', 'SAP_BOM_header')
+
+        query_BOM_590 = '''
+                    SELECT bh.SAP_mat_no as BOM, 
+                        bi.compnt_no as COMPONENT, bi.compnt_desc as COMPDESC, 
+                        CASE
+                            WHEN CAST(bi.compnt_qty as INT) >= 1000 THEN CAST(CAST(bi.compnt_qty as INT)/1000 as INT)
+                            ELSE CAST(bi.compnt_qty as INT)
+                        END as QUANTITY, 
+                        bi.item_text as DESIGNATOR
+                    FROM {item} bi
+                    inner join {header} bh on bi.BOM_no = bh.BOM_no
+                    where bh.SAP_mat_no in ({params});
+                '''
+
+        query_MCTO = '''
+                    SELECT REPLACE(bh.SAP_mat_no, '000000000000', '') as MCTO, bi.alt_BOM_type as PV,
+                        bi.compnt_no as COMPONENT, bi.compnt_desc as COMPDESC, 
+                        CASE
+                            WHEN CAST(bi.compnt_qty as INT) >= 1000 THEN CAST(CAST(bi.compnt_qty as INT)/1000 as INT)
+                            ELSE CAST(bi.compnt_qty as INT)
+                        END as QUANTITY, 
+                        bi.item_text as DESIGNATOR
+                    FROM {item} bi
+                    inner join {header} bh on bi.BOM_no = bh.BOM_no and bi.alt_BOM_type = bh.alt_BOM_type
+                    where REPLACE(bh.SAP_mat_no, '000000000000', '') in ({params});
+                '''
+
+        # Each query runs on its own connection, opened only if a selection is not in the snapshot and queried in batches under
+        # the parameter limit, in the background while the program files are parsed
+        log.info('Running query_BOM_590 and query_MCTO...')
+        loader_options = {'batch_size': db_batch_size, 'fetch_size': db_fetch_size, 'store': sap_store, 'offline': sap_offline}
+        executor = ThreadPoolExecutor(max_workers=2)
+        sap_queries = {
+            'query_BOM_590': executor.submit(read_sap_query, log, database, 'query_BOM_590', query_BOM_590, selected_590, 'BOM', loader_options, item=table_item, header=table_header),
+            'query_MCTO': executor.submit(read_sap_query, log, database, 'query_MCTO', query_MCTO, selected_MCTO, 'MCTO', loader_options, item=table_item, header=table_header),
+        }
+        executor.shutdown(wait=False)
+
+        if manifest is not None:
+            # The rows to check are planned from the SAP data, it cannot overlap the program parse
+            df_590, df_MCTO = wait_sap_queries(log, sap_queries, bom_columns, mcto_columns, exclude_comp_prefix, snapshot)
+            metrics.start('Check manifest', rows_in=len(df_input))
+            dirty = manifest.plan(df_input, manifest_dependencies(manifest, df_input, file_program, program_ids=program_ids, df_590=df_590, df_MCTO=df_MCTO))
+            metrics.stop('Check manifest', rows_out=int(dirty.sum()))
+    # The SAP queries run while the programs are parsed, a run ending before they are waited for still waits for their connections
+    try:
+        if df_590 is not None:
+            metrics.stop('SAP load', rows_out=len(df_590) + len(df_MCTO))
+
+        log.info(f"Matched file_program = {file_program}")
+
+        # Continue only if at least one program file is found
+        if len(file_program) < 1:
+            df_checker_all = pd.DataFrame(columns=output_columns)
+            df_checker_all.to_excel(f"{path_main}\\SCRIPT_OUTPUT.xksx", sheet_name='OUTPUT', index=False)
+            raise ConnectionAbortedError ('There is no selected program file found, force exiting application...')
+
+        # SCRIPT_OUTPUT_PROGRAM is only rewritten when the program files or the output format changed since it was written
+        write_program_output = True
+        if manifest is not None:
+            program_inputs = [manifest.file_digest(file) for file in file_program] + [f"OUTPUT_FORMAT:{output_format}"]
+            write_program_output = not manifest.output_current('SCRIPT_OUTPUT_PROGRAM', program_inputs)
+            if not write_program_output:
+                log.info('SCRIPT_OUTPUT_PROGRAM is up to date, reading only the program files of the rows to check...')
+                programs_to_check = set(df_input['PNP_PROGRAM_SIDE1'][dirty]).union(df_input['PNP_PROGRAM_SIDE2'][dirty].dropna())
+                if program_ids is not None:
+                    file_program = {f for f in file_program if program_ids[f] in programs_to_check}
+                else:
+                    matcher_program = NameMatcher(programs_to_check)
+                    file_program = {f for f in file_program if matcher_program.search(os.path.basename(f))}
+
+        # Combining all program files
+        program_cache = None
+        if warm is not None and warm.programs is not None:
+            program_cache = warm.programs
+        elif program_cache_mb > 0:
+            try:
+                program_cache = ProgramCache(f"{path_main}\\Cache\\program", program_cache_mb, log)
+            except ImportError as IE:
+                log.warning(f"Program cache is disabled, {str(IE)}")
+
+        if warm is not None:
+            program_cache = warm.program_cache(program_cache, log)
+
+        if program_cache is not None:
+            if args.clear_cache:
+                program_cache.clear()
+            if args.verify_cache:
+                program_cache.verify()
+
+        log.info(f"Starting to read {str(len(file_program))} program files with {str(parse_workers)} workers...")
+        parse_start = time.perf_counter()
+        metrics.start('Program parse', rows_in=len(file_program))
+        all_feeder_items = RecordBuffer(feeder_columns)
+        all_action_items = RecordBuffer(action_columns)
+        for file, feeder_items, action_items in parse_programs(file_program, workers=parse_workers, cache=program_cache):
+            log.info(f"Read: {file}, {str(len(feeder_items))} feeder lanes and {str(len(action_items))} picks")
+            all_feeder_items.extend(feeder_items)
+            all_action_items.extend(action_items)
+        log.info(f"Read {str(len(file_program))} program files in {time.perf_counter() - parse_start:.3f}s")
+
+        if program_cache is not None:
+            program_cache.save()
+
+        log.debug('Decoding all_feeder_items into df_feeder...')
+        df_feeder = all_feeder_items.to_frame()
+        snapshot(df_feeder, 'df_feeder')
+
+        log.debug('Decoding all_action_items into df_action...')
+        df_action = all_action_items.to_frame()
+        metrics.stop('Program parse', rows_out=len(df_feeder) + len(df_action))
+
+        metrics.start('Program summary', rows_in=len(df_feeder) + len(df_action))
+        snapshot(df_action, 'df_action')
+
+        log.debug('Inner joining df_feeder into df_action...')
+        df_feeder_action = df_action.merge(df_feeder, how='inner', left_on=['PROGRAM_NAME', 'MACHINE', 'SECTION_NUMBER', 'FEEDER_NUMBER', 'LANE_NUMBER'], right_on=['PROGRAM_NAME', 'MACHINE', 'SECTION_NUMBER', 'FEEDER_NUMBER', 'LANE_NUMBER'])
+        df_feeder_action = df_feeder_action[['PROGRAM_NAME', 'MACHINE', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER', 'SHAPE', 'SECTION_NUMBER', 'FEEDER_NUMBER', 'LANE_NUMBER', 'ROBOT_NUMBER', 'HEAD_NUMBER', 'FEEDER_TYPE', 'TROLLEY_TYPE']]
+        snapshot(df_feeder_action, 'df_feeder_action')
+
+        log.debug('Dropping duplicates...')
+        df_program = df_feeder_action.drop_duplicates(subset=['PROGRAM_NAME', 'MACHINE', 'COMPONENT', 'DESIGNATOR','BOARD_NUMBER'], keep='last')
+        snapshot(df_program, 'df_program')
+
+        log.debug('Sorting df_program...')
+        df_program = df_program.sort_values(by=['PROGRAM_NAME', 'MACHINE', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER'])
+        snapshot(df_program, 'df_program')
+
+        df_program_detail = df_program
+
+        log.debug('Adding LOCATION column...')
+        df_program = df_program.copy(deep=False)
+        df_program['LOCATION'] = 'Board: ' + df_program['BOARD_NUMBER']  + ', Machine: ' + df_program['MACHINE'] + ', Section: ' + df_program['SECTION_NUMBER'] + ', Feeder: ' + df_program['FEEDER_NUMBER'] + ', Lane: ' + df_program['LANE_NUMBER'] + ', Robot: ' + df_program['ROBOT_NUMBER'] + ', Head: ' + df_program['HEAD_NUMBER'] + ' (' + df_program['FEEDER_TYPE'] + ', ' + df_program['TROLLEY_TYPE'] + ')'
+        df_program = df_program[['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'SHAPE', 'BOARD_NUMBER', 'LOCATION']]
+        snapshot(df_program, 'df_program')
+
+        log.debug('Grouping location...')
+        df_program = df_program.groupby(['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'SHAPE']).aggregate({'BOARD_NUMBER': lambda x: ','.join(sorted(x)) , 'LOCATION': lambda x: '\n'.join(sorted(x))}).reset_index()
+        snapshot(df_program, 'df_program')
+
+        metrics.stop('Program summary', rows_out=len(df_program))
+
+        if write_program_output:
+            log.info('Writing df_program detail and summary into SCRIPT_OUTPUT_PROGRAM ...')
+            metrics.start('Program output write', rows_in=len(df_program_detail) + len(df_program))
+            files_program_output = write_output(f"{path_main}\\SCRIPT_OUTPUT_PROGRAM", {'DETAIL': df_program_detail, 'SUMMARY': df_program}, output_format, log)
+            metrics.stop('Program output write')
+            if manifest is not None:
+                manifest.record_output('SCRIPT_OUTPUT_PROGRAM', program_inputs, files_program_output)
+        del df_program_detail
+
+        log.info(f"Total of {str(len(df_program))} rows detected in program files.")
+
+        if df_590 is None:
+            log.info('Waiting for query_BOM_590 and query_MCTO...')
+            df_590, df_MCTO = wait_sap_queries(log, sap_queries, bom_columns, mcto_columns, exclude_comp_prefix, snapshot)
+            metrics.stop('SAP load', rows_out=len(df_590) + len(df_MCTO))
+    finally:
+        drain_sap_queries(log, sap_queries)
+    log.info('All selected input files are successfully loaded, proceeding with the checking algorithm...')
+
+    if manifest is None:
+        results = run_checker(log, df_input, df_590, df_MCTO, df_program, snapshot, metrics, check_workers)
+    else:
+        # Same empty check as a full run, rows carried forward count with the 590/MCTO rows they matched last run
+        has_590, has_MCTO = manifest.has_data(df_590, df_MCTO)
+        if not has_590 or not has_MCTO:
+            raise ConnectionAbortedError (f"df_590_all or df_MCTO_all is empty, force exiting application...")
+        results = []
+        if dirty.any():
+            results = run_checker(log, df_input[dirty], df_590, df_MCTO, df_program, snapshot, metrics, check_workers, check_empty=False)
+        results.append(manifest.carried())
+
+    df_checker, df_checker_extra = merge_results(results)
+    if manifest is not None:
+        manifest.record(df_checker, df_checker_extra)
+
+    if df_checker_extra is None:
+        df_checker_all = df_checker
+    else:
         log.debug('Concating df_checker and df_checker_extra...')
         df_checker_all = pd.concat([df_checker, df_checker_extra], ignore_index=True)
-        log.debug(f"\n{df_checker_all.head(5).to_string(index=False)}")
+    snapshot(df_checker_all, 'df_checker_all')
+    log.info('Writing Checker output table into SCRIPT_OUTPUT...')
+    metrics.start('Output write', rows_in=len(df_checker_all))
+    write_output(f"{path_main}\\SCRIPT_OUTPUT", {'OUTPUT': df_checker_all}, output_format, log)
+    metrics.stop('Output write')
 
-    log.info('All checking algorithm has been completed.')
-    log.info('Writing Checker output table into SCRIPT_OUTPUT.xlsx...')
-    df_checker_all.to_excel(path_main + '\\SCRIPT_OUTPUT.xlsx', sheet_name='OUTPUT', index=False)
+    if manifest is not None:
+        manifest.save()
+
+    if write_metrics:
+        metrics.write(f"{path_main}\\Log\\PNP_PROGRAM_CHECKER_metrics")
 
     log.info('Successfully completed without any errors!!!')
-    log.info('Closing application...' + '\n')
-    time.sleep(5)
 
     return
 
 
+def watch(log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns, args, job):
+    '''
+    Watch mode: run main() once, then again whenever changes in the BOM_590, MCTO, PNP_PROGRAM folders or the checker job
+    settle for WATCH_DEBOUNCE seconds. Parsed programs, SAP report frames and the check manifest stay in memory (WarmCache),
+    each run is incremental so only the affected CHECKER rows are rechecked. Runs until interrupted with Ctrl+C
+    '''
+    try:
+        watch_interval = job.setting('WATCH_INTERVAL', float)
+    except (ValueError, KeyError):
+        log.debug('WATCH_INTERVAL is not defined in settings, setting to 2...')
+        watch_interval = 2.0
+
+    try:
+        watch_debounce = job.setting('WATCH_DEBOUNCE', float)
+    except (ValueError, KeyError):
+        log.debug('WATCH_DEBOUNCE is not defined in settings, setting to 5...')
+        watch_debounce = 5.0
+
+    log.info(f"WATCH_INTERVAL = {watch_interval}")
+    log.info(f"WATCH_DEBOUNCE = {watch_debounce}")
+
+    warm = WarmCache()
+    watcher = FolderWatcher([path_590, path_MCTO, path_program], files=[path_checker], interval=watch_interval, debounce=watch_debounce, log=log)
+    path_metrics = f"{path_main}\\Log\\PNP_PROGRAM_CHECKER_metrics"
+    changed = []
+    try:
+        while True:
+            if os.path.abspath(path_checker) in changed:
+                try:
+                    job = load_job(path_checker)
+                    log.info(f"Reloaded checker job {path_checker}")
+                except (OSError, ValueError, KeyError) as e:
+                    log.warning(f"Failed to reload checker job {path_checker}, keeping the previous one, {str(e)}")
+
+            metrics = RunMetrics(log, trace_memory=metrics_trace_memory(job, log))
+            # Resolved before the run so an aborted run replaces SCRIPT_OUTPUT in the job's format
+            output_format = get_output_format(log, job, args)
+            try:
+                main(log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns, args=args, job=job, metrics=metrics, warm=warm, output_format=output_format)
+                metrics.write(path_metrics)
+
+            except ConnectionAbortedError as e:
+                log.error(f"{str(e)}")
+                df_checker_all = pd.DataFrame(columns=output_columns)
+                write_output(f"{path_main}\\SCRIPT_OUTPUT", {'OUTPUT': df_checker_all}, output_format)
+                metrics.write(path_metrics, status='aborted')
+
+            except Exception as e:
+                log.exception(f"Unexpected Error: {str(e)}")
+                df_checker_all = pd.DataFrame(columns=output_columns)
+                write_output(f"{path_main}\\SCRIPT_OUTPUT", {'OUTPUT': df_checker_all}, output_format)
+                metrics.write(path_metrics, status='failed')
+                # The manifest may be half-updated in memory, the next run reloads the last one saved
+                warm.manifest = None
+
+            # Only the first run clears/verifies the caches
+            args.clear_cache = False
+            args.verify_cache = False
+            warm.prune()
+
+            log.info(f"Watching for changes, frames warm: {str(len(warm.frames))}, programs warm: {str(len(warm.programs.entries) if warm.programs is not None else 0)}...")
+            changed = watcher.wait()
+            log.info(f"{str(len(changed))} files changed: {changed}")
+
+    except KeyboardInterrupt:
+        log.info('Watch mode stopped.')
+
+    finally:
+        watcher.close()
+
+
 if __name__ == '__main__':
-    log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns = init()
+    args = get_args()
+    log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns, job = init(args)
+    path_metrics = f"{path_main}\\Log\\PNP_PROGRAM_CHECKER_metrics"
+    if job is None:
+        # Nothing to check without the job, SCRIPT_OUTPUT is replaced in the --output-format or default format
+        log.critical('Force exiting application...')
+        output_format = get_output_format(log, CheckerJob(path_checker, {}, pd.DataFrame(columns=input_columns)), args)
+        df_checker_all = pd.DataFrame(columns=output_columns)
+        write_output(f"{path_main}\\SCRIPT_OUTPUT", {'OUTPUT': df_checker_all}, output_format)
+        RunMetrics(log).write(path_metrics, status='failed')
+        time.sleep(5)
+        sys.exit(1)
+
+    if args.watch:
+        watch(log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns, args, job)
+        log.info('Closing application...' + '\n')
+        sys.exit(0)
+
+    metrics = RunMetrics(log, trace_memory=metrics_trace_memory(job, log))
+    output_format = get_output_format(log, job, args)
     try:
-        main(log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns)
+        main(log, path_main, path_590, path_MCTO, path_program, path_checker, input_columns, output_columns, args=args, job=job, metrics=metrics, output_format=output_format)
+        metrics.write(path_metrics)
+        log.info('Closing application...' + '\n')
+        time.sleep(5)
 
     except ConnectionAbortedError as e:
         log.error(f"{str(e)}")
-        df_checker_all = pd.DataFrame(columns=[output_columns])
-        df_checker_all.to_excel(f"{path_main}\\SCRIPT_OUTPUT.xlsx", sheet_name='OUTPUT', index=False)
+        df_checker_all = pd.DataFrame(columns=output_columns)
+        write_output(f"{path_main}\\SCRIPT_OUTPUT", {'OUTPUT': df_checker_all}, output_format)
+        metrics.write(path_metrics, status='aborted')
         time.sleep(5)
         sys.exit(0)
 
     except Exception as e:
         log.critical('Force exiting application...')
         log.exception(f"Unexpected Error: {str(e)}")
-        df_checker_all = pd.DataFrame(columns=[output_columns])
-        df_checker_all.to_excel(f"{path_main}\\SCRIPT_OUTPUT.xlsx", sheet_name='OUTPUT', index=False)
+        df_checker_all = pd.DataFrame(columns=output_columns)
+        write_output(f"{path_main}\\SCRIPT_OUTPUT", {'OUTPUT': df_checker_all}, output_format)
+        metrics.write(path_metrics, status='failed')
         time.sleep(5)
\ No newline at end of file
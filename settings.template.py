@@ -3,7 +3,7 @@
 # Then, initialize your settings below!
 
 # Define db_connection here if SAP_SOURCE = "db"
-DB_TYPE = "mssql"
+DB_TYPE = "mssql" # mssql, mysql or sqlite (local stand-in, DB_DATABASE is the file path)
 DB_HOST = "localhost"
 DB_DATABASE = "db"
 DB_USERNAME = "user"
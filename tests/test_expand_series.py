@@ -0,0 +1,138 @@
+'''ExpandSeriesBatch and split_into_rows against the implementations they replaced, on seeded randomized corpora'''
+
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.Common_Functions_64 import ExpandSeries, ExpandSeriesBatch, split_into_rows
+
+
+letters = 'ABCDEFGHJKLMNPRSTUVXYZ'
+unicode_letters = 'ÄÖÜßΩЖ中'
+
+
+def random_letters(rng, alphabet=letters, low=1, high=3):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+
+def random_range(rng):
+    '''A range token: leading letter (maybe with digits), start, ending letter, dash, end repeating the letters or not'''
+    letter = random_letters(rng)
+    if rng.random() < 0.2:
+        letter = letter + str(rng.randint(0, 9)) + random_letters(rng, low=1, high=1)
+    ending = random_letters(rng, low=1, high=1) if rng.random() < 0.2 else ''
+    start = rng.randint(0, 120)
+    end = start + rng.randint(1, 12)
+    width = rng.choice([0, 0, 2, 3, 4])
+    start_text, end_text = str(start).zfill(width), str(end).zfill(width)
+    if rng.random() < 0.5:
+        return f"{letter}{start_text}{ending}-{letter}{end_text}{ending}"
+    return f"{letter}{start_text}{ending}-{end_text}"
+
+
+def malformed_range(rng):
+    '''Range tokens ExpandSeries rejects or handles by its own rules'''
+    letter = random_letters(rng)
+    start = rng.randint(1, 50)
+    return rng.choice([
+        f"{letter}{start}-{letter}{start}",
+        f"{letter}{start + 5}-{letter}{start}",
+        f"{letter}{start}-{random_letters(rng)}{start + 3}",
+        f"{letter}{start}-",
+        f"-{letter}{start}",
+        f"{letter}-{letter}",
+        f"{letter}{start}--{letter}{start + 2}",
+        f"{start}-{start + 3}",
+        f"{letter}{start}-{letter}{start + 2}-{letter}{start + 4}",
+        f"{letter}{start}A-{letter}{start + 2}B",
+        f"{letter}{start}-{letter}x{start + 2}",
+    ])
+
+
+def unicode_range(rng):
+    letter = random_letters(rng, unicode_letters + letters)
+    start = rng.randint(1, 30)
+    return rng.choice([f"{letter}{start}-{letter}{start + rng.randint(1, 5)}", f"{letter}{start}-{start + 2}", f"{letter}{start} -{start + 2}"])
+
+
+def designator_string(rng, tokens):
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        kind = rng.random()
+        if kind < 0.35:
+            parts.append(f"{random_letters(rng)}{rng.randint(1, 300)}")
+        else:
+            parts.append(rng.choice(tokens)(rng))
+    separator = rng.choice([',', ',', ', ', ' ,', ' , '])
+    S = separator.join(parts)
+    if rng.random() < 0.1:
+        S = S.replace('-', rng.choice([' -', '- ', ' - ']), 1)
+    return S
+
+
+def corpus(seed, size, tokens):
+    rng = random.Random(seed)
+    return pd.Series([designator_string(rng, tokens) for _ in range(size)])
+
+
+@pytest.mark.parametrize('name, tokens', [
+    ('well-formed', [random_range]),
+    ('malformed', [random_range, malformed_range]),
+    ('unicode', [random_range, unicode_range]),
+])
+@pytest.mark.parametrize('seed', range(5))
+def test_expand_series_batch_matches_expand_series(name, tokens, seed, capsys):
+    s = corpus(seed, 2000, tokens)
+    assert ExpandSeriesBatch(s).tolist() == s.apply(ExpandSeries).tolist()
+
+
+def test_expand_series_batch_edge_strings(capsys):
+    s = pd.Series(['', '-', ',', 'R1', 'R1-R1', 'R01-R03', 'R1-3', 'C10A-C12A', 'U1-U3,U5', 'AB1 - AB3', 'R1-R3,,R5',
+                   'R1-R3,-R5', 'R9-R11', 'R009-R011', 'R1\t-R3', 'R1-R3\n', 'R1-R3', 'Ω1-Ω3', 'R1-R1000'])
+    assert ExpandSeriesBatch(s).tolist() == s.apply(ExpandSeries).tolist()
+
+
+def split_into_rows_loop(df, column, sep=',', keep=False):
+    '''split_into_rows as it was before it was vectorized'''
+    indexes = list()
+    new_values = list()
+    df = df.dropna(subset=[column])
+    for i, presplit in enumerate(df[column].astype(str)):
+        values = presplit.split(sep)
+        if keep and len(values) > 1:
+            indexes.append(i)
+            new_values.append(presplit)
+        for value in values:
+            indexes.append(i)
+            new_values.append(value)
+    new_df = df.iloc[indexes, :].copy()
+    new_df[column] = new_values
+    return new_df
+
+
+@pytest.mark.parametrize('sep', [',', '\n', ', '])
+@pytest.mark.parametrize('keep', [False, True])
+@pytest.mark.parametrize('seed', range(5))
+def test_split_into_rows_matches_loop(sep, keep, seed):
+    rng = random.Random(seed)
+    values = []
+    for _ in range(500):
+        kind = rng.random()
+        if kind < 0.1:
+            values.append(np.NaN)
+        elif kind < 0.15:
+            values.append('')
+        elif kind < 0.2:
+            values.append(rng.randint(0, 99))
+        else:
+            values.append(sep.join(rng.choice(['R1', 'C22', '', 'U7A', 'Ω3', sep]) for _ in range(rng.randint(1, 6))))
+    df = pd.DataFrame({'KEY': range(len(values)), 'VALUE': values}, index=[f"i{rng.randint(0, 50)}" for _ in values])
+    pd.testing.assert_frame_equal(split_into_rows(df, 'VALUE', sep=sep, keep=keep), split_into_rows_loop(df, 'VALUE', sep=sep, keep=keep))
+
+
+@pytest.mark.parametrize('keep', [False, True])
+def test_split_into_rows_empty(keep):
+    df = pd.DataFrame({'KEY': [1, 2], 'VALUE': [np.NaN, None]})
+    pd.testing.assert_frame_equal(split_into_rows(df, 'VALUE', keep=keep), split_into_rows_loop(df, 'VALUE', keep=keep))
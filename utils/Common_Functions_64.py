@@ -2,10 +2,13 @@
 ''''Developed by JIAJUNLEE'''
 
 import os
+import re
 from datetime import datetime, timedelta
 import time
 import shutil
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
 from smtplib import SMTP
 import uuid
@@ -73,20 +76,33 @@ def removeExtraDelimiter(S, delimiter = ','):
     return S
             
 def split_into_rows(df, column, sep=',', keep=False):
-    '''Parse dataframe and column name, return new dataframe with splitted rows'''
-    indexes = list()
-    new_values = list()
+    '''
+    Parse dataframe and column name, return new dataframe with splitted rows
+    keep=True also keeps the unsplitted value as the first row of values having more than 1 part
+    '''
     df = df.dropna(subset=[column])
-    for i, presplit in enumerate(df[column].astype(str)):
-        values = presplit.split(sep)
-        if keep and len(values) > 1:
-            indexes.append(i)
-            new_values.append(presplit)
-        for value in values:
-            indexes.append(i)
-            new_values.append(value)
-    new_df = df.iloc[indexes, :].copy()
-    new_df[column] = new_values
+    presplit = df[column].astype(str)
+
+    # Joining then splitting once yields every part in row order, count of sep gives the parts per row
+    values = sep.join(presplit).split(sep) if len(presplit) > 0 else []
+    counts = presplit.str.count(re.escape(sep)).to_numpy(dtype=np.int64) + 1
+    repeats = counts + (counts > 1) if keep else counts
+
+    new_values = np.empty(int(repeats.sum()), dtype=object)
+    if keep:
+        # First slot of each kept row holds the unsplitted value, the parts fill the remaining slots
+        starts = np.cumsum(repeats) - repeats
+        kept = starts[counts > 1]
+        new_values[kept] = presplit.to_numpy(dtype=object)[counts > 1]
+        is_part = np.ones(len(new_values), dtype=bool)
+        is_part[kept] = False
+        new_values[is_part] = values
+    else:
+        new_values[:] = values
+
+    new_df = df.iloc[np.repeat(np.arange(len(df)), repeats), :].copy()
+    # An empty list keeps the dtype pandas always gave an empty split
+    new_df[column] = new_values if len(new_values) > 0 else []
     
     return new_df
 
@@ -348,4 +364,44 @@ def ExpandSeries(String, delimiter = ','):
     if error == True:
         expanded_S = String
     
-    return expanded_S
\ No newline at end of file
+    return expanded_S
+
+# Range token of ExpandSeries: leading letter part, start number, ending letter, dash, then the end number
+# optionally repeating the leading/ending letter (eg: AB1-AB3, C10A-C12A, U1-3)
+designator_range_pattern = re.compile(r'([A-Za-z0-9]*[A-Za-z])([0-9]+)([A-Za-z]*)-(?:\1)?([0-9]+)(?:\3)?')
+
+def ExpandSeriesBatch(series, delimiter = ','):
+    '''Parse a whole Series of designator strings and expand them like ExpandSeries, each distinct string is expanded once'''
+    expanded = {S: _ExpandSeriesCached(S, delimiter) for S in series.unique()}
+    return series.map(expanded)
+
+@lru_cache(maxsize=65536)
+def _ExpandSeriesCached(String, delimiter = ','):
+    '''Expand well-formed designator strings in one pass, anything else falls back to ExpandSeries'''
+    if not isinstance(String, str) or '-' not in String:
+        return ExpandSeries(String, delimiter)
+
+    S = String.replace(' ', '')
+
+    # Odd whitespace, control chars and dashes next to a delimiter are left to ExpandSeries
+    if ',-' in S or '-,' in S or not S.isprintable():
+        return ExpandSeries(String, delimiter)
+
+    expanded = []
+    for Part in S.split(','):
+        if '-' not in Part:
+            expanded.append(Part)
+            continue
+
+        match = designator_range_pattern.fullmatch(Part)
+        if match is None:
+            return ExpandSeries(String, delimiter)
+
+        Letter, Start, Letter_ending, End = match.groups()
+        if int(End) - int(Start) < 1:
+            return ExpandSeries(String, delimiter)
+
+        Number_len = len(Start)
+        expanded.extend(Letter + str(Number).zfill(Number_len) + Letter_ending for Number in range(int(Start), int(End) + 1))
+
+    return delimiter.join(expanded)
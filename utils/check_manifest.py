@@ -0,0 +1,192 @@
+'''Manifest of the inputs each CHECKER row was checked with, so an incremental run only rechecks rows whose inputs changed'''
+
+import os
+import json
+import pickle
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from utils.program_cache import cached_file_hash
+from utils.checker_shards import link_groups
+
+
+class CheckManifest:
+    '''
+    Usage:
+    1) manifest = CheckManifest(folder, log)
+    2) manifest.file_digest(file) / manifest.data_digests(df, by) return content hashes of the inputs a row depends on
+    3) dirty = manifest.plan(df_input, dependencies), dependencies[i] is the list of input hashes of row i,
+       dirty is a boolean array of the rows to recheck
+    4) df_checker, df_checker_extra = manifest.carried() are the prior output rows of the clean rows
+    5) manifest.has_data(df_590, df_MCTO) tells if any row matches 590/MCTO rows, the rechecked rows in df_590/df_MCTO
+    6) manifest.record(df_checker, df_checker_extra) with all output rows of this run, then manifest.save()
+
+    Rows are planned by groups of linked rows (utils.checker_shards.link_groups), a group is clean only if it has the same
+    rows with the same input hashes as in the last run, as the extra parts of a program depend on every row it is programmed for.
+    manifest.json holds the file hashes (trusted while size and mtime are unchanged), the group hashes and, per row, whether it
+    matched any 590/MCTO rows, results.pkl holds the output rows of the last run
+    '''
+
+    version = 1
+
+    def __init__(self, folder: str, log):
+        self.folder = folder
+        self.log = log
+        self.__path_manifest = os.path.join(folder, 'manifest.json')
+        self.__path_results = os.path.join(folder, 'results.pkl')
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        try:
+            with open(self.__path_manifest, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest['version'] != self.version:
+                raise ValueError(f"manifest version {manifest['version']}")
+            self.files = manifest['files']
+            self.groups = manifest['groups']
+            self.rows = manifest['rows']
+            self.outputs = manifest['outputs']
+            results = pd.read_pickle(self.__path_results)
+            self.df_checker, self.df_checker_extra = results['checker'], results['extra']
+        except (OSError, ValueError, KeyError, TypeError, EOFError, AttributeError, ImportError, pickle.UnpicklingError) as e:
+            if os.path.exists(self.__path_manifest):
+                self.log.warning(f"Check manifest is unreadable, checking every row, {str(e)}")
+            self.clear()
+
+        self.__used_files = {}
+        self.__plan = None
+        return
+
+
+    def file_digest(self, file):
+        '''Return the content hash of file, its name included as MCTO files carry the PV in it'''
+        meta = cached_file_hash(self.files, file)
+        self.__used_files[os.path.abspath(file)] = meta
+        return f"{os.path.basename(file)}:{meta['hash']}"
+
+
+    def data_digests(self, df, by):
+        '''Return {key: content hash} of the rows of df (e.g. a SAP query result) grouped by the by columns, in row order'''
+        if len(df) == 0:
+            return {}
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        digests = {}
+        for key, rows in df.groupby(by, sort=False).indices.items():
+            digests[key] = hashlib.blake2b(row_hashes[rows].tobytes(), digest_size=16).hexdigest()
+        return digests
+
+
+    def plan(self, df_input, dependencies):
+        '''Return a boolean array over the rows of df_input, True for the rows to recheck'''
+        row_keys = [row_key(values) for values in df_input[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2']].itertuples(index=False)]
+        dirty = np.ones(len(df_input), dtype=bool)
+        groups = {}
+        row_groups = {}
+        for rows in link_groups(df_input):
+            keys = sorted(row_keys[row] for row in rows)
+            group = digest('\n'.join(keys))
+            inputs = digest('\n'.join(row_keys[row] + '\n' + '\t'.join(sorted(dependencies[row])) for row in sorted(rows, key=lambda row: row_keys[row])))
+            groups[group] = inputs
+            row_groups.update((key, group) for key in keys)
+            if self.groups.get(group) == inputs and all(self.rows.get(key, {}).get('group') == group for key in keys):
+                dirty[rows] = False
+
+        self.__plan = {'row_keys': row_keys, 'groups': groups, 'row_groups': row_groups, 'dirty': dirty, 'df_input': df_input[dirty]}
+        self.log.info(f"Check manifest: {str(int(dirty.sum()))} of {str(len(dirty))} rows to check, {str(int((~dirty).sum()))} carried forward")
+        return dirty
+
+
+    def carried(self):
+        '''Return (df_checker, df_checker_extra) of the last run's output rows of the clean rows, df_checker_extra may be None'''
+        clean = {key for key, dirty in zip(self.__plan['row_keys'], self.__plan['dirty']) if not dirty}
+        results = []
+        for df in (self.df_checker, self.df_checker_extra):
+            if df is None:
+                results.append(None)
+                continue
+            keys = pd.Series([row_key(values) for values in df[['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2']].itertuples(index=False)], index=df.index, dtype=object)
+            results.append(df[keys.isin(clean)])
+        df_checker, df_checker_extra = results
+        if df_checker_extra is not None and len(df_checker_extra) < 1:
+            df_checker_extra = None
+        return df_checker, df_checker_extra
+
+
+    def has_data(self, df_590, df_MCTO):
+        '''
+        Return whether any row matches 590 rows and whether any matches MCTO rows, as the empty check of a full run,
+        the rechecked rows are matched against df_590/df_MCTO and the clean rows as in the last run
+        '''
+        df_input = self.__plan['df_input']
+        has_590 = df_input['BOM'].isin(df_590['BOM']) if 'BOM' in df_590.columns else pd.Series(False, index=df_input.index)
+        has_MCTO = pd.MultiIndex.from_frame(df_input[['MCTO', 'PV']]).isin(pd.MultiIndex.from_frame(df_MCTO[['MCTO', 'PV']])) if 'MCTO' in df_MCTO.columns else np.zeros(len(df_input), dtype=bool)
+        dirty_keys = [key for key, dirty in zip(self.__plan['row_keys'], self.__plan['dirty']) if dirty]
+        clean_keys = [key for key, dirty in zip(self.__plan['row_keys'], self.__plan['dirty']) if not dirty]
+        self.__plan['has_590'] = dict(zip(dirty_keys, np.asarray(has_590)))
+        self.__plan['has_MCTO'] = dict(zip(dirty_keys, np.asarray(has_MCTO)))
+
+        return (any(self.__plan['has_590'].values()) or any(self.rows[key]['has_590'] for key in clean_keys),
+                any(self.__plan['has_MCTO'].values()) or any(self.rows[key]['has_MCTO'] for key in clean_keys))
+
+
+    def record(self, df_checker, df_checker_extra):
+        '''Record this run's output rows, after has_data()'''
+        rows = {}
+        for key, dirty in zip(self.__plan['row_keys'], self.__plan['dirty']):
+            group = self.__plan['row_groups'][key]
+            if dirty:
+                rows[key] = {'group': group, 'has_590': bool(self.__plan['has_590'][key]), 'has_MCTO': bool(self.__plan['has_MCTO'][key])}
+            else:
+                rows[key] = dict(self.rows[key], group=group)
+        self.rows = rows
+
+        self.groups = dict(self.__plan['groups'])
+        self.files, self.__used_files = self.__used_files, {}
+        self.df_checker, self.df_checker_extra = df_checker, df_checker_extra
+        return
+
+
+    def output_current(self, name: str, inputs: list):
+        '''Return whether output name was last written from the same input hashes and its files still exist'''
+        output = self.outputs.get(name)
+        return output is not None and output['inputs'] == digest('\n'.join(sorted(inputs))) and all(os.path.exists(file) for file in output['files'])
+
+
+    def record_output(self, name: str, inputs: list, files: list):
+        '''Record that output name was written into files from the input hashes'''
+        self.outputs[name] = {'inputs': digest('\n'.join(sorted(inputs))), 'files': files}
+        return
+
+
+    def save(self):
+        '''Write manifest.json and results.pkl'''
+        pd.to_pickle({'checker': self.df_checker, 'extra': self.df_checker_extra}, f"{self.__path_results}.tmp")
+        os.replace(f"{self.__path_results}.tmp", self.__path_results)
+
+        path_tmp = f"{self.__path_manifest}.tmp"
+        with open(path_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'files': self.files, 'groups': self.groups, 'rows': self.rows, 'outputs': self.outputs}, f)
+        os.replace(path_tmp, self.__path_manifest)
+        self.log.info(f"Check manifest saved with {str(len(self.rows))} rows in {str(len(self.groups))} groups.")
+
+
+    def clear(self):
+        '''Forget every prior run, all rows are rechecked'''
+        self.files = {}
+        self.groups = {}
+        self.rows = {}
+        self.outputs = {}
+        self.df_checker, self.df_checker_extra = None, None
+
+
+def row_key(values):
+    '''Key of a CHECKER row from its BOM, MCTO, PV, side 1 and side 2 programs, blank for null'''
+    return '\t'.join('' if pd.isna(value) else str(value) for value in values)
+
+
+def digest(text: str):
+    '''Return blake2b hash of text'''
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
@@ -0,0 +1,58 @@
+'''Checker job: the settings and CHECKER input rows of one run, loaded once from CHECKER.xlsx or a plain job file'''
+
+import json
+
+import pandas as pd
+
+
+class CheckerJob:
+    '''
+    Usage:
+    1) job = load_job(path), path is CHECKER.xlsx or a .csv/.json job file
+    2) job.setting('PARSE_WORKERS', int) returns the setting as int, KeyError if not defined, ValueError if not an int
+    3) job.df_input is the CHECKER sheet with the input_columns
+
+    Job files for headless runs:
+    - .csv has the CHECKER rows only (BOM, MCTO, PV, PNP_PROGRAM_SIDE1, PNP_PROGRAM_SIDE2), settings fall back to defaults
+    - .json is {"settings": {"SAP_SOURCE": "manual", ...}, "CHECKER": [{"BOM": "590-624664", ...}, ...]}
+    '''
+
+    def __init__(self, path: str, settings: dict, df_input):
+        self.path = path
+        self.settings = settings
+        self.df_input = df_input
+        return
+
+
+    def setting(self, name: str, type=str):
+        '''Return setting name converted to type, KeyError if it is not defined or blank'''
+        return type(self.settings[name])
+
+
+def load_job(path: str):
+    '''Load the checker job from path, an Excel workbook is opened once for both the settings and CHECKER sheets'''
+    extension = path.rsplit('.', 1)[-1].lower()
+
+    if extension == 'csv':
+        df_settings = pd.DataFrame()
+        df_input = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+
+    elif extension == 'json':
+        with open(path, 'r', encoding='utf-8') as f:
+            content = json.load(f)
+        if isinstance(content, list):
+            content = {'CHECKER': content}
+        df_settings = pd.DataFrame([content.get('settings', {})])
+        df_input = pd.DataFrame(content['CHECKER'])
+
+    else:
+        with pd.ExcelFile(path) as workbook:
+            df_settings = workbook.parse('settings') if 'settings' in workbook.sheet_names else pd.DataFrame()
+            df_input = workbook.parse('CHECKER')
+
+    # Settings are the 1st row of the settings sheet, blank cells are not defined
+    settings = {}
+    if len(df_settings) > 0:
+        settings = {column: value for column, value in df_settings.iloc[0].items() if pd.notna(value)}
+
+    return CheckerJob(path, settings, df_input)
@@ -0,0 +1,59 @@
+'''Partition of the CHECKER rows into shards that can be checked independently'''
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+
+def link_groups(df_input):
+    '''
+    Return the groups of linked CHECKER rows as lists of row positions of df_input, in order of their first row
+    Rows sharing a BOM or a side 1/side 2 program are linked: a program's extra parts are checked against every row it
+    is programmed for, and a BOM's 590 rows are shared by all its MCTO/PV, so a group is always checked as a whole
+    '''
+    n = len(df_input)
+
+    # Union-find of rows over the BOM and program keys they carry
+    parent = list(range(n))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_row = {}
+    columns = [('BOM', df_input['BOM'].tolist()), ('PROGRAM', df_input['PNP_PROGRAM_SIDE1'].tolist()), ('PROGRAM', df_input['PNP_PROGRAM_SIDE2'].tolist())]
+    for domain, values in columns:
+        for row, value in enumerate(values):
+            if pd.isna(value):
+                continue
+            other = first_row.setdefault((domain, value), row)
+            root, other_root = find(row), find(other)
+            if root != other_root:
+                parent[max(root, other_root)] = min(root, other_root)
+
+    groups = {}
+    for row in range(n):
+        groups.setdefault(find(row), []).append(row)
+    return list(groups.values())
+
+
+def shard_rows(df_input, shards: int):
+    '''
+    Return a list of at most shards arrays of row positions of df_input, each in ascending order
+    Groups of linked rows (link_groups) are dealt largest first to the shard with the fewest rows, so the shards are
+    balanced and the partition only depends on df_input
+    '''
+    groups = link_groups(df_input)
+    if len(groups) == 0:
+        return []
+
+    heap = [(0, shard) for shard in range(min(shards, len(groups)))]
+    members = [[] for _ in heap]
+    for rows in sorted(groups, key=lambda rows: (-len(rows), rows[0])):
+        size, shard = heapq.heappop(heap)
+        members[shard].extend(rows)
+        heapq.heappush(heap, (size + len(rows), shard))
+
+    return [np.array(sorted(rows)) for rows in members if rows]
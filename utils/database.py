@@ -4,7 +4,7 @@ class Database:
 
     def __init__(self, db_type: str, db_host: str, db_database: str, db_username: str, db_password: str):
         # List of alloweed db_type
-        db_type_list = ['mysql', 'mssql']
+        db_type_list = ['mysql', 'mssql', 'sqlite']
         if db_type.lstrip().lower() not in db_type_list:
             raise NotImplementedError(f'Provided db_type is not in {db_type_list} !')
         
@@ -29,11 +29,31 @@ class Database:
                 __conn = pyodbc.connect(f'DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={self.db_host};DATABASE={self.db_database};UID={self.db_username};PWD={self.db_password}') 
                 response = f'Connected {self.db_type} to host={self.db_host}, database={self.db_database}'
                 return __conn, response
+
+            elif self.db_type.lstrip().lower() == 'sqlite':
+                # Local stand-in of the SAP database, db_database is the file path
+                import sqlite3
+                __conn = sqlite3.connect(self.db_database)
+                response = f'Connected {self.db_type} to database={self.db_database}'
+                return __conn, response
         except Exception as e:
             response = f'Failed to connect: {str(e)}'
             return None, response
         
 
+    @property
+    def placeholder(self):
+        '''Query parameter placeholder of the driver'''
+        return '%s' if self.db_type.strip().lower() == 'mysql' else '?'
+
+
+    def table_name(self, database: str, schema: str, table: str):
+        '''Return the qualified name of table, sqlite has no database/schema qualifiers'''
+        if self.db_type.strip().lower() == 'sqlite':
+            return f'[{table}]'
+        return f'[{database}].[{schema}].[{table}]'
+
+
     def run_select_query(self, cursor, query, data=None):
         if data is None:
             cursor.execute(query)
@@ -50,7 +70,72 @@ class Database:
                 response.append(row_dict)
 
         return response
-    
+
+
+    def iter_select_query(self, cursor, query, data=None, fetch_size=10000):
+        '''
+        Usage:
+        1) for rows in database.iter_select_query(cursor, query, data, fetch_size=10000): streams the result fetch_size rows at a time
+        2) each batch is a list of row tuples, the column names are in database.column_names(cursor)
+
+        Only the DB-API execute/description/fetchmany are used, so it works the same for mysql.connector, pyodbc and sqlite3.
+        mysql.connector cursors are unbuffered, iterate to the end before running another query on the connection
+        '''
+        if data is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query, data)
+        while True:
+            fetched = cursor.fetchmany(fetch_size)
+            if not fetched:
+                break
+            yield fetched
+
+
+    def column_names(self, cursor):
+        '''Column names of the last query run on cursor'''
+        return [] if cursor.description is None else [column[0] for column in cursor.description]
+
+
+    def run_select_columns(self, cursor, query, data=None, fetch_size=10000):
+        '''
+        Usage:
+        1) columns = database.run_select_columns(cursor, query, data, fetch_size=10000)
+        2) Return {column: list of values} in the order of the query's columns
+
+        Fetches fetch_size rows at a time and transposes each batch into the column lists, no dict is built per row
+        '''
+        names = None
+        values = None
+        for rows in self.iter_select_query(cursor, query, data, fetch_size):
+            if values is None:
+                names = self.column_names(cursor)
+                values = [[] for _ in names]
+            for column, batch in zip(values, zip(*rows)):
+                column.extend(batch)
+        if values is None:
+            names = self.column_names(cursor)
+            values = [[] for _ in names]
+        return dict(zip(names, values))
+
+
+    def run_select_frame(self, cursor, query, data=None, fetch_size=10000):
+        '''
+        Usage:
+        1) df = database.run_select_frame(cursor, query, data, fetch_size=10000)
+        2) Return the result as a DataFrame with the query's columns, decimal columns as float as pandas.read_sql does
+        '''
+        import decimal
+        import pandas as pd
+
+        df = pd.DataFrame(self.run_select_columns(cursor, query, data, fetch_size))
+        for column in df.columns[df.dtypes == object]:
+            # pyodbc/mysql.connector return DECIMAL/NUMERIC as decimal.Decimal objects
+            first = df[column].first_valid_index()
+            if first is not None and isinstance(df[column].at[first], decimal.Decimal):
+                df[column] = pd.to_numeric(df[column])
+        return df
+
 
     def generate_insert_statement(self, table: str, data_dict: dict, uuid_col_list: list, generate_uuid_col_name: str,
                                   primary_col_list: list, password_col_list: list):
@@ -0,0 +1,99 @@
+'''Set-based reconciliation of BOM designators against the designators mounted by the side 1/side 2 programs'''
+
+import numpy as np
+
+from utils.Common_Functions_64 import extract_num_from_end
+
+
+class DesignatorReconciler:
+    '''
+    Usage:
+    1) reconciler = DesignatorReconciler(df_program), df_program has PROGRAM_NAME, COMPONENT, DESIGNATOR, BOARD_NUMBER, LOCATION
+    2) df = reconciler.reconcile(df_checker, group_columns), df_checker has comma separated DESIGNATOR per row
+
+    Each (program, component) keeps the set of designators it mounts, with their boards and locations
+    Each group of df_checker gets the ordered set of its BOM designators, which is classified with set operations:
+    - both = BOM & side 1 & side 2, mounted twice
+    - side1 = (BOM & side 1) - side 2
+    - side2 = (BOM & side 2) - side 1
+    - missing = BOM - side 1 - side 2, not found in any program
+    '''
+
+    both_sides = 'Something wrong, both side mounting the same designator'
+    not_found = 'Not found'
+
+    def __init__(self, df_program):
+        self.__mounted = {}
+        self.__sort_keys = {}
+        columns = [df_program[column].tolist() for column in ['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER', 'LOCATION']]
+        for program, component, designator, board, location in zip(*columns):
+            designators = self.__mounted.setdefault((program, component), {})
+            boards, locations = designators.setdefault(designator, ([], []))
+            boards.append(board)
+            locations.append(location)
+        return
+
+
+    def reconcile(self, df, group_columns: list):
+        '''
+        Return one row per group of df with DESIGNATOR, CHECKER and LOCATION, sorted like a group-by on the columns
+        Rows with null DESIGNATOR or null group columns are dropped, as a group-by would
+        DESIGNATOR is de-duplicated and sorted by letter then number, CHECKER and LOCATION lines are de-duplicated and sorted
+        '''
+        df = df.dropna(subset=group_columns + ['DESIGNATOR'])
+        group_ids = df.groupby(group_columns, sort=False).ngroup().to_numpy()
+        first_rows = np.unique(group_ids, return_index=True)[1]
+
+        group_designators = [[] for _ in first_rows]
+        group_sides = [None] * len(first_rows)
+        rows = zip(group_ids, df['PNP_PROGRAM_SIDE1'].tolist(), df['PNP_PROGRAM_SIDE2'].tolist(), df['COMPONENT'].tolist(), df['DESIGNATOR'].astype(str).tolist())
+        for group_id, side1, side2, component, designators in rows:
+            group_designators[group_id].extend(designators.split(','))
+            group_sides[group_id] = (side1, side2, component)
+
+        designator_column = []
+        checker_column = []
+        location_column = []
+        for designators, (side1, side2, component) in zip(group_designators, group_sides):
+            # BOM designators of the group ordered by their last appearance, which breaks ties of equal sort keys (C01, C1)
+            designators = dict.fromkeys(reversed(designators))
+            designators = dict.fromkeys(reversed(designators))
+            mounted1 = self.__mounted.get((side1, component), {})
+            mounted2 = self.__mounted.get((side2, component), {})
+            on_side1 = designators.keys() & mounted1.keys()
+            on_side2 = designators.keys() & mounted2.keys()
+
+            checkers = set()
+            lines = set()
+            if on_side1 & on_side2:
+                checkers.add(self.both_sides)
+                lines.add(self.both_sides)
+            for side, mounted, found in (('1', mounted1, on_side1 - on_side2), ('2', mounted2, on_side2 - on_side1)):
+                for designator in found:
+                    boards, locations = mounted[designator]
+                    checkers.update(f"Mount at Side {side} on Board {board}" for board in boards)
+                    for location in locations:
+                        lines.update(f"Mount at Side {side} on {line}" for line in location.split('\n'))
+            if len(designators) > len(on_side1 | on_side2):
+                checkers.add(self.not_found)
+                lines.add(self.not_found)
+
+            designator_column.append(','.join(sorted(designators, key=self.__sort_key)))
+            checker_column.append('\n'.join(sorted(checkers)))
+            location_column.append('\n'.join(sorted(lines)))
+
+        df_result = df.iloc[first_rows][group_columns].reset_index(drop=True)
+        df_result['DESIGNATOR'] = designator_column
+        df_result['CHECKER'] = checker_column
+        df_result['LOCATION'] = location_column
+        return df_result
+
+
+    def __sort_key(self, designator):
+        '''Designator letter then number, e.g. C2 before C10'''
+        key = self.__sort_keys.get(designator)
+        if key is None:
+            number = extract_num_from_end(designator, keep='number')
+            key = (extract_num_from_end(designator, keep='letter'), int(number) if number != '' else 0)
+            self.__sort_keys[designator] = key
+        return key
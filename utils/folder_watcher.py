@@ -0,0 +1,149 @@
+'''Watch input folders for added, modified or removed files, with native change notification or by polling'''
+
+import os
+import time
+import threading
+
+
+class FolderWatcher:
+    '''
+    Usage:
+    1) watcher = FolderWatcher([path_590, path_MCTO, path_program], files=[path_checker], interval=2, debounce=5, log=log)
+    2) changed = watcher.wait() blocks until files were added, modified or removed and then nothing changed for debounce
+       seconds, so a burst of file drops is one change, returns the sorted list of changed paths
+    3) watcher.close()
+
+    Uses watchdog's native observer when it is installed, else polls the size and mtime of every file under the folders every
+    interval seconds, which also works on network shares and plain filesystems without change notification.
+    Office lock files (~$*) and partial downloads are ignored
+    '''
+
+    ignored_prefixes = ('~$', '.~')
+    ignored_suffixes = ('.tmp', '.crdownload', '.part')
+
+    def __init__(self, folders: list, files=None, interval=2.0, debounce=5.0, log=None, native=True):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.files = {os.path.abspath(file) for file in (files or [])}
+        self.interval = interval
+        self.debounce = debounce
+        self.log = log
+        self.__changed = set()
+        self.__last_change = None
+        self.__lock = threading.Lock()
+        self.__observer = None
+
+        if native:
+            try:
+                self.__observer = self.__start_observer()
+            except ImportError:
+                pass
+            except OSError as e:
+                if self.log is not None:
+                    self.log.warning(f"Native folder watching is not available, polling instead, {str(e)}")
+
+        if self.__observer is None:
+            self.__state = self.__scan()
+
+        if self.log is not None:
+            mode = 'native notification' if self.__observer is not None else f"polling every {self.interval}s"
+            self.log.info(f"Watching {', '.join(self.folders + sorted(self.files))} with {mode}, debounce {self.debounce}s")
+        return
+
+
+    def wait(self, timeout=None):
+        '''Return the changed paths once changes settled for debounce seconds, or [] after timeout seconds without any'''
+        start = time.monotonic()
+        while True:
+            if self.__observer is None:
+                self.__poll()
+
+            with self.__lock:
+                if self.__changed and time.monotonic() - self.__last_change >= self.debounce:
+                    changed = sorted(self.__changed)
+                    self.__changed.clear()
+                    return changed
+
+            if timeout is not None and time.monotonic() - start >= timeout:
+                return []
+            time.sleep(min(self.interval, self.debounce) if self.__observer is None else 0.2)
+
+
+    def close(self):
+        '''Stop the native observer'''
+        if self.__observer is not None:
+            self.__observer.stop()
+            self.__observer.join()
+            self.__observer = None
+
+
+    def watched(self, path: str):
+        '''Return whether a change of path is of interest'''
+        name = os.path.basename(path)
+        if name.startswith(self.ignored_prefixes) or name.lower().endswith(self.ignored_suffixes):
+            return False
+        path = os.path.abspath(path)
+        return path in self.files or any(path.startswith(folder + os.sep) for folder in self.folders)
+
+
+    def record(self, paths):
+        '''Record paths as changed now, the ones not watched are dropped'''
+        paths = [path for path in paths if path is not None and self.watched(path)]
+        if paths:
+            with self.__lock:
+                self.__changed.update(os.path.abspath(path) for path in paths)
+                self.__last_change = time.monotonic()
+
+
+    def __scan(self):
+        '''Return {path: (size, mtime)} of the watched files'''
+        state = {}
+        def scan(folder):
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                return
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        scan(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        state[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue
+        for folder in self.folders:
+            scan(folder)
+        for file in self.files:
+            try:
+                stat = os.stat(file)
+                state[file] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+        return state
+
+
+    def __poll(self):
+        state = self.__scan()
+        changed = [path for path in state.keys() | self.__state.keys() if state.get(path) != self.__state.get(path)]
+        self.__state = state
+        self.record(changed)
+
+
+    def __start_observer(self):
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        watcher = self
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # Opened/closed events also come from reads, e.g. the checker's own
+                if not event.is_directory and event.event_type in ('created', 'modified', 'deleted', 'moved'):
+                    watcher.record([event.src_path, getattr(event, 'dest_path', None)])
+
+        observer = Observer()
+        for folder in self.folders:
+            observer.schedule(Handler(), folder, recursive=True)
+        for folder in {os.path.dirname(file) for file in self.files} - set(self.folders):
+            observer.schedule(Handler(), folder, recursive=False)
+        observer.start()
+        return observer
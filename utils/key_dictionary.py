@@ -0,0 +1,57 @@
+'''Shared dictionary of checker join keys, encoding key strings into dense integer codes'''
+
+import numpy as np
+import pandas as pd
+
+
+class KeyDictionary:
+    '''
+    Usage:
+    1) keys = KeyDictionary()
+    2) keys.fit('PROGRAM', df_program['PROGRAM_NAME'], df_input['PNP_PROGRAM_SIDE1']), once per domain before encoding
+    3) df = keys.encode(df, {'PROGRAM_NAME': 'PROGRAM', 'COMPONENT': 'COMPONENT'}) before joining
+    4) df = keys.decode(df, {'PROGRAM_NAME': 'PROGRAM', 'COMPONENT': 'COMPONENT'}) before writing output
+
+    Codes follow the sorted order of the key strings, so sorting on codes gives the same order as sorting on strings
+    Null keys stay null (pandas Int32), so merges, dedupes and group-bys treat them exactly as null strings
+    '''
+
+    def __init__(self):
+        self.__uniques = {}
+        return
+
+
+    def fit(self, domain: str, *values):
+        '''Build the sorted unique keys of domain from the given Series'''
+        if domain in self.__uniques:
+            raise ValueError(f"Key domain {domain} is already fitted !")
+
+        uniques = pd.concat([pd.Series(v, dtype=object) for v in values], ignore_index=True).dropna().unique()
+        uniques.sort()
+        self.__uniques[domain] = pd.Index(uniques, dtype=object)
+
+
+    def encode(self, df, columns: dict):
+        '''Return df with the given {column: domain} replaced by Int32 codes'''
+        df = df.copy()
+        for column, domain in columns.items():
+            uniques = self.__uniques[domain]
+            codes = pd.Categorical(df[column], categories=uniques).codes
+            missing = (codes == -1) & df[column].notna().to_numpy()
+            if missing.any():
+                raise KeyError(f"{column} value {df[column][missing].iloc[0]} is not in key domain {domain} !")
+            df[column] = pd.arrays.IntegerArray(codes.astype(np.int32), codes == -1)
+        return df
+
+
+    def decode(self, df, columns: dict):
+        '''Return df with the given {column: domain} decoded back into strings, null codes as NaN'''
+        df = df.copy()
+        for column, domain in columns.items():
+            uniques = self.__uniques[domain]
+            codes = df[column].astype('Int32')
+            decoded = np.full(len(df), np.NaN, dtype=object)
+            mask = codes.notna().to_numpy()
+            decoded[mask] = uniques.take(codes[mask].to_numpy(dtype=np.int64))
+            df[column] = decoded
+        return df
@@ -1,5 +1,6 @@
 import os
 import logging
+from datetime import datetime
 
 
 def logger_init(filename, folder='logs', mode='a', loglevel='INFO'):
@@ -55,6 +56,48 @@ def logger_init(filename, folder='logs', mode='a', loglevel='INFO'):
 
     return logger
 
+class Snapshot:
+    '''
+    Debug snapshots of DataFrames, rendered only when the logger is enabled for DEBUG
+    Usage:
+    1) snapshot = Snapshot(log, every=1, names=None, path=None)
+    2) snapshot(df, 'df') in place of log.debug(f"\\n{df.head(5).to_string(index=False)}")
+
+    every = N renders every Nth snapshot only
+    names = {'df_checker', ...} renders snapshots of the given DataFrame names only
+    path = file to write the snapshots into instead of the main log
+    '''
+
+    def __init__(self, log, every=1, names=None, path=None, rows=5):
+        self.log = log
+        self.every = max(int(every), 1)
+        self.names = set(names) if names is not None else None
+        self.path = path
+        self.rows = rows
+        self.count = 0
+        self.__file_mode = 'w'
+        return
+
+
+    def __call__(self, df, name=''):
+        # Nothing is rendered below DEBUG, the check is all an INFO run pays
+        if not self.log.isEnabledFor(logging.DEBUG):
+            return
+        if self.names is not None and name not in self.names:
+            return
+        self.count += 1
+        if (self.count - 1) % self.every != 0:
+            return
+
+        text = f"{name}\n{df.head(self.rows).to_string(index=False)}"
+        if self.path is None:
+            self.log.debug(text, stacklevel=2)
+        else:
+            with open(self.path, self.__file_mode, encoding='utf-8') as f:
+                f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {text}\n\n")
+            self.__file_mode = 'a'
+
+
 if __name__ == '__main__':
     # Test logging
     log = logger_init('testing.log', 'logs', 'a')
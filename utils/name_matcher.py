@@ -0,0 +1,43 @@
+'''Index of the selected BOMs, MCTOs and programs to match file names against in one pass per name'''
+
+import pandas as pd
+
+
+class NameMatcher:
+    '''
+    Usage:
+    1) matcher = NameMatcher(selected_program) once per run
+    2) matcher.search(name) returns whether any pattern is a substring of name, as any(pattern in name for pattern in patterns) does
+    3) matcher.find(name) returns the set of patterns that are substrings of name
+
+    The patterns are kept in a set per length, a name is matched by looking up each of its substrings of those lengths,
+    so the cost per name depends on its length and the number of distinct pattern lengths, not on the number of patterns.
+    Null patterns are ignored, an empty pattern matches every name
+    '''
+
+    def __init__(self, patterns):
+        self.patterns = {str(pattern) for pattern in patterns if isinstance(pattern, str) or not pd.isna(pattern)}
+        self.__lengths = sorted({len(pattern) for pattern in self.patterns if pattern != ''})
+        self.__any = '' in self.patterns
+        return
+
+
+    def search(self, name: str):
+        '''Return whether any pattern is a substring of name'''
+        if self.__any:
+            return True
+        patterns = self.patterns
+        for length in self.__lengths:
+            for start in range(len(name) - length + 1):
+                if name[start:start + length] in patterns:
+                    return True
+        return False
+
+
+    def find(self, name: str):
+        '''Return the set of patterns that are substrings of name'''
+        patterns = self.patterns
+        found = {''} if self.__any else set()
+        for length in self.__lengths:
+            found.update(part for part in (name[start:start + length] for start in range(len(name) - length + 1)) if part in patterns)
+        return found
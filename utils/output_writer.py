@@ -0,0 +1,95 @@
+'''Writers for the checker output tables, as Excel workbook or columnar files'''
+
+import os
+import time
+
+import pandas as pd
+
+
+output_formats = {'excel': 'xlsx', 'parquet': 'parquet', 'feather': 'feather', 'csv': 'csv'}
+
+
+def write_output(path: str, sheets: dict, output_format='excel', log=None):
+    '''
+    Write {sheet_name: df} to path (without extension) in output_format, return the list of files written
+    excel writes one workbook with a sheet per table,
+    parquet/feather/csv write one file per table, path.<ext> for a single table, else path_<sheet_name>.<ext>
+    Files of the same tables left by another output_format are removed, so they are not mistaken for this output
+    '''
+    if output_format not in output_formats:
+        raise ValueError(f"Output format {output_format} is not one of {', '.join(output_formats)} !")
+
+    extension = output_formats[output_format]
+    start = time.perf_counter()
+
+    if output_format == 'excel':
+        files = [f"{path}.{extension}"]
+        try:
+            write_excel(files[0], sheets)
+        except ImportError:
+            # Without xlsxwriter, fall back to pandas' default engine
+            with pd.ExcelWriter(files[0]) as writer:
+                for sheet_name, df in sheets.items():
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+    else:
+        files = []
+        for sheet_name, df in sheets.items():
+            file = f"{path}.{extension}" if len(sheets) == 1 else f"{path}_{sheet_name}.{extension}"
+            if output_format == 'parquet':
+                df.to_parquet(file, index=False)
+            elif output_format == 'feather':
+                df.reset_index(drop=True).to_feather(file)
+            else:
+                df.to_csv(file, index=False, encoding='utf-8')
+            files.append(file)
+
+    remove_stale_outputs(path, sheets, files, log)
+
+    if log is not None:
+        log.info(f"Wrote {', '.join(files)} as {output_format} in {time.perf_counter() - start:.3f}s")
+    return files
+
+
+def remove_stale_outputs(path: str, sheets: dict, files: list, log=None):
+    '''Remove the files of path and its sheets in any output format other than the files just written'''
+    stale = {f"{path}.{extension}" for extension in output_formats.values()}
+    stale.update(f"{path}_{sheet_name}.{extension}" for sheet_name in sheets for extension in output_formats.values() if extension != 'xlsx')
+    for file in sorted(stale.difference(files)):
+        if not os.path.exists(file):
+            continue
+        try:
+            os.remove(file)
+            if log is not None:
+                log.info(f"Removed {file} of another output format")
+        except OSError as e:
+            if log is not None:
+                log.warning(f"Failed to remove {file} of another output format, {str(e)}")
+
+
+def write_excel(file: str, sheets: dict, chunk_size=10000):
+    '''
+    Write {sheet_name: df} into one workbook in a single session, streaming rows with xlsxwriter constant_memory,
+    only the current row is held by the writer and rows are converted chunk_size at a time, nulls as blank cells
+    '''
+    import xlsxwriter
+
+    max_rows, max_cols = 1048576, 16384
+    for sheet_name, df in sheets.items():
+        if len(df) + 1 > max_rows or len(df.columns) > max_cols:
+            raise ValueError(f"This sheet is too large! Your sheet size is: {len(df) + 1}, {len(df.columns)} Max sheet size is: {max_rows}, {max_cols}")
+
+    workbook = xlsxwriter.Workbook(file, {'constant_memory': True, 'strings_to_urls': False, 'strings_to_formulas': False})
+    try:
+        # Same header style as pandas to_excel
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        for sheet_name, df in sheets.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, [str(column) for column in df.columns], header_format)
+            row = 1
+            for start in range(0, len(df), chunk_size):
+                chunk = df.iloc[start:start + chunk_size].astype(object)
+                for values in chunk.where(chunk.notna(), None).values.tolist():
+                    worksheet.write_row(row, 0, values)
+                    row += 1
+    finally:
+        workbook.close()
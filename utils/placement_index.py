@@ -0,0 +1,49 @@
+'''Hash index over integer-coded placement keys, for membership probes without a merge'''
+
+import numpy as np
+import pandas as pd
+
+
+class PlacementIndex:
+    '''
+    Usage:
+    1) index = PlacementIndex(df_Material_expanded, ['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'DESIGNATOR'])
+    2) found = index.contains(df), boolean array True where the row's key columns are in the index
+
+    Key columns are integer codes (utils.key_dictionary.KeyDictionary), null codes match null codes like a merge does
+    The key is built one column at a time: each level maps (key so far, column code) to a dense id with a hash table,
+    so ids never overflow and a value never seen at some level rejects the probed row without looking further
+    '''
+
+    def __init__(self, df, columns: list):
+        self.columns = list(columns)
+        self.__levels = []
+        key = np.zeros(len(df), dtype=np.int64)
+        for column in self.columns:
+            values = _key_values(df[column])
+            column_index = pd.Index(pd.unique(values))
+            key = key * len(column_index) + column_index.get_indexer(values)
+            key_index = pd.Index(pd.unique(key))
+            key = key_index.get_indexer(key)
+            self.__levels.append((column_index, key_index))
+        return
+
+
+    def __len__(self):
+        return len(self.__levels[-1][1]) if self.__levels else 0
+
+
+    def contains(self, df):
+        '''Return boolean array, True where the row of df has its key columns in the index'''
+        key = np.zeros(len(df), dtype=np.int64)
+        for column, (column_index, key_index) in zip(self.columns, self.__levels):
+            codes = column_index.get_indexer(_key_values(df[column]))
+            found = (key >= 0) & (codes >= 0)
+            key[~found] = -1
+            key[found] = key_index.get_indexer(key[found] * len(column_index) + codes[found])
+        return key >= 0
+
+
+def _key_values(series):
+    '''Integer codes of series as int64, null as -1'''
+    return series.astype('Int64').to_numpy(dtype=np.int64, na_value=-1)
@@ -0,0 +1,276 @@
+'''On-disk cache of parsed program files, stored as Feather tables keyed by file content hash'''
+
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+
+from utils.program_parser import RecordBuffer
+
+
+class ProgramCache:
+    '''
+    Usage:
+    1) cache = ProgramCache(folder, max_size_mb, log)
+    2) cache.get(file) returns (feeder_buffer, action_buffer) if the file was parsed before, else None
+    3) cache.put(file, feeder_buffer, action_buffer) stores a freshly parsed file
+    4) cache.save() evicts least recently used entries above max_size_mb, writes the index and logs the hits/misses since the last save
+    5) cache.verify() / cache.clear() to drop bad entries / invalidate everything
+
+    index.json maps each program path to its size, mtime and content hash,
+    the tables are stored once per content hash as <hash>.feeder.feather and <hash>.action.feather,
+    each RecordBuffer column is kept dictionary-encoded as an Arrow dictionary column
+    '''
+
+    def __init__(self, folder: str, max_size_mb: float, log):
+        import pyarrow
+        import pyarrow.feather
+
+        self.folder = folder
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+        self.__pa = pyarrow
+        self.__feather = pyarrow.feather
+        self.__path_index = os.path.join(folder, 'index.json')
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        try:
+            with open(self.__path_index, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self.paths = index['paths']
+            self.entries = index['entries']
+        except (OSError, ValueError, KeyError):
+            self.paths = {}
+            self.entries = {}
+        return
+
+
+    def get(self, file):
+        '''Return cached (feeder_buffer, action_buffer) for file, or None on a miss'''
+        content_hash = cached_file_hash(self.paths, file)['hash']
+        if content_hash not in self.entries:
+            self.misses += 1
+            return None
+
+        try:
+            feeder_buffer = self.__read(content_hash, 'feeder')
+            action_buffer = self.__read(content_hash, 'action')
+        except (OSError, self.__pa.ArrowException):
+            self.log.warning(f"Program cache entry for {file} is unreadable, reparsing...")
+            self.__remove(content_hash)
+            self.misses += 1
+            return None
+
+        self.entries[content_hash]['last_used'] = time.time()
+        self.hits += 1
+        return feeder_buffer, action_buffer
+
+
+    def put(self, file, feeder_buffer, action_buffer):
+        '''Store parsed feeder/action buffers of file'''
+        key = os.path.abspath(file)
+        meta = self.paths.get(key)
+        if meta is None:
+            stat = os.stat(file)
+            meta = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': file_hash(file)}
+            self.paths[key] = meta
+
+        content_hash = meta['hash']
+        size = self.__write(content_hash, 'feeder', feeder_buffer)
+        size += self.__write(content_hash, 'action', action_buffer)
+        self.entries[content_hash] = {'bytes': size, 'last_used': time.time()}
+
+
+    def save(self, memory_hits=None):
+        '''Evict least recently used entries above max_size, drop stale paths, write index.json and log the hits/misses of the run,
+        memory_hits are those served by a MemoryProgramCache in front of this cache'''
+        total = sum(entry['bytes'] for entry in self.entries.values())
+        for content_hash in sorted(self.entries, key=lambda h: self.entries[h]['last_used']):
+            if total <= self.max_size:
+                break
+            total -= self.entries[content_hash]['bytes']
+            self.__remove(content_hash)
+            self.log.debug(f"Evicted program cache entry {content_hash}")
+
+        self.paths = {path: meta for path, meta in self.paths.items() if meta['hash'] in self.entries}
+
+        path_tmp = f"{self.__path_index}.tmp"
+        with open(path_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'paths': self.paths, 'entries': self.entries}, f)
+        os.replace(path_tmp, self.__path_index)
+
+        hits = f"{str(self.hits)} hits" if memory_hits is None else f"{str(memory_hits)} hits in memory, {str(self.hits)} hits on disk"
+        self.log.info(f"Program cache: {hits}, {str(self.misses)} misses, {str(len(self.entries))} entries using {total / 1024 / 1024:.1f} MB")
+        self.hits = 0
+        self.misses = 0
+
+
+    def verify(self):
+        '''Drop entries with missing/unreadable tables or whose program file no longer matches its hash, return count removed'''
+        removed = 0
+        for content_hash in list(self.entries):
+            try:
+                self.__read(content_hash, 'feeder')
+                self.__read(content_hash, 'action')
+            except (OSError, self.__pa.ArrowException):
+                self.__remove(content_hash)
+                removed += 1
+
+        for path, meta in list(self.paths.items()):
+            if meta['hash'] not in self.entries:
+                continue
+            if not os.path.exists(path) or file_hash(path) != meta['hash']:
+                del self.paths[path]
+                if not any(m['hash'] == meta['hash'] for m in self.paths.values()):
+                    self.__remove(meta['hash'])
+                    removed += 1
+
+        # Remove orphan tables not referenced by the index
+        for filename in os.listdir(self.folder):
+            if filename.endswith('.feather') and filename.split('.', 1)[0] not in self.entries:
+                os.remove(os.path.join(self.folder, filename))
+
+        self.log.info(f"Program cache verified, {str(removed)} entries removed.")
+        return removed
+
+
+    def clear(self):
+        '''Invalidate the whole cache'''
+        for content_hash in list(self.entries):
+            self.__remove(content_hash)
+        self.paths = {}
+        self.log.info('Program cache cleared.')
+
+
+    def __read(self, content_hash, table):
+        arrow_table = self.__feather.read_table(os.path.join(self.folder, f"{content_hash}.{table}.feather"))
+        buffer = RecordBuffer(arrow_table.column_names)
+        for column in buffer.columns:
+            for chunk in arrow_table.column(column).chunks:
+                # Null codes are None values, point them one past the dictionary where None is appended
+                values = chunk.dictionary.to_pylist() + [None]
+                codes = chunk.indices.fill_null(len(values) - 1).to_numpy()
+                buffer.append_codes(column, codes, values)
+        buffer.length = arrow_table.num_rows
+        return buffer
+
+
+    def __write(self, content_hash, table, buffer):
+        path = os.path.join(self.folder, f"{content_hash}.{table}.feather")
+        arrays = []
+        for column in buffer.columns:
+            codes, values = buffer.column_codes(column)
+            mask = np.zeros(len(codes), dtype=bool)
+            if None in values:
+                mask = codes == values.index(None)
+                values = ['' if value is None else value for value in values]
+            arrays.append(self.__pa.DictionaryArray.from_arrays(self.__pa.array(codes, type=self.__pa.int32(), mask=mask), self.__pa.array(values, type=self.__pa.string())))
+        self.__feather.write_feather(self.__pa.table(arrays, names=buffer.columns), path)
+        return os.path.getsize(path)
+
+
+    def __remove(self, content_hash):
+        self.entries.pop(content_hash, None)
+        for table in ('feeder', 'action'):
+            path = os.path.join(self.folder, f"{content_hash}.{table}.feather")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def file_hash(file, chunk_size=1024 * 1024):
+    '''Return blake2b content hash of file'''
+    h = hashlib.blake2b(digest_size=16)
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cached_file_hash(meta_by_path, file):
+    '''Return {'size', 'mtime', 'hash'} of file from meta_by_path {path: meta}, a file whose size or mtime changed is hashed
+    again and its new meta recorded in meta_by_path, so it is hashed once however often it is asked for'''
+    stat = os.stat(file)
+    key = os.path.abspath(file)
+    meta = meta_by_path.get(key)
+
+    # Unchanged size and mtime, trust the recorded hash, otherwise rehash the content
+    if meta is None or meta['size'] != stat.st_size or meta['mtime'] != stat.st_mtime_ns:
+        meta = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': file_hash(file)}
+        meta_by_path[key] = meta
+    return meta
+
+
+class MemoryProgramCache:
+    '''
+    Usage:
+    1) cache = MemoryProgramCache(backing, log), backing is a ProgramCache or None, kept across runs (watch mode)
+    2) used as the cache of parse_programs(), buffers of files with unchanged size and mtime are returned from memory,
+       the others from backing or parsed again
+    3) cache.save() logs the hits in memory and misses since the last save, cache.save() / cache.verify() / cache.clear()
+       pass on to backing, cache.prune() forgets files that no longer exist
+    '''
+
+    def __init__(self, backing=None, log=None):
+        self.backing = backing
+        self.log = log
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        return
+
+
+    def get(self, file):
+        '''Return (feeder_buffer, action_buffer) of file from memory or backing, or None on a miss'''
+        stat = os.stat(file)
+        key = os.path.abspath(file)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == (stat.st_size, stat.st_mtime_ns):
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        buffers = self.backing.get(file) if self.backing is not None else None
+        if buffers is not None:
+            self.entries[key] = ((stat.st_size, stat.st_mtime_ns), buffers)
+        return buffers
+
+
+    def put(self, file, feeder_buffer, action_buffer):
+        '''Keep freshly parsed buffers of file in memory and in backing'''
+        stat = os.stat(file)
+        self.entries[os.path.abspath(file)] = ((stat.st_size, stat.st_mtime_ns), (feeder_buffer, action_buffer))
+        if self.backing is not None:
+            self.backing.put(file, feeder_buffer, action_buffer)
+
+
+    def save(self):
+        '''Save backing, log the hits in memory and misses of the run'''
+        if self.backing is not None:
+            self.backing.save(memory_hits=self.hits)
+        elif self.log is not None:
+            self.log.info(f"Program cache: {str(self.hits)} hits in memory, {str(self.misses)} misses, {str(len(self.entries))} files in memory")
+        self.hits = 0
+        self.misses = 0
+
+
+    def verify(self):
+        '''Verify backing, return count removed'''
+        return self.backing.verify() if self.backing is not None else 0
+
+
+    def clear(self):
+        '''Invalidate memory and backing'''
+        self.entries = {}
+        if self.backing is not None:
+            self.backing.clear()
+
+
+    def prune(self):
+        '''Forget files that no longer exist'''
+        self.entries = {key: entry for key, entry in self.entries.items() if os.path.exists(key)}
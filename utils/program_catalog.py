@@ -0,0 +1,217 @@
+'''Persistent catalog of the PNP_PROGRAM tree: the Board id, format, machine and cycle time of every program file'''
+
+import os
+import json
+import time
+from xml.parsers import expat
+
+from utils.program_parser import probe_program
+
+
+class ProgramCatalog:
+    '''
+    Usage:
+    1) catalog = ProgramCatalog(folder, log)
+    2) catalog.refresh(path_program) brings the catalog up to date with the tree, full=True also checks every file
+    3) resolved = catalog.resolve(board_ids) returns {board_id: sorted program files with that Board id}
+    4) catalog.board_id(file) / catalog.entry(file) of a cataloged file
+    5) catalog.save(), or catalog.clear() to forget the whole tree
+
+    catalog.json holds each folder with its mtime, subfolders and .pp/.pp7 files, each file with its size, mtime and header
+    fields read by utils.program_parser.probe_program, which stops at the Board element instead of parsing the whole file.
+    refresh() only lists the folders whose mtime changed, as adding, removing or renaming a file changes its folder's mtime,
+    and only probes the new files of those. A file rewritten in place keeps its folder's mtime, resolve() checks the size and
+    mtime of the files it returns and probes them again if they changed, refresh(full=True) checks every file
+    '''
+
+    version = 1
+    extensions = ('.pp', '.pp7')
+    # A folder modified this close to when it was listed may have changed again within its mtime resolution
+    racy_seconds = 2.0
+
+    def __init__(self, folder: str, log):
+        self.folder = folder
+        self.log = log
+        self.probed = 0
+        self.changed = False
+        self.__path = os.path.join(folder, 'catalog.json')
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        try:
+            with open(self.__path, 'r', encoding='utf-8') as f:
+                catalog = json.load(f)
+            if catalog['version'] != self.version:
+                raise ValueError(f"catalog version {catalog['version']}")
+            self.root = catalog['root']
+            self.folders = catalog['folders']
+            self.changed = False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if os.path.exists(self.__path):
+                self.log.warning(f"Program catalog is unreadable, cataloging every file again, {str(e)}")
+            self.clear()
+        self.__index = None
+        return
+
+
+    def refresh(self, root: str, full=False):
+        '''Bring the catalog of the tree under root up to date, full also checks the size and mtime of every file'''
+        start = time.perf_counter()
+        self.probed = 0
+        root = os.path.abspath(root)
+        if root != self.root:
+            self.clear()
+            self.root = root
+
+        visited = set()
+        listed = [0]
+        def visit(folder):
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                return
+            visited.add(folder)
+            known = self.folders.get(folder)
+            if known is None or known['mtime'] != mtime or known['racy']:
+                known = self.__list(folder, mtime, known)
+                listed[0] += 1
+            elif full:
+                self.__check_files(folder, known)
+            for name in known['folders']:
+                visit(os.path.join(folder, name))
+
+        visit(root)
+        if len(visited) < len(self.folders):
+            self.folders = {folder: known for folder, known in self.folders.items() if folder in visited}
+            self.changed = True
+        if listed[0] > 0 or self.probed > 0:
+            self.changed = True
+            self.__index = None
+        self.log.info(f"Program catalog: {str(len(self.folders))} folders, {str(sum(len(known['files']) for known in self.folders.values()))} files, "
+                      f"{str(listed[0])} folders listed and {str(self.probed)} files probed in {time.perf_counter() - start:.3f}s")
+        return
+
+
+    def resolve(self, board_ids):
+        '''Return {board_id: sorted files with that Board id} of the board_ids found, each file checked against its size and mtime'''
+        board_ids = {board_id for board_id in board_ids if isinstance(board_id, str)}
+        index = self.__board_index()
+        resolved = {}
+        # Every candidate is checked before grouping, a file rewritten in place may now have another of the board_ids
+        for folder, name in sorted({candidate for board_id in board_ids for candidate in index.get(board_id, ())}):
+            file = os.path.join(folder, name)
+            known = self.folders[folder]
+            entry = self.__check_file(folder, name, known['files'].get(name))
+            if entry is not known['files'].get(name):
+                self.__set_entry(known, name, entry)
+            if entry is not None and entry[2] in board_ids:
+                resolved.setdefault(entry[2], []).append(file)
+        return resolved
+
+
+    def board_id(self, file):
+        '''Return the Board id of a cataloged file, None if it has none or is not cataloged'''
+        entry = self.entry(file)
+        return None if entry is None else entry['board_id']
+
+
+    def entry(self, file):
+        '''Return {'size', 'mtime', 'board_id', 'format', 'machine', 'position', 'cycle_time'} of a cataloged file, else None'''
+        folder, name = os.path.split(os.path.abspath(file))
+        entry = self.folders.get(folder, {'files': {}})['files'].get(name)
+        if entry is None:
+            return None
+        return dict(zip(('size', 'mtime', 'board_id', 'format', 'machine', 'position', 'cycle_time'), entry))
+
+
+    def save(self):
+        '''Write catalog.json if the catalog changed since it was read or saved'''
+        if not self.changed:
+            return
+        path_tmp = f"{self.__path}.tmp"
+        # json.dumps encodes in one C call, json.dump writes chunk by chunk
+        with open(path_tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'version': self.version, 'root': self.root, 'folders': self.folders}, separators=(',', ':')))
+        os.replace(path_tmp, self.__path)
+        self.changed = False
+
+
+    def clear(self):
+        '''Forget the whole tree, every file is probed again'''
+        self.root = None
+        self.folders = {}
+        self.changed = True
+        self.__index = None
+
+
+    def __list(self, folder, mtime, known):
+        '''List folder again, keeping the entries of its unchanged files'''
+        old_files = {} if known is None else known['files']
+        listed_at = time.time_ns()
+        folders = []
+        files = {}
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            entries = []
+        for f in entries:
+            try:
+                if f.is_dir():
+                    folders.append(f.name)
+                elif f.is_file() and f.name.lower().endswith(self.extensions):
+                    entry = self.__check_file(folder, f.name, old_files.get(f.name), f.stat())
+                    if entry is not None:
+                        files[f.name] = entry
+            except OSError:
+                continue
+        known = {'mtime': mtime, 'racy': listed_at - mtime < self.racy_seconds * 1e9, 'folders': sorted(folders), 'files': files}
+        self.folders[folder] = known
+        return known
+
+
+    def __check_files(self, folder, known):
+        for name, entry in list(known['files'].items()):
+            checked = self.__check_file(folder, name, entry)
+            if checked is not entry:
+                self.__set_entry(known, name, checked)
+
+
+    def __set_entry(self, known, name, entry):
+        '''Replace the entry of a file of a known folder, None removes it'''
+        if entry is None:
+            known['files'].pop(name, None)
+        else:
+            known['files'][name] = entry
+        self.changed = True
+        self.__index = None
+
+
+    def __check_file(self, folder, name, entry, stat=None):
+        '''Return the entry [size, mtime, board_id, format, machine, position, cycle_time] of the file, probed again if it changed, None if it is gone'''
+        file = os.path.join(folder, name)
+        try:
+            stat = stat or os.stat(file)
+        except OSError:
+            return None
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry
+
+        self.probed += 1
+        try:
+            header = probe_program(file)
+        except (OSError, expat.ExpatError) as e:
+            self.log.warning(f"Program catalog cannot read the header of {file}, {str(e)}")
+            header = {'board_id': None, 'format': None, 'machine': None, 'position': None, 'cycle_time': None}
+        return [stat.st_size, stat.st_mtime_ns, header['board_id'], header['format'], header['machine'], header['position'], header['cycle_time']]
+
+
+    def __board_index(self):
+        '''{board_id: [(folder, name)]}, rebuilt after the catalog changed'''
+        if self.__index is None:
+            self.__index = {}
+            for folder, known in self.folders.items():
+                for name, entry in known['files'].items():
+                    if entry[2] is not None:
+                        self.__index.setdefault(entry[2], []).append((folder, name))
+        return self.__index
@@ -0,0 +1,283 @@
+'''Streaming parser for AX-501 (.pp) and iFlex (.pp7) placement programs'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from xml.parsers import expat
+
+import numpy as np
+import pandas as pd
+
+
+PP_NS = 'http://api.assembleon.com/pp/v2'
+PP7_NS = 'http://api.assembleon.com/pp7/v1'
+
+feeder_columns = ['PROGRAM_NAME', 'MACHINE', 'SECTION_NUMBER', 'TROLLEY_TYPE', 'FEEDER_NUMBER', 'FEEDER_TYPE', 'LANE_NUMBER', 'COMPONENT', 'SHAPE']
+action_columns = ['PROGRAM_NAME', 'MACHINE', 'SECTION_NUMBER', 'ROBOT_NUMBER', 'HEAD_NUMBER', 'DESIGNATOR', 'BOARD_NUMBER', 'FEEDER_NUMBER', 'LANE_NUMBER']
+
+
+class RecordBuffer:
+    '''
+    Column-wise buffer of parser records
+    Each column is dictionary-encoded: an int32 code per row into the column's list of unique values,
+    so repeated strings (program name, machine, section, component...) are stored once
+
+    Usage:
+    1) buffer = RecordBuffer(columns)
+    2) buffer.append_rows(rows, COLUMN=value) appends rows of the remaining columns, COLUMN=value fills a whole column
+    3) buffer.extend(other) appends another buffer, remapping only its unique values
+    4) buffer.to_frame() decodes into a DataFrame of strings
+    '''
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        self.length = 0
+        self.__codes = {column: [] for column in self.columns}
+        self.__lookup = {column: {} for column in self.columns}
+        return
+
+
+    def __len__(self):
+        return self.length
+
+
+    def append_rows(self, rows: list, **constants):
+        n = len(rows)
+        variable_columns = [column for column in self.columns if column not in constants]
+        data = zip(*rows) if n > 0 else [()] * len(variable_columns)
+        for column, values in zip(variable_columns, data):
+            codes, uniques = pd.factorize(np.array(values, dtype=object))
+            # factorize codes None as -1, append None so that -1 wraps onto it
+            self.append_codes(column, codes, list(uniques) + [None])
+        for column, value in constants.items():
+            self.append_codes(column, np.zeros(n, dtype=np.int32), [value])
+        self.length += n
+
+
+    def extend(self, other):
+        for column in self.columns:
+            codes, values = other.column_codes(column)
+            self.append_codes(column, codes, values)
+        self.length += other.length
+
+
+    def append_codes(self, column, codes, values):
+        '''Append codes indexing into values (negative codes wrap from the end), length is updated by the caller'''
+        lookup = self.__lookup[column]
+        remap = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int32, count=len(values))
+        if len(codes) > 0:
+            self.__codes[column].append(remap.take(codes, mode='wrap'))
+
+
+    def column_codes(self, column):
+        '''Return (codes, values) of column, codes as one int32 array'''
+        chunks = self.__codes[column]
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        codes = chunks[0] if chunks else np.zeros(0, dtype=np.int32)
+        return codes, list(self.__lookup[column])
+
+
+    def to_frame(self):
+        '''Decode into a DataFrame, the decoded column-major array is wrapped without another copy'''
+        data = np.empty((self.length, len(self.columns)), dtype=object, order='F')
+        for i, column in enumerate(self.columns):
+            codes, values = self.column_codes(column)
+            uniques = np.empty(len(values), dtype=object)
+            uniques[:] = values
+            if len(codes) > 0:
+                np.take(uniques, codes, out=data[:, i], mode='wrap')
+        return pd.DataFrame(data, columns=self.columns, copy=False)
+
+
+def parse_program(file):
+    '''
+    Parse .pp/.pp7 program file in a single streaming pass, return (feeder_buffer, action_buffer)
+    Both are RecordBuffer following feeder_columns / action_columns
+    '''
+    if file.rsplit('.', 1)[-1].lower() == 'pp7':
+        feeder_items, action_items, header = _parse_pp7(file)
+    else:
+        feeder_items, action_items, header = _parse_pp(file)
+
+    # Board id and machine are per-file constants, filled in once the whole file is read
+    feeder_buffer = RecordBuffer(feeder_columns)
+    feeder_buffer.append_rows(feeder_items, **header)
+    action_buffer = RecordBuffer(action_columns)
+    action_buffer.append_rows(action_items, **header)
+
+    return feeder_buffer, action_buffer
+
+
+def parse_programs(files, workers=1, cache=None):
+    '''
+    Parse program files, yield (file, feeder_buffer, action_buffer) in the order of files
+    Files found in cache (utils.program_cache.ProgramCache) are not parsed again
+    Parsing is fanned out across a process pool when workers > 1, workers = 0 uses all cores
+    '''
+    files = list(files)
+    parsed = {}
+    if cache is not None:
+        for file in files:
+            buffers = cache.get(file)
+            if buffers is not None:
+                parsed[file] = buffers
+
+    for file, buffers in _parse_files([file for file in files if file not in parsed], workers):
+        parsed[file] = buffers
+        if cache is not None:
+            cache.put(file, *buffers)
+
+    for file in files:
+        yield (file,) + parsed.pop(file)
+
+
+def _parse_files(files, workers):
+    '''Yield (file, (feeder_buffer, action_buffer)), serially or from a process pool'''
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(files) <= 1:
+        for file in files:
+            yield file, parse_program(file)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+        yield from zip(files, executor.map(parse_program, files))
+
+
+def probe_program(file, chunk_size=16384):
+    '''
+    Read only the header of .pp/.pp7 program file, up to its Board element, return
+    {'board_id', 'format', 'machine', 'position', 'cycle_time'}, machine as parse_program fills MACHINE, board_id None if there is no Board
+    '''
+    program_format = 'pp7' if file.rsplit('.', 1)[-1].lower() == 'pp7' else 'pp'
+    ns = PP7_NS if program_format == 'pp7' else PP_NS
+    header = {'board_id': None, 'format': program_format, 'machine': '3' if program_format == 'pp7' else None, 'position': None, 'cycle_time': None}
+
+    class BoardFound(Exception):
+        pass
+
+    def start_element(name, attrs):
+        if name == f"{ns} General":
+            header['position'] = attrs.get('positionInLine')
+            header['cycle_time'] = attrs.get('cycleTime')
+            if program_format == 'pp':
+                header['machine'] = header['position']
+        elif name == f"{ns} Board":
+            header['board_id'] = attrs.get('id')
+            raise BoardFound()
+
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.StartElementHandler = start_element
+    with open(file, 'rb') as f:
+        try:
+            while True:
+                chunk = f.read(chunk_size)
+                parser.Parse(chunk, not chunk)
+                if not chunk:
+                    break
+        except BoardFound:
+            pass
+    return header
+
+
+def _stream(file, handlers):
+    '''
+    Feed file through expat, calling handlers[tag](attrs) on each element start
+    No element tree is built, only the attributes of the handled tags are read
+    '''
+    def start_element(name, attrs):
+        handler = handlers.get(name)
+        if handler is not None:
+            handler(attrs)
+
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.StartElementHandler = start_element
+    with open(file, 'rb') as f:
+        parser.ParseFile(f)
+
+
+def _parse_pp(file):
+    '''Parse AX-501 .pp program, each section has 4 robots, total 5 sections with 20 robots, each with 1 head'''
+    feeder_items = []
+    action_items = []
+    header = {'PROGRAM_NAME': None, 'MACHINE': None}
+    feeder = [None, None, None, None]
+    action = [None, None, '1']
+    robots_per_section = 4
+    actions_count = [0]
+
+    def on_general(attrs):
+        header['MACHINE'] = attrs.get('positionInLine')
+
+    def on_board(attrs):
+        header['PROGRAM_NAME'] = attrs.get('id')
+
+    def on_section(attrs):
+        feeder[0] = attrs.get('number')
+
+    def on_trolley(attrs):
+        feeder[1] = attrs.get('type')
+
+    def on_feeder(attrs):
+        feeder[2] = attrs.get('number')
+        feeder[3] = attrs.get('type')
+
+    def on_lane(attrs):
+        feeder_items.append(feeder + [attrs.get('number'), attrs.get('partNumber'), attrs.get('shapeId')])
+
+    def on_actions(attrs):
+        action[0] = str(actions_count[0] // robots_per_section + 1)
+        action[1] = attrs.get('robotNumber')
+        actions_count[0] += 1
+
+    def on_pick(attrs):
+        action_items.append(action + [attrs.get('refDes'), attrs.get('circuitNumber'), attrs.get('feederNumber'), attrs.get('laneNumber')])
+
+    _stream(file, {
+        f"{PP_NS} General": on_general,
+        f"{PP_NS} Board": on_board,
+        f"{PP_NS} Section": on_section,
+        f"{PP_NS} Trolley": on_trolley,
+        f"{PP_NS} Feeder": on_feeder,
+        f"{PP_NS} Lane": on_lane,
+        f"{PP_NS} Actions": on_actions,
+        f"{PP_NS} Pick": on_pick,
+    })
+
+    return feeder_items, action_items, header
+
+
+def _parse_pp7(file):
+    '''Parse iFlex .pp7 program, one feeder has 1 robot with 2 heads'''
+    feeder_items = []
+    action_items = []
+    header = {'PROGRAM_NAME': None, 'MACHINE': '3'}
+    feeder = [None, None, None, None]
+
+    def on_board(attrs):
+        header['PROGRAM_NAME'] = attrs.get('id')
+
+    def on_feed_section(attrs):
+        feeder[0] = attrs.get('number')
+        feeder[1] = attrs.get('type')
+
+    def on_feeder(attrs):
+        feeder[2] = attrs.get('slotNumber')
+        feeder[3] = attrs.get('type')
+
+    def on_feeder_lane(attrs):
+        feeder_items.append(feeder + [attrs.get('number'), attrs.get('partNumber'), attrs.get('shapeId')])
+
+    def on_pick(attrs):
+        action_items.append([attrs.get('feedSectionNumber'), attrs.get('robotNumber'), attrs.get('headNumber'), attrs.get('refDes'), attrs.get('circuitNumber'), attrs.get('feederSlotNumber'), attrs.get('feederLaneNumber')])
+
+    _stream(file, {
+        f"{PP7_NS} Board": on_board,
+        f"{PP7_NS} FeedSection": on_feed_section,
+        f"{PP7_NS} Feeder": on_feeder,
+        f"{PP7_NS} FeederLane": on_feeder_lane,
+        f"{PP7_NS} Pick": on_pick,
+    })
+
+    return feeder_items, action_items, header
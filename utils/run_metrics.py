@@ -0,0 +1,108 @@
+'''Per-stage run metrics of the checker: wall time, CPU time, row counts and peak traced memory'''
+
+import csv
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+
+class RunMetrics:
+    '''
+    Usage:
+    1) metrics = RunMetrics(log, trace_memory=False)
+    2) metrics.start('Algorithm 1', rows_in=len(df_program)) before the stage
+    3) metrics.stop('Algorithm 1', rows_out=len(df_program_qty)) after the stage, logs the stage metrics
+    4) metrics.write(f"{path_main}\\Log\\PNP_PROGRAM_CHECKER_metrics") writes .json of this run and appends .csv
+
+    Peak traced memory is the peak of Python allocations traced by tracemalloc during the stage (numpy/pandas buffers included),
+    tracing slows allocation heavy stages several times, so it is only on with trace_memory=True, else peak_traced_mb is left blank
+    Stages not stopped (e.g. the run failed inside them) are reported up to the time of write
+    '''
+
+    columns = ['run_started', 'stage', 'wall_s', 'cpu_s', 'rows_in', 'rows_out', 'peak_traced_mb', 'status']
+
+    def __init__(self, log=None, trace_memory=False):
+        self.log = log
+        self.trace_memory = trace_memory
+        self.run_started = datetime.now().isoformat(timespec='seconds')
+        self.stages = {}
+        self.__running = {}
+        self.__run_start = (time.perf_counter(), time.process_time())
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return
+
+
+    def start(self, name: str, rows_in=None):
+        '''Start timing stage name, rows_in is the count of rows going into the stage'''
+        memory_start = 0
+        if self.trace_memory and tracemalloc.is_tracing():
+            # Stages may nest, the peak so far is kept by the running stages before it is reset for this one
+            self.__fold_peak()
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        self.__running[name] = [time.perf_counter(), time.process_time(), memory_start, memory_start]
+        self.stages[name] = {'stage': name, 'wall_s': None, 'cpu_s': None, 'rows_in': rows_in, 'rows_out': None, 'peak_traced_mb': None}
+        return
+
+
+    def stop(self, name: str, rows_out=None):
+        '''Stop timing stage name, rows_out is the count of rows coming out of the stage'''
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.__fold_peak()
+        wall_start, cpu_start, memory_start, memory_peak = self.__running.pop(name)
+        stage = self.stages[name]
+        stage['wall_s'] = round(time.perf_counter() - wall_start, 3)
+        stage['cpu_s'] = round(time.process_time() - cpu_start, 3)
+        stage['rows_out'] = rows_out
+        if self.trace_memory and tracemalloc.is_tracing():
+            # Peak above what was already allocated when the stage started
+            stage['peak_traced_mb'] = round((memory_peak - memory_start) / 1024 ** 2, 1)
+
+        if self.log is not None:
+            memory = f", peak traced {stage['peak_traced_mb']} MB" if stage['peak_traced_mb'] is not None else ''
+            self.log.info(f"Stage {name}: wall {stage['wall_s']}s, cpu {stage['cpu_s']}s, rows {stage['rows_in']} -> {stage['rows_out']}{memory}")
+        return
+
+
+    def write(self, path: str, status='completed'):
+        '''Write this run's stages to path.json (overwritten) and append them to path.csv, return both file paths'''
+        for name in list(self.__running):
+            wall_start, cpu_start, _, _ = self.__running.pop(name)
+            self.stages[name]['wall_s'] = round(time.perf_counter() - wall_start, 3)
+            self.stages[name]['cpu_s'] = round(time.process_time() - cpu_start, 3)
+
+        stages = [dict(stage, run_started=self.run_started, status=status) for stage in self.stages.values()]
+        report = {
+            'run_started': self.run_started,
+            'status': status,
+            'wall_s': round(time.perf_counter() - self.__run_start[0], 3),
+            'cpu_s': round(time.process_time() - self.__run_start[1], 3),
+            'trace_memory': self.trace_memory,
+            'stages': [{column: stage[column] for column in self.columns if column not in ('run_started', 'status')} for stage in stages],
+        }
+
+        file_json = f"{path}.json"
+        with open(file_json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        file_csv = f"{path}.csv"
+        new_file = not os.path.exists(file_csv)
+        with open(file_csv, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns, extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerows(stages)
+
+        if self.log is not None:
+            self.log.info(f"Run metrics written into {file_json} and {file_csv}")
+        return file_json, file_csv
+
+
+    def __fold_peak(self):
+        '''Keep the traced peak since the last reset in every running stage'''
+        peak = tracemalloc.get_traced_memory()[1]
+        for running in self.__running.values():
+            running[3] = max(running[3], peak)
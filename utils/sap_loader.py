@@ -0,0 +1,141 @@
+'''Batched SAP BOM queries over one database connection, fetching results in chunks'''
+
+import time
+
+import pandas as pd
+
+
+class SapLoader:
+    '''
+    Usage:
+    1) loader = SapLoader(database, log, batch_size=1000, fetch_size=50000, store=None, offline='N')
+    2) df = loader.read('query_BOM_590', query, values, key='BOM', item=..., header=...) runs query once per batch of values,
+       {params} in query is filled with the batch's placeholders and the other {names} with the keyword arguments
+    3) loader.close() closes the connection once all queries are done
+
+    SQL Server takes at most 2100 parameters per statement, so batch_size is capped at max_batch_size.
+    Each batch is streamed by Database.iter_select_query fetch_size rows at a time into DataFrame chunks, the driver never holds
+    a whole result as one list of rows.
+
+    With a store (utils.sap_snapshot.SapSnapshot), values snapshotted within its TTL are served from it and only the others are
+    queried, the connection is only opened when some value has to be queried. The key column tells which value a row belongs to.
+    offline is N to fail when the database is unreachable, AUTO to then serve every value from the store whatever its age,
+    Y to never connect
+    '''
+
+    max_batch_size = 2000
+
+    def __init__(self, database, log, batch_size=1000, fetch_size=50000, store=None, offline='N'):
+        if batch_size > self.max_batch_size:
+            log.warning(f"DB_BATCH_SIZE {batch_size} is above the {self.max_batch_size} parameters a query can take, setting to {self.max_batch_size}...")
+        self.database = database
+        self.log = log
+        self.placeholder = database.placeholder
+        self.batch_size = max(1, min(batch_size, self.max_batch_size))
+        self.fetch_size = max(1, fetch_size)
+        self.store = store
+        self.offline = offline
+        self.__connection = None
+        self.__unreachable = False
+        return
+
+
+    def read(self, name: str, query: str, values, key=None, **names):
+        '''Return the rows of query for all values as one DataFrame, values are queried in sorted batches'''
+        values = sorted(set(values))
+        if self.store is None or key is None:
+            return self.__query(self.__connect(), name, query, values, names)
+
+        start = time.perf_counter()
+        query_text = query.format(params='{params}', **names)
+        entries = self.store.get(name, query_text, [str(value) for value in values])
+        missing = [value for value in values if str(value) not in entries]
+        if missing:
+            connection = self.__connect(fallback=True)
+            if connection is None:
+                entries = self.store.get(name, query_text, [str(value) for value in values], max_age=None)
+                missing = [value for value in values if str(value) not in entries]
+                reason = 'offline' if self.offline == 'Y' else 'unreachable'
+                if missing:
+                    raise ConnectionRefusedError(f"SAP database is {reason} and {len(missing)} values of {name} are not in the SAP snapshot, e.g. {missing[:5]}")
+                self.log.warning(f"SAP database is {reason}, {name} is served from the SAP snapshot, which may be outdated")
+            else:
+                df = self.__query(connection, name, query, missing, names)
+                fetched = split_rows(df, key, missing)
+                self.store.put(name, query_text, fetched)
+                entries.update(fetched)
+
+        # Rows in sorted value order, whether they came from the store or the database
+        columns = next(iter(entries.values()))[0] if entries else []
+        rows = [row for value in values for row in entries[str(value)][1]]
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        self.log.info(f"{name}: {len(df)} rows for {len(values)} values, {len(values) - len(missing)} from the SAP snapshot, {time.perf_counter() - start:.3f}s")
+        return df
+
+
+    def close(self):
+        '''Close the connection if one was opened'''
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+
+    def __connect(self, fallback=False):
+        '''Return the connection, opened on first use, or None if it cannot be opened and fallback to the store is allowed'''
+        if self.__connection is not None:
+            return self.__connection
+
+        offline = self.offline if fallback else 'N'
+        if offline == 'Y' or (offline == 'AUTO' and self.__unreachable):
+            return None
+        connection, response = self.database.connect()
+        if connection is None:
+            if offline == 'AUTO':
+                self.log.warning(response)
+                self.__unreachable = True
+                return None
+            raise ConnectionRefusedError(response)
+        self.log.info(response)
+        self.__connection = connection
+        return connection
+
+
+    def __query(self, connection, name, query, values, names):
+        batches = [values[start:start + self.batch_size] for start in range(0, len(values), self.batch_size)]
+        chunks = []
+        columns = []
+        start = time.perf_counter()
+        for i, batch in enumerate(batches, start=1):
+            batch_start = time.perf_counter()
+            cursor = connection.cursor()
+            rows = 0
+            try:
+                for fetched in self.database.iter_select_query(cursor, query.format(params=','.join([self.placeholder] * len(batch)), **names), tuple(batch), self.fetch_size):
+                    chunks.append(pd.DataFrame.from_records(fetched, columns=self.database.column_names(cursor), coerce_float=True))
+                    rows += len(fetched)
+                columns = self.database.column_names(cursor)
+            finally:
+                cursor.close()
+            self.log.info(f"{name} batch {i}/{len(batches)}: {len(batch)} values, {rows} rows in {time.perf_counter() - batch_start:.3f}s")
+
+        if len(chunks) < 1:
+            df = pd.DataFrame(columns=columns)
+        elif len(chunks) == 1:
+            df = chunks[0]
+        else:
+            df = pd.concat(chunks, ignore_index=True)
+        self.log.info(f"{name}: {len(df)} rows for {len(values)} values in {len(batches)} batches, {time.perf_counter() - start:.3f}s")
+        return df
+
+
+def split_rows(df, key: str, values):
+    '''Return {str(value): (columns, row tuples)} of the rows of df per value of the key column, values without rows get none'''
+    columns = list(df.columns)
+    values = {str(value).strip().upper(): str(value) for value in values}
+    entries = {value: (columns, []) for value in values.values()}
+    if len(df) > 0:
+        # Matched as the database compares them, blanks trimmed and case insensitive
+        for matched, rows in df.groupby(df[key].astype(str).str.strip().str.upper(), sort=False).indices.items():
+            if matched in values:
+                entries[values[matched]] = (columns, list(df.iloc[rows].itertuples(index=False, name=None)))
+    return entries
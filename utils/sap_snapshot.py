@@ -0,0 +1,103 @@
+'''Local snapshot of SAP query rows per selected BOM/MCTO, so repeat checks are served without querying the database'''
+
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import contextlib
+
+
+class SapSnapshot:
+    '''
+    Usage:
+    1) store = SapSnapshot(folder, log, ttl_hours=12)
+    2) entries = store.get(name, query, values) returns {value: (columns, rows)} of the values snapshotted less than
+       ttl_hours ago, store.get(name, query, values, max_age=None) of any age, e.g. when the database is unreachable
+    3) store.put(name, query, {value: (columns, rows)}) after querying the values that were missing
+    4) store.clear() to drop every snapshot
+
+    snapshot.db is a SQLite file with one row per query and value, holding the query's result rows of that value as pickled
+    row tuples and when they were fetched. The query text is part of the key, so rows of an edited query are never served
+    '''
+
+    version = 1
+    batch_size = 500
+
+    def __init__(self, folder: str, log, ttl_hours=0.0):
+        self.folder = folder
+        self.log = log
+        self.ttl = max(0.0, ttl_hours) * 3600
+        self.hits = 0
+        self.misses = 0
+        self.__path = os.path.join(folder, 'snapshot.db')
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        with self.__connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS snapshot (query TEXT, value TEXT, fetched REAL, data BLOB, PRIMARY KEY (query, value))')
+        return
+
+
+    def get(self, name: str, query: str, values, max_age=-1):
+        '''Return {value: (columns, rows)} of the values snapshotted at most max_age seconds ago, -1 for ttl_hours, None for any age'''
+        if max_age == -1:
+            max_age = self.ttl
+        values = sorted(set(values))
+        if max_age is not None and max_age <= 0:
+            self.misses += len(values)
+            return {}
+
+        entries = {}
+        oldest = None
+        key = query_key(name, query)
+        with self.__connect() as connection:
+            for start in range(0, len(values), self.batch_size):
+                batch = values[start:start + self.batch_size]
+                cursor = connection.execute(f"SELECT value, fetched, data FROM snapshot WHERE query = ? AND value IN ({','.join(['?'] * len(batch))})", (key, *batch))
+                for value, fetched, data in cursor:
+                    age = time.time() - fetched
+                    if max_age is not None and age > max_age:
+                        continue
+                    try:
+                        entries[value] = pickle.loads(data)
+                    except (pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+                        self.log.warning(f"SAP snapshot of {name} {value} is unreadable, querying it again...")
+                        continue
+                    oldest = age if oldest is None else max(oldest, age)
+
+        self.hits += len(entries)
+        self.misses += len(values) - len(entries)
+        if entries:
+            self.log.info(f"SAP snapshot: {len(entries)} of {len(values)} values of {name} served, oldest fetched {oldest / 3600:.1f} hours ago")
+        return entries
+
+
+    def put(self, name: str, query: str, entries: dict):
+        '''Store {value: (columns, rows)} of query name as fetched now'''
+        key = query_key(name, query)
+        fetched = time.time()
+        with self.__connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO snapshot (query, value, fetched, data) VALUES (?, ?, ?, ?)',
+                                   ((key, value, fetched, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)) for value, entry in entries.items()))
+        return
+
+
+    def clear(self):
+        '''Drop every snapshot, all values are queried again'''
+        with self.__connect() as connection:
+            connection.execute('DELETE FROM snapshot')
+        self.log.info('SAP snapshot cleared.')
+
+
+    @contextlib.contextmanager
+    def __connect(self):
+        # A connection per call, so the store can be shared by threads, committed at the end of the with block
+        with contextlib.closing(sqlite3.connect(self.__path, timeout=30)) as connection, connection:
+            yield connection
+
+
+def query_key(name: str, query: str):
+    '''Key of query name in the snapshot, from its name, text and the store version'''
+    return f"{name}:{SapSnapshot.version}:{hashlib.blake2b(query.encode('utf-8'), digest_size=16).hexdigest()}"
@@ -0,0 +1,310 @@
+'''Synthetic SAP BOM/MCTO reports and AX-501/iFlex placement programs at configurable scale, for offline benchmarks'''
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Part families: (part number prefix, designator letter, description, shape), 529/531 are placed by the iFlex machine
+part_families = [
+    ('510', 'R', 'RES, SM {n}K OHM 0201 +/-1% 1/20W AS', 'SMR0201'),
+    ('511', 'C', 'MLCC, {n}PF 10% 0402 25V X7R', 'SMC0402'),
+    ('512', 'L', 'IND, {n}UH 20% 0806 1.6A', 'IND0806'),
+    ('513', 'D', 'DIODE, TVS {n}V SOD923', 'SOD923'),
+    ('515', 'Q', 'FET, N-CH {n}V 1A SOT723', 'SOT723'),
+    ('521', 'U', 'IC, PMIC {n} CH QFN32', 'QFN32_5X5'),
+    ('529', 'U', 'IC, CONTROLLER {n} BGA1285', 'BGA1285_2705SQR_P65_80H200'),
+    ('531', 'J', 'CONN, PCIE {n} PIN RA', 'SAS_PCIE_RA_AMP_OBLONG_PLG'),
+]
+family_weights = [0.38, 0.34, 0.06, 0.06, 0.06, 0.06, 0.02, 0.02]
+iflex_prefixes = ('529', '531')
+
+# MCTO memory parts: description, component after Algorithm 3 memory conversion, side
+memory_parts = [
+    ('MT29FB8T08EALAAM5-QK:E-M002', '520-M5', 1),
+    ('MT40A4G8NEA-062E:F-M002', '520-NEA', 2),
+]
+
+PP_NS = 'http://api.assembleon.com/pp/v2'
+PP7_NS = 'http://api.assembleon.com/pp7/v1'
+
+
+class SyntheticWorkspace:
+    '''
+    Usage:
+    1) workspace = SyntheticWorkspace(boms=10, components=300, designators=4, circuits=4, seed=0)
+    2) workspace.write(path) writes BOM_590, MCTO, PNP_PROGRAM and job.json under path, in the formats main.py reads
+       workspace.write_sap_db(file) writes the same BOMs/MCTOs as a SQLite stand-in of the SAP tables (DB_TYPE = 'sqlite')
+    3) workspace.df_material has the BOM/MCTO components (after memory conversion) with DESIGNATOR ranges as in the reports, e.g. R5-R7,R12
+    4) workspace.df_placement has one row per (program, component, designator, circuit) placed by the programs
+
+    Each BOM gets components drawn from a shared part pool (so BOMs of a family share part numbers),
+    1 to 2 * designators - 1 designators per component and 2 memory parts from its MCTO.
+    Designators are placed once per circuit on side 1 (PD) or side 2 (SD), each side is programmed on
+    two AX-501 machines (.pp) plus one iFlex machine (.pp7) for the large parts.
+    error_rate of the designators are left out of the programs and as many extra parts are programmed,
+    so the Not found and extra programmed part paths are exercised too.
+    '''
+
+    def __init__(self, boms=10, components=300, designators=4, circuits=4, error_rate=0.01, seed=0):
+        self.boms = boms
+        self.components = components
+        self.designators = designators
+        self.circuits = circuits
+        self.error_rate = error_rate
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        pool_size = max(components * 2, 200)
+        families = rng.choice(len(part_families), size=pool_size, p=family_weights)
+        self.__pool = [(f"{part_families[family][0]}-{500000 + i:06d}", family) for i, family in enumerate(families)]
+
+        self.__jobs = []
+        self.__bom_rows = {}
+        self.__mcto_rows = {}
+        self.__programs = {}
+        material = []
+        placement = []
+        for b in range(boms):
+            bom = f"590-{600000 + b:06d}"
+            mcto = str(700000 + b)
+            side1 = f"B{b:05d}-PD0-M5-IT"
+            side2 = f"B{b:05d}-SD0-M5-IT"
+            self.__jobs.append({'BOM': bom, 'MCTO': mcto, 'PV': '1', 'PNP_PROGRAM_SIDE1': side1, 'PNP_PROGRAM_SIDE2': side2})
+
+            counters = {}
+            def next_designators(letter, count):
+                start = counters.get(letter, 0) + 1
+                counters[letter] = start + count - 1
+                return [f"{letter}{n}" for n in range(start, start + count)]
+
+            # BOM components, each designator on side 1 (65%) or side 2
+            placed = {1: [], 2: []}
+            bom_rows = []
+            for part_index in sorted(rng.choice(pool_size, size=min(components, pool_size), replace=False)):
+                component, family = self.__pool[part_index]
+                prefix, letter, description, shape = part_families[family]
+                refdes = next_designators(letter, int(rng.integers(1, 2 * designators)))
+                description = description.format(n=part_index % 97 + 1)
+                bom_rows.append((component, description, refdes))
+                material.append((bom, mcto, '1', side1, side2, component, description, len(refdes), ','.join(_designator_lines(refdes))))
+                for designator, side in zip(refdes, np.where(rng.random(len(refdes)) < 0.65, 1, 2)):
+                    placed[int(side)].append((component, designator, shape))
+            self.__bom_rows[bom] = bom_rows
+
+            # MCTO memory parts, placed as their converted 520-XXX component
+            mcto_rows = []
+            for i, (description, component, side) in enumerate(memory_parts):
+                refdes = next_designators('U', max(components // 20, 1))
+                mcto_rows.append((str(612171 + i), description, refdes))
+                material.append((bom, mcto, '1', side1, side2, component, description, len(refdes), ','.join(_designator_lines(refdes))))
+                placed[side].extend((component, designator, 'BGA132_12X18') for designator in refdes)
+            self.__mcto_rows[mcto] = mcto_rows
+
+            # Leave out error_rate of the placements, add as many extra parts not in the BOM
+            for side, program in ((1, side1), (2, side2)):
+                keep = rng.random(len(placed[side])) >= error_rate
+                extras = int(len(placed[side]) - keep.sum())
+                side_placed = [item for item, kept in zip(placed[side], keep) if kept]
+                for part_index, designator in zip(rng.choice(pool_size, size=extras), next_designators('X', extras)):
+                    component, family = self.__pool[part_index]
+                    side_placed.append((component, designator, part_families[family][3]))
+                self.__programs[(bom, program)] = side_placed
+                for component, designator, _ in side_placed:
+                    for circuit in range(1, circuits + 1):
+                        placement.append((program, component, designator, str(circuit)))
+
+        self.df_material = pd.DataFrame(material, columns=['BOM', 'MCTO', 'PV', 'PNP_PROGRAM_SIDE1', 'PNP_PROGRAM_SIDE2', 'COMPONENT', 'COMPDESC', 'QUANTITY', 'DESIGNATOR'])
+        self.df_placement = pd.DataFrame(placement, columns=['PROGRAM_NAME', 'COMPONENT', 'DESIGNATOR', 'BOARD_NUMBER'])
+        return
+
+
+    def write(self, path: str, settings=None):
+        '''Write the BOM_590/MCTO reports, PNP_PROGRAM files and job.json under path, return the job file path'''
+        for folder in ('BOM_590', 'MCTO', 'PNP_PROGRAM'):
+            os.makedirs(os.path.join(path, folder), exist_ok=True)
+
+        for bom, rows in self.__bom_rows.items():
+            _write_report(os.path.join(path, 'BOM_590', f"{bom}.csv"), bom, rows, mcto=False)
+        for mcto, rows in self.__mcto_rows.items():
+            _write_report(os.path.join(path, 'MCTO', f"{mcto}_1.csv"), mcto, rows, mcto=True)
+
+        for (bom, program), placed in self.__programs.items():
+            folder = os.path.join(path, 'PNP_PROGRAM', bom)
+            os.makedirs(folder, exist_ok=True)
+            ax_parts = sorted({component for component, _, _ in placed if not component.startswith(iflex_prefixes)})
+            iflex_parts = sorted({component for component, _, _ in placed if component.startswith(iflex_prefixes)})
+            for machine in (1, 2):
+                parts = set(ax_parts[machine - 1::2])
+                _write_pp(os.path.join(folder, f"{machine}-{program}.pp"), program, machine, [item for item in placed if item[0] in parts], self.circuits)
+            if iflex_parts:
+                parts = set(iflex_parts)
+                _write_pp7(os.path.join(folder, f"3-{program}-IFLEX.pp7"), program, [item for item in placed if item[0] in parts], self.circuits)
+
+        file_job = os.path.join(path, 'job.json')
+        with open(file_job, 'w', encoding='utf-8') as f:
+            json.dump({'settings': {'SAP_SOURCE': 'manual', **(settings or {})}, 'CHECKER': self.__jobs}, f, indent=1)
+        return file_job
+
+
+    def write_sap_db(self, file: str):
+        '''
+        Write SAP_BOM_header/SAP_BOM_item tables of the BOMs and MCTOs into SQLite file, with the columns query_BOM_590/query_MCTO read,
+        an item row per designator line as in SAP, MCTO materials are 000000000000-padded with quantities in thousandths
+        '''
+        import sqlite3
+
+        headers = []
+        items = []
+        for materials, mcto in ((self.__bom_rows, False), (self.__mcto_rows, True)):
+            for material, rows in materials.items():
+                bom_no = len(headers) + 1
+                headers.append((bom_no, f"000000000000{material}" if mcto else material, '1'))
+                rows = [('550-500001', 'PWB, SYNTHETIC ARTWORK', ['PCB1'])] + rows + [('542-500172', 'ENC, BOT SYNTHETIC', ['MECH1'])]
+                for component, description, designators in rows:
+                    quantity = len(designators) * (1000 if mcto else 1)
+                    items.extend((bom_no, '1', component, description, quantity, line) for line in _designator_lines(designators))
+
+        if os.path.exists(file):
+            os.remove(file)
+        connection = sqlite3.connect(file)
+        try:
+            connection.execute('CREATE TABLE SAP_BOM_header (BOM_no INTEGER, SAP_mat_no TEXT, alt_BOM_type TEXT)')
+            connection.execute('CREATE TABLE SAP_BOM_item (BOM_no INTEGER, alt_BOM_type TEXT, compnt_no TEXT, compnt_desc TEXT, compnt_qty REAL, item_text TEXT)')
+            connection.executemany('INSERT INTO SAP_BOM_header VALUES (?, ?, ?)', headers)
+            connection.executemany('INSERT INTO SAP_BOM_item VALUES (?, ?, ?, ?, ?, ?)', items)
+            connection.commit()
+        finally:
+            connection.close()
+        return file
+
+
+def _designator_lines(designators: list, per_line=9):
+    '''Compress designators into ranges (R5-R7) and wrap them per_line entries a line, as ZPR_BOM_EXPLOSION does'''
+    entries = []
+    numbers = sorted((d.rstrip('0123456789'), int(d[len(d.rstrip('0123456789')):])) for d in designators)
+    i = 0
+    while i < len(numbers):
+        j = i
+        while j + 1 < len(numbers) and numbers[j + 1] == (numbers[i][0], numbers[j][1] + 1):
+            j += 1
+        letter, start = numbers[i]
+        entries.append(f"{letter}{start}" if j == i else f"{letter}{start}-{letter}{numbers[j][1]}")
+        i = j + 1
+    return [','.join(entries[k:k + per_line]) for k in range(0, len(entries), per_line)]
+
+
+def _write_report(file: str, material: str, rows: list, mcto: bool):
+    '''Write a ZPR_BOM_EXPLOSION report, MCTO reports have the quantity one column further'''
+    gap = '\t' if mcto else ''
+    lines = [
+        'Program :\t\tZPR_BOM_EXPLOSION\t\t\t\t\t\tMicron SemiAsiaOP Pte Ltd\t\t\t\t\tDate :\t\t01/11/2023',
+        'User    :\t\tSYNTHETIC\t\t\t\t\t\t\tBOM Explosion Report\t\t\t\tTime :\t\t14:30:12',
+        'Page    :\t\t1\t\t\t\t\t\t\t\t\t\t\tZone :\t\tUTC+8',
+        '',
+        '\t\t\t\t\t\t\tThis report is for Material:',
+        f"\t\t\t\t\t\t{material} SYNTHETIC BENCHMARK MATERIAL",
+        '',
+        '',
+        '\tMaterial\t\tMaterial Description',
+        f"\tObject no.\t\t{gap}Quantity\tUn\tMaterial Description\t\t\t\t\tReference Designator\tManufacturer Part No.\tMfg Name\t\tChange No.",
+        '',
+        f"\t{material}\t\tSYNTHETIC BENCHMARK MATERIAL",
+        f"\t550-500001\t\t{gap}{_quantity(1, mcto)}\tEA\tPWB, SYNTHETIC ARTWORK\t\t\t\t\t\tSYN-10-01-C\tGULTECH\t\t500025522337",
+    ]
+    for component, description, designators in rows:
+        designator_lines = _designator_lines(designators)
+        lines.append(f"\t{component}\t\t{gap}{_quantity(len(designators), mcto)}\tEA\t{description}\t\t\t\t\t{designator_lines[0]}\tMPN-{component}\tSYNTHETIC\t\t500025522337")
+        lines.extend('\t' * (11 if mcto else 10) + line for line in designator_lines[1:])
+    lines.append(f"\t542-500172\t\t{gap}{_quantity(1, mcto)}\tEA\tENC, BOT SYNTHETIC\t\t\t\t\tMECH1\tU3-01-B1-E\tKMH\t\t500025522337")
+    with open(file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def _quantity(quantity: int, mcto: bool):
+    return f"{quantity * 1000:>10,.3f}" if mcto else f"{quantity:>7.3f}"
+
+
+def _write_pp(file: str, program: str, machine: int, placed: list, circuits: int):
+    '''Write an AX-501 program: 5 sections of 4 robots, each part on its own feeder lane of one section'''
+    parts = sorted({(component, shape) for component, _, shape in placed})
+    feeders = {}
+    section_feeders = {}
+    for i, (component, shape) in enumerate(parts):
+        section = i % 5 + 1
+        number = section_feeders.get(section, 0) + 1
+        section_feeders[section] = number
+        feeders[component] = (section, number, shape)
+
+    lines = ['<?xml version="1.0"?>', f'<PlacementProgram xmlns="{PP_NS}">',
+             f'\t<General syntaxVersion="2.0" lastModified="2023-01-11T00:00:00Z" positionInLine="{machine}" machineModel="AX-501" operationMode="LOCAL" cycleTime="50000">',
+             '\t\t<Setting key="PPS_Product" value="Optimizer"/>', '\t</General>',
+             f'\t<Board id="{program}" length="269.737" width="220.917" thickness="1.250" cadOriginX="0.000" cadOriginY="0.000" handlingClass="HIGH">']
+    for component, designator, _ in placed:
+        for circuit in range(1, circuits + 1):
+            lines.append(f'\t\t<Component partNumber="{component}" refDes="{designator}" circuitNumber="{circuit}" x="0.000" y="0.000" z="0.000" rz="0.00"/>')
+    lines.extend(f'\t\t<Circuit number="{circuit}" type="{program}(C)" sizeX="133.600" sizeY="95.800" x="0.000" y="0.000" z="0.000" rz="0.00"/>' for circuit in range(1, circuits + 1))
+    lines.extend(['\t</Board>', '\t<Setup>'])
+    for section in range(1, 6):
+        lines.extend([f'\t\t<Section number="{section}">', '\t\t\t<Trolley type="A_SERIES_FDR_TROLLEY">'])
+        for component, (feeder_section, number, shape) in feeders.items():
+            if feeder_section == section:
+                lines.extend([f'\t\t\t\t<Feeder number="{number}" type="ITF2_08">',
+                              f'\t\t\t\t\t<Lane number="1" partNumber="{component}" shapeId="{shape}"/>', '\t\t\t\t</Feeder>'])
+        lines.append('\t\t\t</Trolley>')
+        lines.extend(f'\t\t\t<Robot number="{robot}" type="CPR"/>' for robot in range((section - 1) * 4 + 1, section * 4 + 1))
+        lines.append('\t\t</Section>')
+    lines.append('\t</Setup>')
+
+    # Picks of a section are dealt round robin to its 4 robots, Actions are written in robot order
+    robot_picks = {robot: [] for robot in range(1, 21)}
+    for i, (component, designator, _) in enumerate(placed):
+        section, number, _ = feeders[component]
+        for circuit in range(1, circuits + 1):
+            robot_picks[(section - 1) * 4 + (i + circuit) % 4 + 1].append((designator, circuit, number))
+    for robot, picks in robot_picks.items():
+        lines.extend([f'\t<Actions robotNumber="{robot}">', '\t\t<Index minBoardNumber="2" maxBoardNumber="2">'])
+        for designator, circuit, number in picks:
+            lines.extend([f'\t\t\t<Pick boardNumber="2" alignWith="AM_1" refDes="{designator}" circuitNumber="{circuit}" feederNumber="{number}" laneNumber="1">',
+                          f'\t\t\t\t<BadmarkReference refDes="B{circuit - 1}" circuitNumber="{circuit}"/>', '\t\t\t</Pick>',
+                          '\t\t\t<Align moduleId="NCLA"/>', '\t\t\t<Place/>'])
+        lines.extend(['\t\t</Index>', '\t</Actions>'])
+    lines.append('</PlacementProgram>')
+    with open(file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def _write_pp7(file: str, program: str, placed: list, circuits: int):
+    '''Write an iFlex program: trays for 529 parts in feed section 1, iFeeders for the rest in feed section 4, 1 robot with 2 heads'''
+    parts = sorted({(component, shape) for component, _, shape in placed})
+    feeders = {}
+    for component, shape in parts:
+        section = 1 if component.startswith('529') else 4
+        feeders[component] = (section, sum(1 for s, _, _ in feeders.values() if s == section) + 1, shape)
+
+    lines = [f'<PlacementProgram xmlns="{PP7_NS}">',
+             '\t<General syntaxVersion="1.1" lastModified="2023-01-11T00:00:00Z" positionInLine="1" dualLaneMode="SINGLE" cycleTime="3567"/>',
+             f'\t<Board id="{program}" length="269.737" width="220.917" thickness="1.250" handlingClass="HIGH">']
+    for component, designator, _ in placed:
+        for circuit in range(1, circuits + 1):
+            lines.append(f'\t\t<Component partNumber="{component}" refDes="{designator}" circuitNumber="{circuit}" x="0.000" y="0.000" z="0.000" rz="0.0"/>')
+    lines.extend(['\t</Board>', '\t<Segment number="1" type="H1">', '\t\t<Setup>'])
+    for section, section_type, feeder_type in ((1, 'A_Series_Tray_Trolley', 'A_Series_Tray_Pallet'), (4, 'iFlex_Feeder_Bank_H1', 'iFeeder_56')):
+        lines.append(f'\t\t\t<FeedSection number="{section}" type="{section_type}">')
+        for component, (feeder_section, slot, shape) in feeders.items():
+            if feeder_section == section:
+                lines.extend([f'\t\t\t\t<Feeder slotNumber="{slot}" type="{feeder_type}">',
+                              f'\t\t\t\t\t<FeederLane number="1" partNumber="{component}" shapeId="{shape}"/>', '\t\t\t\t</Feeder>'])
+        lines.append('\t\t\t</FeedSection>')
+    lines.extend(['\t\t</Setup>', '\t\t<Processing>', '\t\t\t<BoardLocation number="1" stopperPosition="160.000">'])
+    for i, (component, designator, _) in enumerate(placed):
+        section, slot, _ = feeders[component]
+        for circuit in range(1, circuits + 1):
+            lines.extend(['\t\t\t\t<Action>',
+                          f'\t\t\t\t\t<Pick refDes="{designator}" circuitNumber="{circuit}" feedSectionNumber="{section}" feederSlotNumber="{slot}" feederLaneNumber="1" robotNumber="1" headNumber="{(i + circuit) % 2 + 1}"/>',
+                          '\t\t\t\t</Action>'])
+    lines.extend(['\t\t\t</BoardLocation>', '\t\t</Processing>', '\t</Segment>', '</PlacementProgram>'])
+    with open(file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
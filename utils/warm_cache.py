@@ -0,0 +1,69 @@
+'''State kept in memory between the runs of watch mode: parsed programs, SAP report frames, the check manifest and the program catalog'''
+
+import os
+
+from utils.program_cache import MemoryProgramCache
+
+
+class WarmCache:
+    '''
+    Usage:
+    1) warm = WarmCache() once, then main(..., warm=warm) on every run of the watch loop
+    2) warm.frame(file, read, *args) returns read(*args), kept while file has the same size and mtime,
+       or warm.cached_frame(file) / warm.store_frame(file, df) when the files are read elsewhere, e.g. in a process pool
+    3) warm.program_cache(backing, log) returns the MemoryProgramCache of the first run, in front of its ProgramCache backing
+    4) warm.manifest is the CheckManifest of the first incremental run, warm.catalog the ProgramCatalog of the first run using one
+    5) warm.prune() forgets files that no longer exist
+
+    Frames are returned as stored, callers must not modify them in place
+    '''
+
+    def __init__(self):
+        self.frames = {}
+        self.programs = None
+        self.manifest = None
+        self.catalog = None
+        self.hits = 0
+        self.misses = 0
+        return
+
+
+    def frame(self, file, read, *args):
+        '''Return the frame read from file, read(*args) only if file is new or changed'''
+        found, df = self.cached_frame(file)
+        if not found:
+            df = self.store_frame(file, read(*args))
+        return df
+
+
+    def cached_frame(self, file):
+        '''Return (True, frame) if file is unchanged since its frame was stored, else (False, None)'''
+        stat = os.stat(file)
+        entry = self.frames.get(os.path.abspath(file))
+        if entry is not None and entry[0] == (stat.st_size, stat.st_mtime_ns):
+            self.hits += 1
+            return True, entry[1]
+
+        self.misses += 1
+        return False, None
+
+
+    def store_frame(self, file, df):
+        '''Store the frame read from file, return it'''
+        stat = os.stat(file)
+        self.frames[os.path.abspath(file)] = ((stat.st_size, stat.st_mtime_ns), df)
+        return df
+
+
+    def program_cache(self, backing, log=None):
+        '''Return the program cache kept across runs, backing (ProgramCache or None) and log are only used on the first call'''
+        if self.programs is None:
+            self.programs = MemoryProgramCache(backing, log)
+        return self.programs
+
+
+    def prune(self):
+        '''Forget frames and programs of files that no longer exist'''
+        self.frames = {key: entry for key, entry in self.frames.items() if os.path.exists(key)}
+        if self.programs is not None:
+            self.programs.prune()